@@ -1,13 +1,25 @@
 import streamlit as st
-import pandas as pd
-from sqlalchemy import create_engine
-import matplotlib.pyplot as plt
 import os
 from dotenv import load_dotenv
-import requests
+import contextlib
 import hashlib
-import os
-from snowflake.sqlalchemy import URL
+import uuid
+from approximate import Approximator, read_sample_fraction, relative_margin
+from chart_renderer import ChartRenderer
+from database import env_flag, fetch_with_ceiling, get_database_engine, pool_stats, query_columns, table_names
+from history_store import HistoryStore
+from llm_client import LLMClient, LLMError
+from paraphrase_cache import ParaphraseCache
+from query_cache import ResultCache, TranslationCache, WarehouseDataVersion, fingerprint, get_data_version
+from query_governor import QueryCancelled, QueryGovernor, QueryTimeout
+from query_jobs import CANCELLED, DONE, QUEUED, JobCancelled, JobExecutor, JobQueueFull, checkpoint, current_job
+from result_profile import matches as profile_matches, profile_frame
+from rollups import RollupRouter
+from schema_context import SchemaCatalog
+from sql_guard import count_probe_sql, guard_query, sql_dialect
+from sql_stream import SQLStreamExtractor, extract_sql
+from sql_templates import TemplateMatcher
+from visualizations import choose_chart, fetch_aggregates
 
 
 load_dotenv()
@@ -15,33 +27,227 @@ load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent"
+STREAM_API_URL = API_URL.replace(":generateContent", ":streamGenerateContent")
+# Stream the SQL as it is generated and run it as soon as the statement is complete
+LLM_STREAMING = env_flag("LLM_STREAMING")
+
+
+@st.cache_resource
+def get_llm_client():
+    
+    # Keep-alive session shared by every user, so questions skip the TLS handshake
+    return LLMClient(
+        connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "60")),
+        deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", "90")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+    )
 
+llm_client = get_llm_client()
 
 
-def get_database_engine():
+@st.cache_resource
+def get_translation_cache():
     
-    db_type = os.getenv('DATABASE_TYPE', 'sqlite').lower()
+    return TranslationCache(
+        max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "5000")),
+        ttl_seconds=int(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    )
 
-    if db_type == 'snowflake':
-        connection_url = URL(
-            account=os.getenv('SNOWFLAKE_ACCOUNT'),
-            user=os.getenv('SNOWFLAKE_USER'),
-            password=os.getenv('SNOWFLAKE_PASSWORD'),
-            database=os.getenv('SNOWFLAKE_DATABASE'),
-            schema=os.getenv('SNOWFLAKE_SCHEMA'),
-            warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
-            role=os.getenv('SNOWFLAKE_ROLE', 'ACCOUNTADMIN')
-        )
-        return create_engine(connection_url)
-    else:
+translation_cache = get_translation_cache()
+
+
+@st.cache_resource
+def get_paraphrase_cache():
+    
+    return ParaphraseCache(translation_cache, threshold=float(os.getenv("PARAPHRASE_THRESHOLD", "0.85")))
+
+# Questions worded differently from an earlier one reuse its SQL
+PARAPHRASE_CACHE = env_flag("PARAPHRASE_CACHE")
+paraphrase_cache = get_paraphrase_cache()
+
+
+@st.cache_resource
+def get_shared_engine():
+    
+    # One pooled engine per process, shared by every session and rerun
+    return get_database_engine()
+
+engine = get_shared_engine()
+
+
+@st.cache_resource
+def get_data_version_source():
+    
+    # Snowflake may be reloaded from any host, so its loader keeps the version in the warehouse
+    if os.getenv('DATABASE_TYPE', 'sqlite').lower() == 'snowflake':
+        return WarehouseDataVersion(engine, poll_seconds=float(os.getenv("DATA_VERSION_POLL_SECONDS", "30")))
+    return get_data_version
+
+# Caches and plan statistics are dropped whenever the loaders change this version
+data_version = get_data_version_source()
+
+
+@st.cache_resource
+def get_result_cache():
+    
+    return ResultCache(
+        namespace=os.getenv('DATABASE_TYPE', 'sqlite').lower(),
+        memory_budget_bytes=int(os.getenv("RESULT_CACHE_MEMORY_MB", "256")) * 1024 ** 2,
+        disk_budget_bytes=int(os.getenv("RESULT_CACHE_DISK_MB", "2048")) * 1024 ** 2,
+        data_version=data_version,
+    )
+
+result_cache = get_result_cache()
+
+# Streaming fetch: results arrive in batches and stop at a hard ceiling
+STREAM_RESULTS = env_flag("STREAM_RESULTS")
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "10000"))
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "500000"))
+RESULT_MAX_MB = int(os.getenv("RESULT_MAX_MB", "512"))
+
+# Row cap injected into non-aggregating queries unless the user asks to fetch all
+GUARD_DEFAULT_LIMIT = int(os.getenv("GUARD_DEFAULT_LIMIT", "1000"))
+SQL_DIALECT = sql_dialect(os.getenv('DATABASE_TYPE', 'sqlite').lower())
+SQL_DIALECT_LABELS = {'sqlite': 'SQLite', 'snowflake': 'Snowflake', 'duckdb': 'DuckDB'}
+
+
+@st.cache_resource
+def get_rollup_router():
+    
+    return RollupRouter(
+        SQL_DIALECT,
+        lambda: table_names(engine),
+        data_version,
+        describe=lambda sql: query_columns(engine, sql),
+    )
+
+# Aggregate queries are rewritten to read from the loaders' rollup tables
+ROLLUP_ROUTING = env_flag("ROLLUP_ROUTING")
+rollup_router = get_rollup_router()
+
+
+@st.cache_resource
+def get_approximator():
+    
+    return Approximator(
+        SQL_DIALECT,
+        lambda: read_sample_fraction(engine),
+        data_version,
+        describe=lambda sql: query_columns(engine, sql),
+    )
+
+# Analysts can opt in to answers from a sample of the table, with confidence intervals
+APPROX_QUERIES = env_flag("APPROX_QUERIES")
+approximator = get_approximator()
+
+class QueryRun:
+    # What one run_query call produced; answer_question copies it into the history entry
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.results = None
+        # Messages shown while it ran, kept with the history entry
+        self.notes = []
+        # Confidence intervals of an approximate answer
+        self.intervals = None
+        # Profile of the result, shared by chart selection and the builders
+        self.profile = None
+        # The row/byte ceiling cut the result short
+        self.truncated = False
+
+    def note(self, message):
         
-        return create_engine("sqlite:///aviation.db")
+        show('info', message)
+        self.notes.append(message)
+
+
+def show(kind, message, **options):
+    
+    # A background job has no page to draw on; it keeps the message for its status panel
+    job = current_job()
+    if job is None:
+        getattr(st, kind)(message, **options)
+    else:
+        job.log(kind, message)
+
+
+def step(message):
+    
+    job = current_job()
+    if job is None:
+        return st.spinner(message)
+    checkpoint()
+    job.set_progress(message)
+    return contextlib.nullcontext()
+
+
+@st.cache_resource
+def get_history_store():
+    
+    return HistoryStore(
+        session_budget_bytes=int(os.getenv("HISTORY_SESSION_MEMORY_MB", "64")) * 1024 ** 2,
+        process_budget_bytes=int(os.getenv("HISTORY_PROCESS_MEMORY_MB", "512")) * 1024 ** 2,
+        preview_rows=int(os.getenv("HISTORY_PREVIEW_ROWS", "50")),
+    )
 
-engine = get_database_engine()
+history_store = get_history_store()
+
+
+@st.cache_resource
+def get_chart_renderer():
+    
+    return ChartRenderer(
+        workers=int(os.getenv("CHART_RENDER_WORKERS", "2")),
+        cache_budget_bytes=int(os.getenv("CHART_CACHE_MB", "128")) * 1024 ** 2,
+    )
+
+chart_renderer = get_chart_renderer()
+CHART_RENDER_TIMEOUT = float(os.getenv("CHART_RENDER_TIMEOUT", "60"))
+CHART_PUSHDOWN = env_flag("CHART_PUSHDOWN")
+
+
+@st.cache_resource
+def get_job_executor():
+    
+    return JobExecutor(
+        workers=int(os.getenv("QUERY_JOB_WORKERS", "4")),
+        per_user=int(os.getenv("QUERY_JOBS_PER_USER", "2")),
+        max_queued=int(os.getenv("QUERY_JOB_QUEUE_MAX", "64")),
+        max_queued_per_user=int(os.getenv("QUERY_JOB_QUEUE_PER_USER", "8")),
+        policy=os.getenv("QUERY_JOB_POLICY", "fair").lower(),
+    )
+
+# Questions run as background jobs so a slow query never freezes the page
+BACKGROUND_JOBS = env_flag("BACKGROUND_JOBS")
+job_executor = get_job_executor()
+JOB_POLL_SECONDS = float(os.getenv("QUERY_JOB_POLL_SECONDS", "1"))
+
+
+@st.cache_resource
+def get_query_governor():
+    
+    return QueryGovernor(
+        engine,
+        SQL_DIALECT,
+        timeout_seconds=float(os.getenv("QUERY_TIMEOUT_SECONDS", "120")),
+        max_rows=int(os.getenv("PREFLIGHT_MAX_ROWS", "100000000")),
+        max_scan_bytes=int(os.getenv("PREFLIGHT_MAX_SCAN_MB", "10240")) * 1024 ** 2,
+        data_version=data_version,
+    )
+
+# Queries stop at a timeout, and plans with Cartesian joins or huge scans are refused (or flagged)
+query_governor = get_query_governor()
+PREFLIGHT_CHECKS = env_flag("PREFLIGHT_CHECKS")
+PREFLIGHT_REJECT = os.getenv("PREFLIGHT_ACTION", "reject").strip().lower() != "warn"
 
 
 if os.getenv('DATABASE_TYPE', 'sqlite').lower() == 'snowflake':
     db_info = f"❄️ Snowflake: {os.getenv('SNOWFLAKE_DATABASE')}.{os.getenv('SNOWFLAKE_SCHEMA')}"
+elif os.getenv('DATABASE_TYPE', 'sqlite').lower() == 'duckdb':
+    db_info = f"🦆 DuckDB (Local): {os.getenv('DUCKDB_PATH', 'aviation.duckdb')}"
 else:
     db_info = "💾 SQLite (Local)"
 
@@ -109,10 +315,44 @@ def login_page():
         st.info("💡 **Demo Credentials:**\n\n**Username:** admin | **Password:** admin123\n\n**Username:** analyst | **Password:** analyst123")
 
 
+@contextlib.contextmanager
+def governed():
+    
+    # Statements inside share the query timeout; cancelling the job interrupts them
+    with query_governor.limit() as budget:
+        job = current_job()
+        if job is not None:
+            job.on_cancel(budget.cancel)
+        yield budget
+
+
+def preflight_passes(run, sql):
+    
+    if not PREFLIGHT_CHECKS:
+        return True
+    plan = query_governor.preflight(sql)
+    if not plan.problems:
+        return True
+    if PREFLIGHT_REJECT:
+        run.note(f"🚧 Query not run: {' '.join(plan.problems)} Please rephrase the question.")
+        return False
+    run.note(f"⚠️ {' '.join(plan.problems)}")
+    return True
+
+
+def cancel_pending_jobs():
+    
+    for job_id in st.session_state.get('pending_jobs', []):
+        job_executor.cancel(job_id)
+    st.session_state.pending_jobs = []
+
+
 def logout():
    
     st.session_state.authenticated = False
     st.session_state.username = None
+    cancel_pending_jobs()
+    history_store.drop_session(st.session_state.session_id)
     st.session_state.conversation_history = []
     st.session_state.query_count = 0
     st.rerun()
@@ -125,6 +365,9 @@ if 'authenticated' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state.username = None
 
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 
 
 if not st.session_state.authenticated:
@@ -132,21 +375,61 @@ if not st.session_state.authenticated:
     st.stop()
 
 
-AVIATION_SCHEMA = (
-    "aviation_data table schema:\n"
-    "passenger_id (VARCHAR), first_name (VARCHAR), last_name (VARCHAR), "
-    "gender (VARCHAR), age (INTEGER), nationality (VARCHAR), airport_name (VARCHAR), "
-    "airport_country_code (VARCHAR), country_name (VARCHAR), airport_continent (VARCHAR), "
-    "continents (VARCHAR), departure_date (DATE), arrival_airport (VARCHAR), "
-    "pilot_name (VARCHAR), flight_status (VARCHAR)"
-)
+@st.cache_resource
+def get_schema_catalog():
+    
+    # Introspected once per data version, so prompts match the live column names
+    return SchemaCatalog(
+        engine, SQL_DIALECT, namespace=os.getenv('DATABASE_TYPE', 'sqlite').lower(), data_version=data_version
+    )
+
+schema_catalog = get_schema_catalog()
+
+try:
+    schema_signature = schema_catalog.signature()
+except Exception as e:
+    st.error(f"Could not read the aviation_data table: {e}")
+    st.stop()
+
+@st.cache_resource
+def get_template_matcher():
+    
+    return TemplateMatcher(SQL_DIALECT)
+
+# Common question shapes are answered from templates without calling Gemini
+SQL_TEMPLATES = env_flag("SQL_TEMPLATES")
+template_matcher = get_template_matcher()
+
+# Translations are only reusable for the same schema, model and SQL dialect
+TRANSLATION_CONTEXT = fingerprint(schema_signature, API_URL, SQL_DIALECT)
 
 
 def generate_sql(nl_query):
    
+    if SQL_TEMPLATES:
+        template = template_matcher.match(nl_query, schema_catalog.profile())
+        if template:
+            show('caption', f"⚡ SQL built from the \"{template.template}\" template (no LLM call)")
+            return template.sql, 'template'
+
+    cached_sql = translation_cache.get(nl_query, TRANSLATION_CONTEXT)
+    if cached_sql:
+        show('caption', "⚡ SQL served from translation cache")
+        return cached_sql, 'cache'
+
+    if PARAPHRASE_CACHE:
+        paraphrase = paraphrase_cache.lookup(nl_query, TRANSLATION_CONTEXT)
+        if paraphrase:
+            show(
+                'caption',
+                f"⚡ SQL reused from the similar question \"{paraphrase.question}\" "
+                f"(similarity {paraphrase.score:.2f})"
+            )
+            return paraphrase.sql, 'paraphrase'
+
     prompt = (
-        f"{AVIATION_SCHEMA}\n\n"
-        "Translate this natural language query into a SQLite-compatible SELECT SQL query for the aviation_data table only. "
+        f"{schema_catalog.context(nl_query)}\n\n"
+        f"Translate this natural language query into a {SQL_DIALECT_LABELS.get(SQL_DIALECT, 'SQLite')}-compatible SELECT SQL query for the aviation_data table only. "
         "IMPORTANT: You MUST enclose column names with spaces (e.g., \"Passenger ID\") in double quotes. "
         f"Natural Language Query: {nl_query}"
     )
@@ -169,489 +452,310 @@ def generate_sql(nl_query):
         ]
     }
    
-    response = requests.post(API_URL, headers=headers, params=params, json=data)
-    result = response.json()
-    st.code(f"Full Gemini API response:\n{result}", language="json")
-
+    if LLM_STREAMING:
+        try:
+            sql = stream_sql(headers, params, data)
+        except LLMError as e:
+            show('error', f"Gemini API error: {e}")
+            return "", None
+    else:
+        try:
+            result = llm_client.post_json(API_URL, headers=headers, params=params, json=data)
+        except LLMError as e:
+            show('error', f"Gemini API error: {e}")
+            return "", None
+        show('code', f"Full Gemini API response:\n{result}", language="json")
 
-    sql = ""
-    try:
-       
-        generated_text = result['candidates'][0]['content']['parts'][0]['text'].strip()
-       
-   
-        if generated_text.startswith("```"):
-           
-            sql = generated_text.rstrip('`').strip()
-           
-            first_newline_index = sql.find('\n')
+        sql = ""
+        try:
            
-            if first_newline_index != -1:
-                sql = sql[first_newline_index + 1:].strip()
-            else:
+            generated_text = result['candidates'][0]['content']['parts'][0]['text'].strip()
+            sql = extract_sql(generated_text)
+               
+        except Exception as e:
+            show('error', f"Error parsing Gemini response: {e}. Check the response structure.")
+            sql = ""
+       
+    return sql, 'llm'
 
 
-                parts = sql.split(' ', 1)
-                if len(parts) > 1:
-                    sql = parts[1].strip()
-                else:
-                    sql = ""
+
+
+def stream_sql(headers, params, data):
+    
+    # Show the SQL as it streams in; stop reading once the statement is complete
+    extractor = SQLStreamExtractor()
+    job = current_job()
+    preview = st.empty() if job is None else None
+    events = llm_client.stream_events(STREAM_API_URL, headers=headers, params={**params, "alt": "sse"}, json=data)
+    try:
+        for event in events:
+            for candidate in event.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    extractor.feed(part.get('text', ''))
+            if extractor.sql and preview is not None:
+                preview.code(extractor.sql, language="sql")
+            elif extractor.sql:
+                job.set_progress(f"✍️ Writing SQL: {extractor.sql}")
+            if extractor.complete:
+                break
+    finally:
+        events.close()
+    return extractor.finish()
+
+
+def run_query(sql, fetch_all=False, approximate=False):
+    import pandas as pd
+
+    guard = guard_query(sql, SQL_DIALECT, None if fetch_all else GUARD_DEFAULT_LIMIT)
+    run = QueryRun(guard.sql)
+    if guard.error:
+        show('warning', f"{guard.error} Please ask a question that retrieves data.")
+        return run
+    sql = guard.sql
+    if guard.limited:
+        show('caption', f"🛡️ Added LIMIT {guard.limit:,} (use \"Fetch all rows\" for the full result)")
+    approximation = approximator.rewrite(sql) if approximate else None
+    # Approximate results are cached under their own SQL, apart from the exact ones
+    cache_key = approximation.sql if approximation else sql
+    cached_results = result_cache.get(cache_key)
+    if cached_results is not None:
+        show('caption', "⚡ Results served from result cache")
+        present_results(run, approximation, cached_results, result_cache.get_profile(cache_key))
+        return run
+    if approximation:
+        run.sql = approximation.sql
+    elif ROLLUP_ROUTING:
+        run.sql, rollup = rollup_router.route(sql)
+        if rollup:
+            show('caption', f"🧮 Answered from rollup table {rollup}")
+    try:
+        with governed():
+            if not preflight_passes(run, run.sql):
+                return run
+            if not STREAM_RESULTS:
+                results = pd.read_sql(run.sql, engine)
+            else:
+                results, run.truncated = fetch_streaming(run.sql)
+   
+        present_results(run, approximation, results)
+        if run.truncated:
+            run.note(
+                f"⚠️ Result stopped at {len(results):,} rows to stay under the "
+                f"{RESULT_MAX_ROWS:,}-row / {RESULT_MAX_MB:,} MB ceiling."
+            )
         else:
-            sql = generated_text
-       
-           
+            result_cache.put(cache_key, results, profile=run.profile)
+        if not approximation:
+            report_result_size(run, guard)
+        return run
+    except (JobCancelled, QueryCancelled):
+        raise
+    except QueryTimeout as e:
+        run.note(f"⏱️ {e} Try a narrower question.")
+        return run
     except Exception as e:
-        st.error(f"Error parsing Gemini response: {e}. Check the response structure.")
-        sql = ""
-       
-    return sql
+        show('error', f"SQL Execution Error: {e}")
+        show('error', f"Failed query: {sql}")
+        run.results = None
+        return run
 
 
+def present_results(run, approximation, results, profile=None):
+    
+    # Profile what is shown (estimates, not the helper columns) once; it is cached with the result
+    if approximation:
+        results = approximate_results(run, approximation, results)
+    if not profile_matches(profile, results):
+        profile = profile_frame(results)
+    run.results = results
+    run.profile = profile
 
 
-def run_query(sql):
-    if not sql.lower().strip().startswith("select"):
-        st.warning("Generated query is not a SELECT statement. Please ask a question that retrieves data.")
-        return None
+def approximate_results(run, approximation, results):
+    
+    # Estimates go on to the table and chart; their intervals are kept with the history entry
+    results, run.intervals = approximation.split(results)
+    run.note(
+        f"≈ Approximate answer from {approximation.describe()}: estimates are within "
+        f"±{relative_margin(run.intervals):.1%} at 95% confidence. Use \"Get exact answer\" for exact figures."
+    )
+    return results
+
+
+def report_result_size(run, guard):
+    
+    # A result that filled the injected LIMIT is probably larger: probe its true size
+    if not guard.limited or len(run.results) < guard.limit:
+        return
+    import pandas as pd
+
     try:
-   
-        return pd.read_sql(sql, engine)
-    except Exception as e:
-        st.error(f"SQL Execution Error: {e}")
-        st.error(f"Failed query: {sql}")
-        return None
+        with governed():
+            total_rows = pd.read_sql(count_probe_sql(guard.original_sql, SQL_DIALECT), engine).iloc[0, 0]
+    except Exception:
+        run.note(f"ℹ️ Showing the first {guard.limit:,} rows; the full result is larger.")
+        return
+    if total_rows > guard.limit:
+        run.note(
+            f"ℹ️ Showing the first {guard.limit:,} of {int(total_rows):,} rows. "
+            "Tick \"Fetch all rows\" and ask again to retrieve everything."
+        )
+
 
+def fetch_streaming(sql):
+    
+    # Show the first page as soon as it arrives, then keep a running row count
+    job = current_job()
+    if job is not None:
+        def on_batch(batch, rows_so_far):
+            checkpoint()
+            job.set_progress(f"📥 Fetched {rows_so_far:,} rows...")
+
+        return fetch_with_ceiling(
+            engine, sql, RESULT_MAX_ROWS, RESULT_MAX_MB * 1024 ** 2,
+            batch_rows=STREAM_BATCH_ROWS, on_batch=on_batch,
+        )
+
+    first_page = st.empty()
+    progress = st.empty()
+
+    def on_batch(batch, rows_so_far):
+        if rows_so_far == len(batch):
+            first_page.dataframe(batch.head(100), use_container_width=True)
+        progress.caption(f"📥 Fetched {rows_so_far:,} rows...")
+
+    try:
+        return fetch_with_ceiling(
+            engine, sql, RESULT_MAX_ROWS, RESULT_MAX_MB * 1024 ** 2,
+            batch_rows=STREAM_BATCH_ROWS, on_batch=on_batch,
+        )
+    finally:
+        first_page.empty()
+        progress.empty()
 
-def create_smart_visualizations(results, query):
 
-    import numpy as np
-    from matplotlib import pyplot as plt
-    import seaborn as sns
+def new_entry(user_query):
     
+    return {
+        'user_query': user_query,
+        'sql': '',
+        'result_id': None,
+        'row_count': 0,
+        'columns': [],
+        'preview': None,
+        'chart_key': None,
+        'chart_png': None,
+        'chart_error': None,
+        'notes': [],
+        'intervals': None,
+        'error': None
+    }
+
 
-    sns.set_style("whitegrid")
-    plt.rcParams['figure.facecolor'] = 'white'
+def answer_question(session_id, user_query, sql=None, fetch_all=False, approximate=False):
     
-    numeric_cols = results.select_dtypes(include=['number']).columns.tolist()
-    categorical_cols = results.select_dtypes(exclude=['number']).columns.tolist()
-    date_cols = [col for col in results.columns if 'date' in col.lower() or 'time' in col.lower()]
+    # Question -> SQL -> result -> chart; runs inline or as a background job and returns the history entry
+    conversation_entry = new_entry(user_query)
     
-    num_rows = len(results)
+    # Generate SQL
+    origin = None
+    if not sql:
+        with step("🤔 Thinking and generating SQL..."):
+            sql, origin = generate_sql(user_query)
+    conversation_entry['sql'] = sql
     
-    # Case 1: Single numeric column 
-    if len(numeric_cols) == 1 and len(categorical_cols) == 0:
-        return create_single_numeric_viz(results, numeric_cols[0])
+    if not sql:
+        conversation_entry['error'] = "No SQL generated or extraction failed."
+        return conversation_entry
+    
+    # Run query
+    with step("🔍 Executing query..."):
+        run = run_query(sql, fetch_all=fetch_all, approximate=approximate)
+    results = run.results
+    conversation_entry['notes'] = run.notes
+    conversation_entry['intervals'] = run.intervals
+    
+    if results is None or results.empty:
+        # A cached translation that no longer answers is dropped, so the next ask regenerates it
+        if origin == 'cache':
+            translation_cache.invalidate(user_query, TRANSLATION_CONTEXT)
+        conversation_entry['error'] = "No results returned or query could not be executed."
+        return conversation_entry
+    # Only SQL that ran and returned rows is remembered for the question
+    if origin in ('paraphrase', 'llm'):
+        translation_cache.put(user_query, TRANSLATION_CONTEXT, sql)
+    
+    # Keep only metadata and a preview in the session; the full frame is spilled
+    result_id, preview = history_store.save(session_id, results)
+    conversation_entry.update(
+        result_id=result_id,
+        row_count=len(results),
+        columns=list(results.columns),
+        preview=preview,
+    )
     
-    # Case 2: Multiple numeric columns only (Correlation, distribution)
-    if len(numeric_cols) >= 2 and len(categorical_cols) == 0:
-        return create_multi_numeric_viz(results, numeric_cols)
+    # Render visualizations off-thread; the chart fills in once ready
+    chart_type, chart_args = choose_chart(results, run.profile)
+    if chart_type:
+        # A result the ceiling cut short is grouped on the database over the same (guarded, routed) query
+        aggregates = None
+        # Approximate answers are already small aggregates; pushdown would scan exactly
+        if CHART_PUSHDOWN and run.truncated and run.intervals is None:
+            with step("📊 Aggregating for charts..."), governed():
+                aggregates = fetch_aggregates(
+                    engine, run.sql, chart_type, chart_args, SQL_DIALECT, cache=result_cache
+                )
+        conversation_entry['chart_key'] = chart_renderer.submit(results, chart_type, chart_args, aggregates, run.profile)
+    return conversation_entry
+
+
+def finished_entry(job):
+    
+    if job.status == DONE:
+        return job.result
+    conversation_entry = new_entry(job.label)
+    if job.status == CANCELLED:
+        conversation_entry['error'] = "Cancelled before it finished."
+    else:
+        conversation_entry['error'] = f"The query failed: {job.error}"
+    return conversation_entry
+
+
+def show_chart(chart_placeholder, entry):
     
-    # Case 3: One categorical + one numeric (Classic comparison)
-    if len(categorical_cols) >= 1 and len(numeric_cols) >= 1:
-        cat_col = categorical_cols[0]
-        num_col = numeric_cols[0]
-        n_unique = results[cat_col].nunique()
-        
-        # Sub-case: Time series data
-        if cat_col in date_cols or 'date' in cat_col.lower():
-            return create_time_series_viz(results, cat_col, num_col)
-        
-        # Sub-case: Few categories (2-20)
-        if 2 <= n_unique <= 20:
-            return create_categorical_comparison_viz(results, cat_col, num_col, n_unique)
-        
-        # Sub-case: Many categories (>20)
-        if n_unique > 20:
-            return create_top_n_viz(results, cat_col, num_col, top_n=15)
-    
-    # Case 4: Multiple categorical columns (Cross-tabulation)
-    if len(categorical_cols) >= 2:
-        return create_cross_tab_viz(results, categorical_cols[:2])
-    
-    # Case 5: Large dataset overview (Sample visualization)
-    if num_rows > 100:
-        return create_large_dataset_viz(results, numeric_cols, categorical_cols)
-    
-    # Default: Simple table representation
-    return None
-
-
-def create_single_numeric_viz(results, col_name):
-    """Visualize single numeric column with histogram and box plot"""
-    fig, axs = plt.subplots(1, 3, figsize=(16, 5))
-    
-    data = results[col_name].dropna()
-    
-    # Histogram
-    axs[0].hist(data, bins=30, color='#2E86AB', alpha=0.7, edgecolor='black')
-    axs[0].set_title(f'Distribution of {col_name}', fontsize=12, fontweight='bold')
-    axs[0].set_xlabel(col_name)
-    axs[0].set_ylabel('Frequency')
-    axs[0].grid(alpha=0.3)
-    
-    # Box plot
-    axs[1].boxplot(data, vert=True)
-    axs[1].set_title(f'Box Plot of {col_name}', fontsize=12, fontweight='bold')
-    axs[1].set_ylabel(col_name)
-    axs[1].grid(alpha=0.3)
-    
-    # Statistics
-    axs[2].axis('off')
-    stats_text = f"""
-    📊 Summary Statistics
-    
-    Count: {len(data):,}
-    Mean: {data.mean():.2f}
-    Median: {data.median():.2f}
-    Std Dev: {data.std():.2f}
-    Min: {data.min():.2f}
-    Max: {data.max():.2f}
-    """
-    axs[2].text(0.1, 0.5, stats_text, fontsize=11, verticalalignment='center',
-                bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.3))
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_multi_numeric_viz(results, numeric_cols):
-    """Visualize multiple numeric columns with correlation and scatter plots"""
-    n_cols = min(len(numeric_cols), 4)  # Limit to 4 columns for clarity
-    selected_cols = numeric_cols[:n_cols]
-    
-    fig = plt.figure(figsize=(16, 10))
-    
-    # Correlation heatmap
-    ax1 = plt.subplot(2, 2, 1)
-    corr_matrix = results[selected_cols].corr()
-    im = ax1.imshow(corr_matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
-    ax1.set_xticks(range(len(selected_cols)))
-    ax1.set_yticks(range(len(selected_cols)))
-    ax1.set_xticklabels(selected_cols, rotation=45, ha='right')
-    ax1.set_yticklabels(selected_cols)
-    ax1.set_title('Correlation Matrix', fontsize=12, fontweight='bold')
-    plt.colorbar(im, ax=ax1)
-    
-    # Add correlation values
-    for i in range(len(selected_cols)):
-        for j in range(len(selected_cols)):
-            ax1.text(j, i, f'{corr_matrix.iloc[i, j]:.2f}',
-                    ha='center', va='center', color='white' if abs(corr_matrix.iloc[i, j]) > 0.5 else 'black')
-    
-    # Scatter plot (first two numeric columns)
-    if len(selected_cols) >= 2:
-        ax2 = plt.subplot(2, 2, 2)
-        ax2.scatter(results[selected_cols[0]], results[selected_cols[1]], 
-                   alpha=0.6, c='#A23B72', edgecolors='black', linewidth=0.5)
-        ax2.set_xlabel(selected_cols[0])
-        ax2.set_ylabel(selected_cols[1])
-        ax2.set_title(f'{selected_cols[1]} vs {selected_cols[0]}', fontsize=12, fontweight='bold')
-        ax2.grid(alpha=0.3)
-    
-    # Distribution comparison
-    ax3 = plt.subplot(2, 2, 3)
-    for col in selected_cols[:3]:  # Limit to 3 for readability
-        ax3.hist(results[col].dropna(), bins=20, alpha=0.5, label=col)
-    ax3.set_title('Distribution Comparison', fontsize=12, fontweight='bold')
-    ax3.set_xlabel('Value')
-    ax3.set_ylabel('Frequency')
-    ax3.legend()
-    ax3.grid(alpha=0.3)
-    
-    # Box plots comparison
-    ax4 = plt.subplot(2, 2, 4)
-    ax4.boxplot([results[col].dropna() for col in selected_cols], labels=selected_cols)
-    ax4.set_title('Box Plot Comparison', fontsize=12, fontweight='bold')
-    ax4.set_ylabel('Value')
-    ax4.tick_params(axis='x', rotation=45)
-    ax4.grid(alpha=0.3)
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_time_series_viz(results, date_col, value_col):
-    """Create time series visualizations"""
-    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
-    
-    # Sort by date
-    df_sorted = results.sort_values(date_col)
-    
-    # Line chart
-    axs[0, 0].plot(df_sorted[date_col], df_sorted[value_col], marker='o', linewidth=2, markersize=4, color='#2E86AB')
-    axs[0, 0].set_title(f'{value_col} Over Time', fontsize=12, fontweight='bold')
-    axs[0, 0].set_xlabel(date_col)
-    axs[0, 0].set_ylabel(value_col)
-    axs[0, 0].tick_params(axis='x', rotation=45)
-    axs[0, 0].grid(alpha=0.3)
-    
-    # Area chart
-    axs[0, 1].fill_between(range(len(df_sorted)), df_sorted[value_col], alpha=0.6, color='#A23B72')
-    axs[0, 1].plot(df_sorted[value_col], linewidth=2, color='#6C1D45')
-    axs[0, 1].set_title(f'{value_col} Trend (Area)', fontsize=12, fontweight='bold')
-    axs[0, 1].set_xlabel('Observation')
-    axs[0, 1].set_ylabel(value_col)
-    axs[0, 1].grid(alpha=0.3)
-    
-    # Moving average (if enough data points)
-    if len(df_sorted) >= 5:
-        window = min(5, len(df_sorted) // 3)
-        moving_avg = df_sorted[value_col].rolling(window=window).mean()
-        axs[1, 0].plot(df_sorted[value_col], alpha=0.5, label='Actual', color='lightblue')
-        axs[1, 0].plot(moving_avg, linewidth=2, label=f'{window}-period MA', color='red')
-        axs[1, 0].set_title(f'{value_col} with Moving Average', fontsize=12, fontweight='bold')
-        axs[1, 0].set_xlabel('Observation')
-        axs[1, 0].set_ylabel(value_col)
-        axs[1, 0].legend()
-        axs[1, 0].grid(alpha=0.3)
-    
-    # Cumulative sum
-    cumsum = df_sorted[value_col].cumsum()
-    axs[1, 1].plot(cumsum, linewidth=2, color='#F18F01')
-    axs[1, 1].set_title(f'Cumulative {value_col}', fontsize=12, fontweight='bold')
-    axs[1, 1].set_xlabel('Observation')
-    axs[1, 1].set_ylabel(f'Cumulative {value_col}')
-    axs[1, 1].grid(alpha=0.3)
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_categorical_comparison_viz(results, cat_col, num_col, n_unique):
-    """Create comprehensive visualizations for categorical vs numeric data"""
-    # Aggregate data
-    agg_data = results.groupby(cat_col)[num_col].agg(['sum', 'mean', 'count']).reset_index()
-    agg_data = agg_data.sort_values('sum', ascending=False)
-    
-    # Decide number of charts based on categories
-    if n_unique <= 6:
-        fig, axs = plt.subplots(2, 3, figsize=(18, 10))
-        axs = axs.flatten()
+    # The chart of a finished render, or why there is none
+    entry['chart_png'] = chart_renderer.result(entry['chart_key'])
+    entry['chart_error'] = None if entry['chart_png'] else chart_renderer.error(entry['chart_key'])
+    if entry['chart_png']:
+        chart_placeholder.image(entry['chart_png'], use_container_width=True)
+    elif entry['chart_error']:
+        chart_placeholder.warning(f"📊 Chart unavailable: {entry['chart_error']}")
     else:
-        fig, axs = plt.subplots(2, 2, figsize=(16, 10))
-        axs = axs.flatten()
-    
-    chart_idx = 0
-    
-    # 1. Bar chart (Sum)
-    axs[chart_idx].bar(agg_data[cat_col], agg_data['sum'], color='#4C72B0', edgecolor='black')
-    axs[chart_idx].set_title(f'Total {num_col} by {cat_col}', fontsize=12, fontweight='bold')
-    axs[chart_idx].set_xlabel(cat_col)
-    axs[chart_idx].set_ylabel(f'Total {num_col}')
-    axs[chart_idx].tick_params(axis='x', rotation=45)
-    axs[chart_idx].grid(alpha=0.3, axis='y')
-    chart_idx += 1
-    
-    # 2. Horizontal bar chart (for better readability with many categories)
-    axs[chart_idx].barh(agg_data[cat_col], agg_data['sum'], color='#55A630', edgecolor='black')
-    axs[chart_idx].set_title(f'Total {num_col} by {cat_col} (Horizontal)', fontsize=12, fontweight='bold')
-    axs[chart_idx].set_xlabel(f'Total {num_col}')
-    axs[chart_idx].set_ylabel(cat_col)
-    axs[chart_idx].grid(alpha=0.3, axis='x')
-    chart_idx += 1
-    
-    # 3. Pie chart (only if reasonable number of categories)
-    if n_unique <= 8:
-        colors = plt.cm.Set3(range(len(agg_data)))
-        axs[chart_idx].pie(agg_data['sum'], labels=agg_data[cat_col], autopct='%1.1f%%', 
-                          startangle=90, colors=colors)
-        axs[chart_idx].set_title(f'{num_col} Distribution by {cat_col}', fontsize=12, fontweight='bold')
-        chart_idx += 1
-    
-    # 4. Average comparison
-    axs[chart_idx].bar(agg_data[cat_col], agg_data['mean'], color='#F77F00', edgecolor='black')
-    axs[chart_idx].set_title(f'Average {num_col} by {cat_col}', fontsize=12, fontweight='bold')
-    axs[chart_idx].set_xlabel(cat_col)
-    axs[chart_idx].set_ylabel(f'Average {num_col}')
-    axs[chart_idx].tick_params(axis='x', rotation=45)
-    axs[chart_idx].axhline(agg_data['mean'].mean(), color='red', linestyle='--', label='Overall Mean')
-    axs[chart_idx].legend()
-    axs[chart_idx].grid(alpha=0.3, axis='y')
-    chart_idx += 1
-    
-    # 5. Count bar chart
-    if chart_idx < len(axs):
-        axs[chart_idx].bar(agg_data[cat_col], agg_data['count'], color='#C9184A', edgecolor='black')
-        axs[chart_idx].set_title(f'Count by {cat_col}', fontsize=12, fontweight='bold')
-        axs[chart_idx].set_xlabel(cat_col)
-        axs[chart_idx].set_ylabel('Count')
-        axs[chart_idx].tick_params(axis='x', rotation=45)
-        axs[chart_idx].grid(alpha=0.3, axis='y')
-        chart_idx += 1
-    
-    # 6. Line chart (showing trend)
-    if chart_idx < len(axs):
-        axs[chart_idx].plot(agg_data[cat_col], agg_data['sum'], marker='o', linewidth=2, 
-                           markersize=8, color='#9D4EDD')
-        axs[chart_idx].set_title(f'{num_col} Trend by {cat_col}', fontsize=12, fontweight='bold')
-        axs[chart_idx].set_xlabel(cat_col)
-        axs[chart_idx].set_ylabel(f'Total {num_col}')
-        axs[chart_idx].tick_params(axis='x', rotation=45)
-        axs[chart_idx].grid(alpha=0.3)
-        chart_idx += 1
-    
-    # Hide unused subplots
-    for idx in range(chart_idx, len(axs)):
-        axs[idx].axis('off')
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_top_n_viz(results, cat_col, num_col, top_n=15):
-    """Create visualizations for categories with many unique values (show top N)"""
-    agg_data = results.groupby(cat_col)[num_col].sum().reset_index()
-    agg_data = agg_data.sort_values(num_col, ascending=False).head(top_n)
-    
-    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
-    
-    # 1. Bar chart (Top N)
-    axs[0, 0].bar(range(len(agg_data)), agg_data[num_col], color='#4C72B0', edgecolor='black')
-    axs[0, 0].set_title(f'Top {top_n} {cat_col} by {num_col}', fontsize=12, fontweight='bold')
-    axs[0, 0].set_xlabel(cat_col)
-    axs[0, 0].set_ylabel(num_col)
-    axs[0, 0].set_xticks(range(len(agg_data)))
-    axs[0, 0].set_xticklabels(agg_data[cat_col], rotation=45, ha='right')
-    axs[0, 0].grid(alpha=0.3, axis='y')
-    
-    # 2. Horizontal bar chart
-    axs[0, 1].barh(agg_data[cat_col], agg_data[num_col], color='#55A630', edgecolor='black')
-    axs[0, 1].set_title(f'Top {top_n} {cat_col} (Horizontal)', fontsize=12, fontweight='bold')
-    axs[0, 1].set_xlabel(num_col)
-    axs[0, 1].set_ylabel(cat_col)
-    axs[0, 1].invert_yaxis()
-    axs[0, 1].grid(alpha=0.3, axis='x')
-    
-    # 3. Pareto chart (cumulative percentage)
-    cumsum = agg_data[num_col].cumsum()
-    cumsum_pct = cumsum / agg_data[num_col].sum() * 100
-    
-    ax3 = axs[1, 0]
-    ax3_twin = ax3.twinx()
-    
-    ax3.bar(range(len(agg_data)), agg_data[num_col], color='#F77F00', alpha=0.7, edgecolor='black')
-    ax3_twin.plot(range(len(agg_data)), cumsum_pct, color='red', marker='D', linewidth=2, markersize=6)
-    ax3_twin.axhline(80, color='green', linestyle='--', label='80%')
-    
-    ax3.set_xlabel(cat_col)
-    ax3.set_ylabel(num_col, color='#F77F00')
-    ax3_twin.set_ylabel('Cumulative %', color='red')
-    ax3.set_title(f'Pareto Chart: Top {top_n} {cat_col}', fontsize=12, fontweight='bold')
-    ax3.set_xticks(range(len(agg_data)))
-    ax3.set_xticklabels(agg_data[cat_col], rotation=45, ha='right')
-    ax3_twin.legend(loc='center right')
-    ax3.grid(alpha=0.3, axis='y')
-    
-    # 4. Comparison with "Others"
-    top_sum = agg_data[num_col].sum()
-    total_sum = results.groupby(cat_col)[num_col].sum().sum()
-    others_sum = total_sum - top_sum
-    
-    labels = [f'Top {top_n}', 'Others']
-    sizes = [top_sum, others_sum]
-    colors = ['#4C72B0', '#CCCCCC']
-    
-    axs[1, 1].pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors)
-    axs[1, 1].set_title(f'Top {top_n} vs Others', fontsize=12, fontweight='bold')
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_cross_tab_viz(results, cat_cols):
-    """Create cross-tabulation visualization for two categorical columns"""
-    cat1, cat2 = cat_cols[0], cat_cols[1]
-    
-    # Limit categories for visualization
-    top_cat1 = results[cat1].value_counts().head(10).index
-    top_cat2 = results[cat2].value_counts().head(10).index
-    
-    filtered_results = results[results[cat1].isin(top_cat1) & results[cat2].isin(top_cat2)]
-    
-    crosstab = pd.crosstab(filtered_results[cat1], filtered_results[cat2])
-    
-    fig, axs = plt.subplots(1, 2, figsize=(16, 6))
-    
-    # Heatmap
-    im = axs[0].imshow(crosstab.values, cmap='YlOrRd', aspect='auto')
-    axs[0].set_xticks(range(len(crosstab.columns)))
-    axs[0].set_yticks(range(len(crosstab.index)))
-    axs[0].set_xticklabels(crosstab.columns, rotation=45, ha='right')
-    axs[0].set_yticklabels(crosstab.index)
-    axs[0].set_title(f'Cross-tabulation: {cat1} vs {cat2}', fontsize=12, fontweight='bold')
-    plt.colorbar(im, ax=axs[0])
-    
-    # Stacked bar chart
-    crosstab.plot(kind='bar', stacked=True, ax=axs[1], colormap='Set3', edgecolor='black')
-    axs[1].set_title(f'{cat1} by {cat2} (Stacked)', fontsize=12, fontweight='bold')
-    axs[1].set_xlabel(cat1)
-    axs[1].set_ylabel('Count')
-    axs[1].tick_params(axis='x', rotation=45)
-    axs[1].legend(title=cat2, bbox_to_anchor=(1.05, 1), loc='upper left')
-    axs[1].grid(alpha=0.3, axis='y')
-    
-    plt.tight_layout()
-    return fig
-
-
-def create_large_dataset_viz(results, numeric_cols, categorical_cols):
-    """Create overview visualizations for large datasets"""
-    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
-    
-    # Sample data for visualization
-    sample_size = min(1000, len(results))
-    sample_data = results.sample(sample_size)
-    
-    # 1. Data overview
-    axs[0, 0].axis('off')
-    overview_text = f"""
-    📊 Dataset Overview
-    
-    Total Rows: {len(results):,}
-    Total Columns: {len(results.columns)}
-    Numeric Columns: {len(numeric_cols)}
-    Categorical Columns: {len(categorical_cols)}
-    
-    Sample Size: {sample_size:,} rows
-    """
-    axs[0, 0].text(0.1, 0.5, overview_text, fontsize=12, verticalalignment='center',
-                  bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.5))
-    
-    # 2. Numeric columns distribution (if available)
-    if numeric_cols:
-        col = numeric_cols[0]
-        axs[0, 1].hist(sample_data[col].dropna(), bins=30, color='#4C72B0', alpha=0.7, edgecolor='black')
-        axs[0, 1].set_title(f'Distribution of {col} (Sample)', fontsize=12, fontweight='bold')
-        axs[0, 1].set_xlabel(col)
-        axs[0, 1].set_ylabel('Frequency')
-        axs[0, 1].grid(alpha=0.3)
-    
-    # 3. Categorical distribution (if available)
-    if categorical_cols:
-        col = categorical_cols[0]
-        top_categories = sample_data[col].value_counts().head(15)
-        axs[1, 0].barh(range(len(top_categories)), top_categories.values, color='#55A630', edgecolor='black')
-        axs[1, 0].set_yticks(range(len(top_categories)))
-        axs[1, 0].set_yticklabels(top_categories.index)
-        axs[1, 0].set_title(f'Top Categories in {col} (Sample)', fontsize=12, fontweight='bold')
-        axs[1, 0].set_xlabel('Count')
-        axs[1, 0].invert_yaxis()
-        axs[1, 0].grid(alpha=0.3, axis='x')
-    
-    # 4. Multi-column correlation (if multiple numeric columns)
-    if len(numeric_cols) >= 2:
-        cols_to_plot = numeric_cols[:min(5, len(numeric_cols))]
-        corr_matrix = sample_data[cols_to_plot].corr()
-        im = axs[1, 1].imshow(corr_matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
-        axs[1, 1].set_xticks(range(len(cols_to_plot)))
-        axs[1, 1].set_yticks(range(len(cols_to_plot)))
-        axs[1, 1].set_xticklabels(cols_to_plot, rotation=45, ha='right')
-        axs[1, 1].set_yticklabels(cols_to_plot)
-        axs[1, 1].set_title('Correlation Matrix (Sample)', fontsize=12, fontweight='bold')
-        plt.colorbar(im, ax=axs[1, 1])
-    
-    plt.tight_layout()
-    return fig
+        chart_placeholder.empty()
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def pending_jobs_panel():
+    
+    # Polls on its own; once a job finishes the whole page reruns and moves it into the history
+    for job_id in st.session_state.pending_jobs:
+        job = job_executor.get(job_id)
+        if job is None or job.finished:
+            st.rerun()
+        with st.container(border=True):
+            st.markdown(f"**🧑 You:** {job.label}")
+            if job.cancel_requested:
+                st.info("✖ Cancelling...")
+            elif job.status == QUEUED:
+                ahead = job_executor.position(job_id)
+                st.info(f"⏳ Queued ({ahead:,} {'query' if ahead == 1 else 'queries'} ahead)")
+            else:
+                st.info(f"{job.progress or '🔍 Working...'} ({job.elapsed():.0f}s)")
+            for _, message in [item for item in job.messages if item[0] != 'code'][-3:]:
+                st.caption(message)
+            if not job.cancel_requested:
+                st.button("✖ Cancel", key=f"cancel_{job_id}", on_click=job_executor.cancel, args=(job_id,))
 
 
 # Header with user info and logout
@@ -667,6 +771,96 @@ with col2:
 
 st.markdown("---")
 
+# Cache and connection metrics
+with st.sidebar.expander("⚙️ Performance"):
+    llm_stats = llm_client.stats()
+    st.markdown("**Gemini API**")
+    st.caption(
+        f"Calls: {llm_stats['calls']:,} | Failures: {llm_stats['failures']:,} | "
+        f"Retries: {llm_stats['retries']:,} | Circuit: {llm_stats['circuit']} | "
+        f"p50 {llm_stats['p50_ms']:,.0f} ms / p95 {llm_stats['p95_ms']:,.0f} ms / p99 {llm_stats['p99_ms']:,.0f} ms"
+    )
+    if SQL_TEMPLATES:
+        template_stats = template_matcher.stats()
+        st.markdown("**SQL templates**")
+        st.caption(
+            f"Served: {template_stats['served']:,} | Sent to Gemini: {template_stats['fell_back']:,} | "
+            f"Share of questions: {template_stats['served_rate']:.0%}"
+        )
+    cache_stats = translation_cache.stats()
+    st.markdown("**Translation cache**")
+    st.caption(
+        f"Hits: {cache_stats['hits']:,} | Misses: {cache_stats['misses']:,} | "
+        f"Hit rate: {cache_stats['hit_rate']:.0%} | Entries: {cache_stats['entries']:,}"
+    )
+    if PARAPHRASE_CACHE:
+        paraphrase_stats = paraphrase_cache.stats()
+        st.markdown("**Paraphrase cache**")
+        st.caption(
+            f"Reused: {paraphrase_stats['hits']:,} of {paraphrase_stats['lookups']:,} lookups "
+            f"({paraphrase_stats['hit_rate']:.0%}) | Indexed questions: {paraphrase_stats['indexed']:,} | "
+            f"Rejected on specifics: {paraphrase_stats['rejected_anchors']:,}"
+        )
+    engine_stats = pool_stats.snapshot(engine)
+    st.markdown("**Connection pool**")
+    st.caption(
+        f"Checked out: {engine_stats.get('checked_out', 0)} / {engine_stats.get('pool_size', 0)} "
+        f"(+{engine_stats.get('overflow', 0)} overflow) | Waits: {engine_stats['waits']:,} "
+        f"(avg {engine_stats['avg_wait_ms']:.0f} ms) | Connects: {engine_stats['connects']:,} "
+        f"(avg {engine_stats['avg_connect_ms']:.0f} ms)"
+    )
+    result_stats = result_cache.stats()
+    st.markdown("**Result cache**")
+    st.caption(
+        f"Hits: {result_stats['hits']:,} | Misses: {result_stats['misses']:,} | "
+        f"Memory: {result_stats['memory_bytes'] / 1024 ** 2:.1f} MB | "
+        f"Disk: {result_stats['disk_bytes'] / 1024 ** 2:.1f} MB"
+    )
+    render_stats = chart_renderer.stats()
+    st.markdown("**Chart rendering**")
+    st.caption(
+        f"Renders: {render_stats['renders']:,} | Failed: {render_stats['failures']:,} | "
+        f"Cache hits: {render_stats['cache_hits']:,} | "
+        f"Pending: {render_stats['pending']:,} | Cached: {render_stats['cached_charts']:,}"
+    )
+    if ROLLUP_ROUTING:
+        router_stats = rollup_router.stats()
+        st.markdown("**Rollup routing**")
+        st.caption(
+            f"Routed: {router_stats['routed']:,} | Base table: {router_stats['passed_through']:,} | "
+            f"Routed rate: {router_stats['routed_rate']:.0%}"
+        )
+    if APPROX_QUERIES:
+        approx_stats = approximator.stats()
+        st.markdown("**Approximate answers**")
+        st.caption(
+            f"Approximated: {approx_stats['approximated']:,} | Ran exactly: {approx_stats['exact']:,} "
+            f"(not eligible) | Approximated rate: {approx_stats['approximated_rate']:.0%}"
+        )
+    if BACKGROUND_JOBS:
+        job_stats = job_executor.stats()
+        st.markdown("**Query jobs**")
+        st.caption(
+            f"Running: {job_stats['running']} / {job_stats['workers']} | Queued: {job_stats['queued']:,} "
+            f"(peak {job_stats['max_depth']:,}, {job_stats['users_waiting']:,} users) | "
+            f"Wait p50 {job_stats['wait_p50_ms']:,.0f} ms / p95 {job_stats['wait_p95_ms']:,.0f} ms | "
+            f"Done: {job_stats['completed']:,} | Failed: {job_stats['failed']:,} | "
+            f"Cancelled: {job_stats['cancelled']:,} | Turned away: {job_stats['rejected']:,}"
+        )
+    governor_stats = query_governor.stats()
+    st.markdown("**Query governor**")
+    st.caption(
+        f"Governed: {governor_stats['governed']:,} | Timed out: {governor_stats['timeouts']:,} | "
+        f"Cancelled: {governor_stats['cancelled']:,} | Plans checked: {governor_stats['checked']:,} | "
+        f"Flagged: {governor_stats['flagged']:,} ({governor_stats['cartesian']:,} Cartesian)"
+    )
+    history_stats = history_store.stats()
+    st.markdown("**Conversation history**")
+    st.caption(
+        f"In memory: {history_stats['memory_entries']:,} results "
+        f"({history_stats['memory_bytes'] / 1024 ** 2:.1f} MB) across {history_stats['sessions']:,} sessions"
+    )
+
 # Initialize session state for conversation history
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
@@ -674,6 +868,22 @@ if 'conversation_history' not in st.session_state:
 if 'query_count' not in st.session_state:
     st.session_state.query_count = 0
 
+# Background jobs this session is waiting for
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []
+
+# Move background jobs that have finished into the history
+for job_id in list(st.session_state.pending_jobs):
+    job = job_executor.get(job_id)
+    if job is None or job.finished:
+        st.session_state.pending_jobs.remove(job_id)
+        job = job_executor.collect(job_id)
+        if job is not None:
+            st.session_state.conversation_history.append(finished_entry(job))
+
+# Charts still rendering in the worker pool; filled in at the end of the run
+pending_charts = []
+
 # Display conversation history
 if st.session_state.conversation_history:
     st.markdown("### 💬 Conversation History")
@@ -686,19 +896,44 @@ if st.session_state.conversation_history:
             with st.expander(f"🤖 Assistant Response #{i+1}", expanded=(i == len(st.session_state.conversation_history) - 1)):
                 st.markdown(f"**Generated SQL:**")
                 st.code(entry['sql'], language="sql")
+                for note in entry.get('notes', []):
+                    st.info(note)
+                if entry.get('intervals') is not None:
+                    st.markdown("**95% confidence intervals:**")
+                    st.dataframe(entry['intervals'], use_container_width=True)
+                    if st.button("🎯 Get exact answer", key=f"exact_{i}"):
+                        st.session_state.exact_request = {'user_query': entry['user_query'], 'sql': entry['sql']}
+                        st.rerun()
                 
-                if entry['results'] is not None and not entry['results'].empty:
-                    st.markdown(f"**Query Results:** ({len(entry['results'])} rows)")
-                    st.dataframe(entry['results'], use_container_width=True)
+                if entry.get('result_id'):
+                    st.markdown(f"**Query Results:** ({entry['row_count']:,} rows)")
+                    # Full results stay on disk until asked for; recent ones are still in memory
+                    full_results = history_store.get(st.session_state.session_id, entry['result_id'], load=False)
+                    if full_results is None and entry['row_count'] > len(entry['preview']):
+                        if st.checkbox(f"📂 Load all {entry['row_count']:,} rows", key=f"load_results_{entry['result_id']}"):
+                            full_results = history_store.get(st.session_state.session_id, entry['result_id'])
+                    st.dataframe(full_results if full_results is not None else entry['preview'], use_container_width=True)
                     
                     # Display chart if available
-                    if 'chart' in entry and entry['chart'] is not None:
-                        st.pyplot(entry['chart'])
+                    if entry.get('chart_png'):
+                        st.image(entry['chart_png'], use_container_width=True)
+                    elif entry.get('chart_error'):
+                        st.warning(f"📊 Chart unavailable: {entry['chart_error']}")
+                    elif entry.get('chart_key'):
+                        chart_placeholder = st.empty()
+                        if chart_renderer.ready(entry['chart_key']):
+                            show_chart(chart_placeholder, entry)
+                        else:
+                            chart_placeholder.info("📊 Rendering chart...")
+                            pending_charts.append((chart_placeholder, entry))
                 else:
                     st.warning(entry.get('error', 'No results returned.'))
             
             st.markdown("---")
 
+if st.session_state.pending_jobs:
+    pending_jobs_panel()
+
 # Input area at the bottom
 st.markdown("### 💭 Ask a new question")
 col1, col2 = st.columns([5, 1])
@@ -713,48 +948,57 @@ with col1:
 
 with col2:
     send_button = st.button("📤 Send", type="primary", use_container_width=True)
+
+fetch_all = st.checkbox(
+    "Fetch all rows",
+    help=f"Skip the automatic LIMIT {GUARD_DEFAULT_LIMIT:,} on row-level queries (power users)",
+)
+approximate = APPROX_QUERIES and st.checkbox(
+    "≈ Fast approximate answers",
+    help="Run counts, sums and averages over a sample of the table and show 95% confidence intervals",
+)
     
 # Clear history button
 if st.session_state.conversation_history:
     if st.button("🗑️ Clear History"):
+        cancel_pending_jobs()
+        history_store.drop_session(st.session_state.session_id)
         st.session_state.conversation_history = []
         st.session_state.query_count = 0
         st.rerun()
 
-if (user_query and send_button) or (user_query and not send_button and st.session_state.query_count == 0):
-    # Create a new conversation entry
-    conversation_entry = {
-        'user_query': user_query,
-        'sql': '',
-        'results': None,
-        'chart': None,
-        'error': None
-    }
-    
-    # Generate SQL
-    with st.spinner("🤔 Thinking and generating SQL..."):
-        sql = generate_sql(user_query)
-        conversation_entry['sql'] = sql
-    
-    if not sql:
-        conversation_entry['error'] = "No SQL generated or extraction failed."
+# "Get exact answer" re-runs an approximate entry's SQL without sampling
+exact_request = st.session_state.pop('exact_request', None)
+
+if exact_request or (user_query and send_button) or (user_query and not send_button and st.session_state.query_count == 0):
+    question = f"{exact_request['user_query']} (exact)" if exact_request else user_query
+    sql = exact_request['sql'] if exact_request else None
+    approximate = approximate and not exact_request
+    if BACKGROUND_JOBS:
+        try:
+            job_id = job_executor.submit(
+                st.session_state.username, answer_question, st.session_state.session_id, question, sql,
+                fetch_all=fetch_all, approximate=approximate, label=question,
+            )
+        except JobQueueFull as e:
+            st.warning(f"⏳ {e}")
+        else:
+            st.session_state.pending_jobs.append(job_id)
+            st.session_state.query_count += 1
+            st.rerun()
     else:
-        # Run query
-        with st.spinner("🔍 Executing query..."):
-            results = run_query(sql)
-            conversation_entry['results'] = results
+        conversation_entry = answer_question(
+            st.session_state.session_id, question, sql, fetch_all=fetch_all, approximate=approximate
+        )
+        st.session_state.conversation_history.append(conversation_entry)
+        st.session_state.query_count += 1
         
-        if results is None or results.empty:
-            conversation_entry['error'] = "No results returned or query could not be executed."
-        else:
-            # Generate visualizations
-            with st.spinner("📊 Creating visualizations..."):
-                fig = create_smart_visualizations(results, user_query)
-                if fig:
-                    conversation_entry['chart'] = fig
-    
-    
-    st.session_state.conversation_history.append(conversation_entry)
-    st.session_state.query_count += 1
-    
-    st.rerun()
\ No newline at end of file
+        st.rerun()
+
+# Fill in charts that were still rendering when the history was drawn
+for chart_placeholder, entry in pending_charts:
+    chart_renderer.result(entry['chart_key'], timeout=CHART_RENDER_TIMEOUT)
+    if chart_renderer.ready(entry['chart_key']):
+        show_chart(chart_placeholder, entry)
+    else:
+        chart_placeholder.warning("⏳ Chart is still rendering and will appear on the next refresh.")
@@ -0,0 +1,298 @@
+"""
+Approximate Queries
+
+Opt-in fast answers for exploratory aggregates over aviation_data. An
+eligible query is rewritten to read a Bernoulli sample of the table (a
+sample table maintained by the loaders on SQLite and DuckDB, TABLESAMPLE
+on Snowflake) with counts and sums scaled up by the sampling rate, and
+COUNT(DISTINCT) becomes a HyperLogLog sketch (APPROX_COUNT_DISTINCT) on
+Snowflake, the one backend whose sketch error is documented. The rewritten query also returns the raw sample
+counts and sums of squares each estimate needs for a 95% confidence
+interval; Approximation.split() turns those into an intervals table.
+"""
+
+import os
+import threading
+
+from sqlglot import exp
+
+
+BASE_TABLE = 'aviation_data'
+SAMPLE_TABLE = f"{BASE_TABLE}_sample"
+SAMPLE_INFO_TABLE = f"{BASE_TABLE}_sample_info"
+DEFAULT_SAMPLE_PERCENT = 10.0
+
+Z_95 = 1.96
+# Average relative error of Snowflake's HyperLogLog distinct counts (documented).
+# DuckDB's approx_count_distinct measured ~12% on aviation_data, too loose for
+# these intervals, so distinct counts stay exact there.
+HLL_RELATIVE_ERROR = 0.0163
+
+
+def sample_percent():
+    """Sampling rate from APPROX_SAMPLE_PERCENT, in percent"""
+    return min(max(float(os.getenv("APPROX_SAMPLE_PERCENT", str(DEFAULT_SAMPLE_PERCENT))), 0.01), 100.0)
+
+
+def sample_statements(dialect, percent=None):
+    """Statements that (re)build the sample table and record its sampling rate"""
+    fraction = (percent if percent is not None else sample_percent()) / 100
+    if dialect == 'sqlite':
+        # random() is a signed 64-bit integer in SQLite
+        keep = f"ABS(RANDOM() % 1000000) < {round(fraction * 1000000)}"
+    else:
+        keep = f"RANDOM() < {fraction!r}"
+    return [
+        f"DROP TABLE IF EXISTS {SAMPLE_TABLE}",
+        f"CREATE TABLE {SAMPLE_TABLE} AS SELECT * FROM {BASE_TABLE} WHERE {keep}",
+        f"DROP TABLE IF EXISTS {SAMPLE_INFO_TABLE}",
+        f"CREATE TABLE {SAMPLE_INFO_TABLE} AS SELECT {fraction!r} AS fraction, "
+        f"(SELECT COUNT(*) FROM {BASE_TABLE}) AS base_rows, (SELECT COUNT(*) FROM {SAMPLE_TABLE}) AS sample_rows",
+    ]
+
+
+def read_sample_fraction(engine):
+    """Sampling rate of the sample table in engine, or None if there is none"""
+    from sqlalchemy import text
+
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text(f"SELECT fraction FROM {SAMPLE_INFO_TABLE}")).fetchone()
+    except Exception:
+        return None
+    return float(row[0]) if row and row[0] else None
+
+
+def _projection_aggregate(projection):
+    """The aggregate a projection consists of (aliased or not), or None"""
+    inner = projection.this if isinstance(projection, exp.Alias) else projection
+    return inner if isinstance(inner, exp.AggFunc) else None
+
+
+def _as_double(expression):
+    return exp.Cast(this=expression, to=exp.DataType.build('DOUBLE'))
+
+
+class Approximation:
+    """A query rewritten to run approximately, and how to read its result
+
+    estimates holds (position, kind) for every projection that gets a
+    confidence interval; kind is count, sum, avg or distinct. The helper
+    columns the intervals need follow the original projections.
+    """
+
+    def __init__(self, sql, method, fraction, projections, estimates):
+        self.sql = sql
+        self.method = method
+        self.fraction = fraction
+        self.projections = projections
+        self.estimates = estimates
+
+    def describe(self):
+        if self.method == 'sketch':
+            return "HyperLogLog distinct counts"
+        return f"a {self.fraction:.0%} sample of {BASE_TABLE}"
+
+    def split(self, frame):
+        """(results, intervals) from the rewritten query's result
+
+        intervals has the grouping columns and, for every estimate, its
+        value and the half-width of its 95% confidence interval.
+        """
+        import numpy as np
+
+        results = frame.iloc[:, :self.projections].copy()
+        helpers = frame.iloc[:, self.projections:]
+        estimated = {position for position, _ in self.estimates}
+        intervals = results[[column for index, column in enumerate(results.columns) if index not in estimated]].copy()
+        f = self.fraction
+        helper = 0
+        for position, kind in self.estimates:
+            name = results.columns[position]
+            value = results.iloc[:, position].astype(float)
+            if kind == 'count':
+                sampled = helpers.iloc[:, helper].astype(float)
+                helper += 1
+                margin = Z_95 * np.sqrt(sampled * (1 - f)) / f
+            elif kind == 'sum':
+                squares = helpers.iloc[:, helper].astype(float)
+                helper += 1
+                margin = Z_95 * np.sqrt(squares * (1 - f)) / f
+            elif kind == 'avg':
+                n = helpers.iloc[:, helper].astype(float)
+                squares = helpers.iloc[:, helper + 1].astype(float)
+                helper += 2
+                variance = (squares / n - value ** 2).clip(lower=0) * n / (n - 1).where(n > 1)
+                margin = Z_95 * np.sqrt(variance / n)
+            else:
+                margin = Z_95 * HLL_RELATIVE_ERROR * value
+            intervals[name] = results.iloc[:, position]
+            intervals[f"{name} ±95%"] = margin.round(2)
+        return results, intervals
+
+
+def relative_margin(intervals):
+    """Largest interval half-width relative to its estimate (the column before it)"""
+    worst = 0.0
+    for index, column in enumerate(intervals.columns):
+        if index and str(column).endswith(" ±95%"):
+            estimate = intervals.iloc[:, index - 1].astype(float).abs()
+            ratio = (intervals.iloc[:, index] / estimate.where(estimate > 0)).max()
+            if ratio == ratio:
+                worst = max(worst, float(ratio))
+    return worst
+
+
+class Approximator:
+    """Rewrites eligible aggregate queries to run on a sample or with sketches
+
+    fraction_loader() returns the sampling rate of the maintained sample
+    table (None if there is none); it is called again whenever
+    data_version() changes. On Snowflake the table is sampled in the query
+    instead. describe(sql) returns a query's column names, used to keep the
+    names of unaliased aggregates once they are rewritten.
+    """
+
+    def __init__(self, dialect, fraction_loader, data_version, describe=None):
+        self.dialect = dialect
+        self._fraction_loader = fraction_loader
+        self._data_version = data_version
+        self._describe = describe
+        self._fraction = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.approximated = 0
+        self.exact = 0
+
+    def _sample_fraction(self):
+        if self.dialect == 'snowflake':
+            return sample_percent() / 100
+        version = self._data_version()
+        with self._lock:
+            if self._version != version:
+                try:
+                    self._fraction = self._fraction_loader()
+                except Exception:
+                    self._fraction = None
+                self._version = version
+            return self._fraction
+
+    def rewrite(self, sql):
+        """Approximation of sql, or None when it has to run exactly"""
+        from sql_guard import parse_statement
+
+        try:
+            query = parse_statement(sql, self.dialect)
+            approximation = self._rewrite(query.copy(), sql)
+        except Exception:
+            approximation = None
+        with self._lock:
+            if approximation is None:
+                self.exact += 1
+            else:
+                self.approximated += 1
+        return approximation
+
+    def _rewrite(self, query, sql):
+        from rollups import keep_projection_names
+        from sql_guard import is_aggregating
+
+        if not isinstance(query, exp.Select) or query.args.get('with') or query.args.get('joins'):
+            return None
+        if not is_aggregating(query) or query.args.get('having') or query.args.get('distinct'):
+            # Filters on estimates would flip rows in and out of the result
+            return None
+        if len(list(query.find_all(exp.Select))) > 1 or query.find(exp.Window):
+            return None
+        from_clause = query.args.get('from_') or query.args.get('from')
+        table = from_clause.this if from_clause else None
+        if not isinstance(table, exp.Table) or table.name.lower() != BASE_TABLE or table.args.get('db'):
+            return None
+
+        aggregates = list(query.find_all(exp.AggFunc))
+        distinct = [agg for agg in aggregates if isinstance(agg, exp.Count) and isinstance(agg.this, exp.Distinct)]
+        if distinct:
+            return self._sketch(query, sql, distinct)
+        if any(not isinstance(agg, (exp.Count, exp.Sum, exp.Avg)) for agg in aggregates):
+            return None
+        fraction = self._sample_fraction()
+        if not fraction or fraction >= 1:
+            return None
+
+        projections = len(query.expressions)
+        scale = exp.Literal.number(repr(1 / fraction))
+        estimates = []
+        helpers = []
+        renamed = set()
+        for position, projection in enumerate(query.expressions):
+            aggregate = _projection_aggregate(projection)
+            if aggregate is None:
+                continue
+            argument = aggregate.this
+            if isinstance(aggregate, exp.Count):
+                estimates.append((position, 'count'))
+                helpers.append(aggregate.copy())
+            elif isinstance(aggregate, exp.Sum):
+                estimates.append((position, 'sum'))
+                helpers.append(exp.func('SUM', exp.Mul(this=_as_double(argument.copy()), expression=_as_double(argument.copy()))))
+            else:
+                estimates.append((position, 'avg'))
+                helpers.append(exp.Count(this=argument.copy()))
+                helpers.append(exp.func('SUM', exp.Mul(this=_as_double(argument.copy()), expression=_as_double(argument.copy()))))
+            if not projection.alias:
+                renamed.add(position)
+        # Scale every count and sum, including those inside expressions and ORDER BY
+        for aggregate in aggregates:
+            if isinstance(aggregate, exp.Count):
+                aggregate.replace(exp.Cast(
+                    this=exp.func('ROUND', exp.Mul(this=aggregate.copy(), expression=scale.copy())),
+                    to=exp.DataType.build('BIGINT'),
+                ))
+            elif isinstance(aggregate, exp.Sum):
+                aggregate.replace(exp.Paren(this=exp.Mul(this=aggregate.copy(), expression=scale.copy())))
+        if renamed and not keep_projection_names(query, sql, renamed, self._describe):
+            return None
+        for index, helper in enumerate(helpers):
+            query.append('expressions', exp.alias_(helper, f"approx_helper_{index}"))
+
+        if self.dialect == 'snowflake':
+            table.set('sample', exp.TableSample(
+                method=exp.var('BERNOULLI'), percent=exp.Literal.number(repr(fraction * 100)),
+            ))
+        else:
+            if not table.alias:
+                table.set('alias', exp.TableAlias(this=exp.to_identifier(BASE_TABLE)))
+            table.set('this', exp.to_identifier(SAMPLE_TABLE))
+        return Approximation(query.sql(dialect=self.dialect), 'sample', fraction, projections, estimates)
+
+    def _sketch(self, query, sql, distinct):
+        """Distinct counts become HyperLogLog sketches over the full table"""
+        from rollups import keep_projection_names
+
+        if self.dialect != 'snowflake':
+            return None
+        estimates = []
+        renamed = set()
+        for position, projection in enumerate(query.expressions):
+            aggregate = _projection_aggregate(projection)
+            if aggregate in distinct:
+                estimates.append((position, 'distinct'))
+                if not projection.alias:
+                    renamed.add(position)
+        for aggregate in distinct:
+            values = aggregate.this.expressions
+            if len(values) != 1:
+                return None
+            aggregate.replace(exp.ApproxDistinct(this=values[0].copy()))
+        if renamed and not keep_projection_names(query, sql, renamed, self._describe):
+            return None
+        return Approximation(query.sql(dialect=self.dialect), 'sketch', 1.0, len(query.expressions), estimates)
+
+    def stats(self):
+        with self._lock:
+            total = self.approximated + self.exact
+            return {
+                "approximated": self.approximated,
+                "exact": self.exact,
+                "approximated_rate": self.approximated / total if total else 0.0,
+            }
@@ -0,0 +1,189 @@
+"""
+Chart Renderer
+
+Renders charts in a pool of worker processes (matplotlib Agg backend) so the
+Streamlit script thread never blocks on drawing. Finished PNGs are kept in a
+content-addressed cache keyed on a hash of the result frame plus the chart
+type, so the same result is never rendered twice. A render that fails keeps
+its error, so the page can say the chart is unavailable and why.
+"""
+
+import hashlib
+import multiprocessing
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Render errors kept for the page to show
+MAX_KEPT_ERRORS = 256
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    # Pay for pyplot, seaborn and styling once per worker, not on its first chart
+    from visualizations import setup_plotting
+
+    setup_plotting()
+
+
+def render_chart_png(results, chart_type, args, aggregates=None, profile=None):
+    """Worker entry point: build the chart and return PNG bytes"""
+    from visualizations import build_chart, figure_to_png
+
+    fig = build_chart(results, chart_type, args, aggregates, profile)
+    if fig is None:
+        return None
+    return figure_to_png(fig)
+
+
+def _hash_frame(digest, frame):
+    import pandas as pd
+
+    digest.update("\x1f".join(f"{col}:{dtype}" for col, dtype in frame.dtypes.items()).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+
+
+def chart_key(results, chart_type, aggregates=None):
+    """Content hash of what a chart draws: the result frame or its aggregates"""
+    digest = hashlib.sha256()
+    digest.update(str(chart_type).encode())
+    if aggregates:
+        for name in sorted(aggregates):
+            digest.update(name.encode())
+            value = aggregates[name]
+            if hasattr(value, "dtypes"):
+                _hash_frame(digest, value)
+            else:
+                digest.update(repr(value).encode())
+    else:
+        _hash_frame(digest, results)
+    return digest.hexdigest()
+
+
+class ChartRenderer:
+    """Process pool plus LRU cache of rendered chart PNGs"""
+
+    def __init__(self, workers=2, cache_budget_bytes=128 * 1024 ** 2, mp_context="spawn"):
+        self.workers = workers
+        self.cache_budget_bytes = cache_budget_bytes
+        self._context = multiprocessing.get_context(mp_context)
+        self._executor = None
+        self._pending = {}
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._errors = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=self._context, initializer=_init_worker
+            )
+        return self._executor
+
+    def _remember(self, key, png):
+        if png is None or len(png) > self.cache_budget_bytes:
+            return
+        self._cache[key] = png
+        self._cache_bytes += len(png)
+        while self._cache_bytes > self.cache_budget_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    def _fail(self, key, error):
+        self.failures += 1
+        self._errors[key] = f"{type(error).__name__}: {error}"
+        while len(self._errors) > MAX_KEPT_ERRORS:
+            self._errors.popitem(last=False)
+        traceback.print_exception(error)
+
+    def submit(self, results, chart_type, args, aggregates=None, profile=None):
+        """Queue a render (unless cached or already running) and return its key
+
+        With pushed-down aggregates the builder never reads raw rows, so only
+        an empty frame with the result's columns is sent to the worker. The
+        result's profile travels with it so workers don't recompute it.
+        """
+        key = chart_key(results, chart_type, aggregates)
+        if aggregates:
+            results = results.head(0)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return key
+            if key in self._pending:
+                return key
+            self._errors.pop(key, None)
+            self.renders += 1
+            if self.workers > 0:
+                try:
+                    self._pending[key] = self._pool().submit(render_chart_png, results, chart_type, args, aggregates, profile)
+                    return key
+                except BrokenProcessPool:
+                    self._executor = None
+        # No usable pool: render inline
+        try:
+            png = render_chart_png(results, chart_type, args, aggregates, profile)
+        except Exception as e:
+            with self._lock:
+                self._fail(key, e)
+            return key
+        with self._lock:
+            self._remember(key, png)
+        return key
+
+    def ready(self, key):
+        """True once the chart for key is cached (or failed)"""
+        with self._lock:
+            future = self._pending.get(key)
+        return future is None or future.done()
+
+    def result(self, key, timeout=None):
+        """PNG bytes for key, waiting up to timeout seconds; None if unavailable"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            future = self._pending.get(key)
+        if future is None:
+            return None
+        try:
+            png = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        except Exception as e:
+            with self._lock:
+                if isinstance(e, BrokenProcessPool):
+                    self._executor = None
+                self._pending.pop(key, None)
+                self._fail(key, e)
+            return None
+        with self._lock:
+            self._pending.pop(key, None)
+            self._remember(key, png)
+        return png
+
+    def error(self, key):
+        """Why the chart for key could not be rendered, or None"""
+        with self._lock:
+            return self._errors.get(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "renders": self.renders,
+                "failures": self.failures,
+                "cache_hits": self.hits,
+                "pending": sum(1 for future in self._pending.values() if not future.done()),
+                "cached_charts": len(self._cache),
+                "cache_bytes": self._cache_bytes,
+            }
@@ -0,0 +1,431 @@
+"""
+Database Engine
+
+Builds the SQLAlchemy engine for the configured backend with a tunable
+connection pool, records pool statistics so the pool can be sized for the
+number of concurrent analysts, and streams query results in batches.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
+
+
+def env_flag(name, default="true"):
+    """Read a boolean environment variable"""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts, waits and connects"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.max_connect_seconds = 0.0
+
+    def record_checkout(self, waited, seconds):
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += seconds
+
+    def record_connect(self, seconds):
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+            self.max_connect_seconds = max(self.max_connect_seconds, seconds)
+
+    def snapshot(self, engine=None):
+        """Counters plus live pool occupancy for engine"""
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "avg_wait_ms": 1000 * self.wait_seconds / self.waits if self.waits else 0.0,
+                "connects": self.connects,
+                "avg_connect_ms": 1000 * self.connect_seconds / self.connects if self.connects else 0.0,
+                "max_connect_ms": 1000 * self.max_connect_seconds,
+            }
+        pool = getattr(engine, "pool", None)
+        if isinstance(pool, QueuePool):
+            stats.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkout waits and connect latency to pool_stats"""
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_checkout(exhausted, time.perf_counter() - start)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        record = super()._create_connection()
+        pool_stats.record_connect(time.perf_counter() - start)
+        return record
+
+
+def pool_options():
+    """Pool settings from the environment"""
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING"),
+    }
+
+
+def duckdb_source_marker(source):
+    """Identifies the source file contents a DuckDB build was made from"""
+    from query_cache import fingerprint, get_data_version
+
+    try:
+        mtime = os.path.getmtime(source)
+    except OSError:
+        mtime = 0
+    return fingerprint(os.path.abspath(source), mtime, get_data_version())
+
+
+def build_duckdb_database(path, source, marker=None):
+    """(Re)build the columnar aviation_data table in path from source
+
+    source may be the SQLite database built by load_data.py, the raw CSV or
+    a Parquet file. The build goes to a temporary file that replaces path
+    atomically, so open readers keep working on the previous copy. marker
+    (default: the source's current marker) is recorded in load_metadata.
+    """
+    import duckdb
+    import uuid
+
+    # Unique per build, so processes rebuilding at the same time never share a file
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.building"
+    conn = duckdb.connect(tmp_path)
+    try:
+        extension = os.path.splitext(source)[1].lower()
+        if extension == '.csv':
+            conn.execute(
+                "CREATE TABLE aviation_data AS SELECT * FROM read_csv_auto(?, header = true, "
+                "dateformat = '%d-%m-%Y', types = {'Departure Date': 'DATE'})",
+                [source],
+            )
+        elif extension == '.parquet':
+            conn.execute("CREATE TABLE aviation_data AS SELECT * FROM read_parquet(?)", [source])
+        else:
+            try:
+                conn.execute("INSTALL sqlite")
+                conn.execute("LOAD sqlite")
+                quoted_source = source.replace("'", "''")
+                conn.execute(f"ATTACH '{quoted_source}' AS source_db (TYPE sqlite, READ_ONLY)")
+                conn.execute("CREATE TABLE aviation_data AS SELECT * FROM source_db.aviation_data")
+                conn.execute("DETACH source_db")
+            except duckdb.Error:
+                # sqlite extension unavailable (offline): copy through pandas instead
+                import sqlite3
+                import pandas as pd
+
+                with sqlite3.connect(source) as source_conn:
+                    df = pd.read_sql("SELECT * FROM aviation_data", source_conn)
+                conn.register("source_df", df)
+                conn.execute("CREATE OR REPLACE TABLE aviation_data AS SELECT * FROM source_df")
+                conn.unregister("source_df")
+        column_types = dict(conn.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'aviation_data'"
+        ).fetchall())
+        if column_types.get('Departure Date') == 'VARCHAR':
+            # SQLite stores dates as text; give DuckDB a real DATE column
+            conn.execute(
+                'ALTER TABLE aviation_data ALTER "Departure Date" TYPE DATE '
+                'USING TRY_CAST(TRY_CAST("Departure Date" AS TIMESTAMP) AS DATE)'
+            )
+        from rollups import rollup_statements
+
+        for _, statement in rollup_statements(column_types, 'duckdb'):
+            conn.execute(statement)
+        from approximate import sample_statements
+
+        for statement in sample_statements('duckdb'):
+            conn.execute(statement)
+        conn.execute("CREATE TABLE load_metadata (source_marker VARCHAR)")
+        conn.execute("INSERT INTO load_metadata VALUES (?)", [marker or duckdb_source_marker(source)])
+        conn.execute("CHECKPOINT")
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+
+
+def ensure_duckdb_database(path, source):
+    """Build path from source unless it is already current; returns the copy's marker"""
+    import duckdb
+
+    current = duckdb_source_marker(source)
+    if os.path.exists(path):
+        try:
+            conn = duckdb.connect(path, read_only=True)
+            try:
+                marker = conn.execute("SELECT source_marker FROM load_metadata").fetchone()[0]
+            finally:
+                conn.close()
+            if marker == current:
+                return current
+        except duckdb.Error:
+            pass
+    build_duckdb_database(path, source, current)
+    return current
+
+
+class DuckDBCopy:
+    """Keeps a DuckDB engine's copy in step with its source
+
+    Every checkout compares the source's marker (its mtime and the data
+    version load_data.py bumps) with the copy's. When they differ the copy
+    is rebuilt once, and connections still open on the old copy are
+    dropped by the pool and reopened on the new one.
+
+    DuckDB shares one database instance per path within a process, and a
+    connection to the old copy that is still checked out keeps that
+    instance alive. So connections open a hard link named after the build
+    rather than the path itself, and each build gets an instance of its
+    own. Links to older builds are removed; open connections keep reading
+    them until they close.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self._lock = threading.Lock()
+        self.marker = ensure_duckdb_database(path, source)
+        self.open_path = self._link(self.marker)
+        self.rebuilds = 0
+
+    def _link(self, marker):
+        """Path connections should open for the build with this marker"""
+        import re
+
+        link = f"{self.path}.{marker[:16]}"
+        try:
+            os.link(self.path, link)
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hard links here: connections share the path's instance
+            return self.path
+        folder = os.path.dirname(os.path.abspath(self.path))
+        older = re.compile(re.escape(os.path.basename(self.path)) + r"\.[0-9a-f]{16}")
+        for name in os.listdir(folder):
+            if older.fullmatch(name) and name != os.path.basename(link):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+        return link
+
+    def current(self):
+        """Marker of the up-to-date copy, rebuilding it if the source changed"""
+        marker = duckdb_source_marker(self.source)
+        if marker != self.marker:
+            with self._lock:
+                if marker != self.marker:
+                    self.marker = ensure_duckdb_database(self.path, self.source)
+                    self.open_path = self._link(self.marker)
+                    self.rebuilds += 1
+        return self.marker
+
+    def on_do_connect(self, dialect, connection_record, cargs, cparams):
+        self.current()
+        cparams['database'] = self.open_path
+
+    def on_connect(self, dbapi_connection, connection_record):
+        # Read from the file the connection opened, in case another process rebuilt it meanwhile
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT source_marker FROM load_metadata")
+            connection_record.info['duckdb_marker'] = cursor.fetchone()[0]
+        except Exception:
+            connection_record.info['duckdb_marker'] = None
+        finally:
+            cursor.close()
+        connection_record.info['duckdb_fresh'] = True
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        # A connection just opened serves what it found, so a checkout never loops
+        if connection_record.info.pop('duckdb_fresh', False):
+            return
+        if connection_record.info.get('duckdb_marker') != self.current():
+            # The pool discards this connection and checks out a fresh one
+            raise DisconnectionError("The DuckDB copy was rebuilt from a newer source")
+
+    def listen(self, engine):
+        event.listen(engine, "do_connect", self.on_do_connect)
+        event.listen(engine, "connect", self.on_connect)
+        event.listen(engine, "checkout", self.on_checkout)
+
+
+def get_database_engine():
+    """Create the engine for DATABASE_TYPE (sqlite, duckdb or snowflake)"""
+    db_type = os.getenv('DATABASE_TYPE', 'sqlite').lower()
+
+    if db_type == 'duckdb':
+        path = os.getenv('DUCKDB_PATH', 'aviation.duckdb')
+        copy = DuckDBCopy(path, os.getenv('DUCKDB_SOURCE', 'aviation.db'))
+        engine = create_engine(f"duckdb:///{path}", connect_args={"read_only": True}, **pool_options())
+        copy.listen(engine)
+        return engine
+
+    if db_type == 'snowflake':
+        from snowflake.sqlalchemy import URL
+
+        connection_url = URL(
+            account=os.getenv('SNOWFLAKE_ACCOUNT'),
+            user=os.getenv('SNOWFLAKE_USER'),
+            password=os.getenv('SNOWFLAKE_PASSWORD'),
+            database=os.getenv('SNOWFLAKE_DATABASE'),
+            schema=os.getenv('SNOWFLAKE_SCHEMA'),
+            warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
+            role=os.getenv('SNOWFLAKE_ROLE', 'ACCOUNTADMIN')
+        )
+        connect_args = {"client_session_keep_alive": env_flag("SNOWFLAKE_KEEP_ALIVE")}
+        return create_engine(connection_url, connect_args=connect_args, **pool_options())
+    else:
+        # check_same_thread is off because pooled connections are shared by session threads
+        engine = create_engine(
+            "sqlite:///aviation.db",
+            connect_args={"check_same_thread": False},
+            **pool_options()
+        )
+        event.listen(engine, "connect", set_sqlite_reader_pragmas)
+        return engine
+
+
+def set_sqlite_reader_pragmas(dbapi_connection, connection_record):
+    """Pragmas for many concurrent readers of the WAL-mode aviation.db"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def normalize_column_name(name):
+    """Lower-case all-uppercase names the way SQLAlchemy's Snowflake dialect does"""
+    return name.lower() if name.isupper() else name
+
+
+def iter_query_batches(engine, sql, batch_rows=10000):
+    """Yield the result of sql as a sequence of DataFrames
+
+    Snowflake cursors stream Arrow result batches (fetch_pandas_batches),
+    DuckDB cursors stream Arrow record batches, and other drivers are read
+    with fetchmany. Closing the generator early
+    closes the cursor, so the rest of the result is never fetched.
+    """
+    import pandas as pd
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            if hasattr(cursor, "fetch_record_batch"):
+                # DuckDB: Arrow record batches straight from the columnar engine
+                for batch in cursor.fetch_record_batch(batch_rows):
+                    yield batch.to_pandas()
+            elif hasattr(cursor, "fetch_pandas_batches"):
+                for batch in cursor.fetch_pandas_batches():
+                    batch.columns = [normalize_column_name(col) for col in batch.columns]
+                    yield batch
+            else:
+                columns = [desc[0] for desc in cursor.description]
+                while True:
+                    rows = cursor.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def table_names(engine):
+    """Tables in the engine's default schema"""
+    return inspect(engine).get_table_names()
+
+
+def query_columns(engine, sql):
+    """Column names of sql exactly as the driver reports them"""
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            return [desc[0] for desc in cursor.description]
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def fetch_with_ceiling(engine, sql, max_rows, max_bytes, batch_rows=10000, on_batch=None):
+    """Fetch sql batch by batch, stopping at max_rows or max_bytes
+
+    on_batch(batch, rows_so_far) is called as each batch arrives. Returns
+    (DataFrame, truncated).
+    """
+    import pandas as pd
+
+    batches = []
+    rows = 0
+    size = 0
+    truncated = False
+    stream = iter_query_batches(engine, sql, batch_rows)
+    try:
+        for batch in stream:
+            if rows + len(batch) > max_rows:
+                batch = batch.iloc[:max_rows - rows]
+                truncated = True
+            rows += len(batch)
+            size += int(batch.memory_usage(index=False, deep=True).sum())
+            batches.append(batch)
+            if on_batch is not None:
+                on_batch(batch, rows)
+            if truncated:
+                break
+            if size >= max_bytes:
+                # Over the byte ceiling: the result is only cut short if more rows follow
+                following = next(stream, None)
+                truncated = following is not None and len(following) > 0
+                break
+    finally:
+        stream.close()
+    if not batches:
+        return pd.DataFrame(), False
+    return pd.concat(batches, ignore_index=True), truncated
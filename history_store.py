@@ -0,0 +1,152 @@
+"""
+Conversation History Store
+
+Keeps full query results out of st.session_state. Every result is spilled
+to a compressed Parquet file; a process-wide LRU keeps recently used frames
+in memory under both a per-session and a process memory budget, and evicted
+frames are reloaded from disk on demand.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from query_cache import cache_dir
+
+
+def frame_bytes(df):
+    """Approximate in-memory size of a DataFrame"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class HistoryStore:
+    """Spill-to-disk store for conversation results shared by all sessions
+
+    Spill files older than spill_ttl_seconds (left by sessions that were
+    abandoned rather than logged out) are purged at startup and then by
+    save(), at most once every purge_interval_seconds.
+    """
+
+    def __init__(self, directory=None, session_budget_bytes=64 * 1024 ** 2,
+                 process_budget_bytes=512 * 1024 ** 2, preview_rows=50, spill_ttl_seconds=24 * 3600,
+                 purge_interval_seconds=600):
+        self.directory = directory or os.path.join(cache_dir(), "history")
+        self.session_budget_bytes = session_budget_bytes
+        self.process_budget_bytes = process_budget_bytes
+        self.preview_rows = preview_rows
+        self.spill_ttl_seconds = spill_ttl_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_purge = time.monotonic()
+        self._memory = OrderedDict()
+        self._process_bytes = 0
+        self._session_bytes = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._purge_expired()
+
+    def _path(self, session_id, result_id, suffix=".parquet"):
+        return os.path.join(self.directory, f"{session_id}-{result_id}{suffix}")
+
+    def _purge_if_due(self):
+        with self._lock:
+            if time.monotonic() - self._last_purge < self.purge_interval_seconds:
+                return
+            self._last_purge = time.monotonic()
+        self._purge_expired()
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.spill_ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self, key):
+        _, size = self._memory.pop(key)
+        self._process_bytes -= size
+        self._session_bytes[key[0]] -= size
+
+    def _remember(self, session_id, result_id, df):
+        size = frame_bytes(df)
+        if size > self.session_budget_bytes:
+            return
+        key = (session_id, result_id)
+        if key in self._memory:
+            self._evict(key)
+        self._memory[key] = (df, size)
+        self._process_bytes += size
+        self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + size
+        # Least recently used frames of this session go first, then process-wide
+        for other in list(self._memory):
+            if self._session_bytes[session_id] <= self.session_budget_bytes:
+                break
+            if other[0] == session_id and other != key:
+                self._evict(other)
+        while self._process_bytes > self.process_budget_bytes and len(self._memory) > 1:
+            self._evict(next(iter(self._memory)))
+
+    def save(self, session_id, df):
+        """Spill df to disk and return (result_id, preview)"""
+        result_id = uuid.uuid4().hex[:12]
+        try:
+            df.to_parquet(self._path(session_id, result_id), compression="zstd", index=False)
+        except (TypeError, ValueError, ImportError):
+            # Mixed-type object columns Arrow can't encode
+            df.to_pickle(self._path(session_id, result_id, ".pkl.gz"), compression="gzip")
+        with self._lock:
+            self._remember(session_id, result_id, df)
+        self._purge_if_due()
+        return result_id, df.head(self.preview_rows).copy()
+
+    def get(self, session_id, result_id, load=True):
+        """Return the full result, reading it back from disk when evicted
+
+        With load=False only an in-memory frame is returned (or None).
+        """
+        import pandas as pd
+
+        key = (session_id, result_id)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+        if not load:
+            return None
+        try:
+            df = pd.read_parquet(self._path(session_id, result_id))
+        except (OSError, ValueError):
+            try:
+                df = pd.read_pickle(self._path(session_id, result_id, ".pkl.gz"), compression="gzip")
+            except (OSError, ValueError):
+                return None
+        with self._lock:
+            self._remember(session_id, result_id, df)
+        return df
+
+    def drop_session(self, session_id):
+        """Forget every result belonging to session_id"""
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == session_id]:
+                self._evict(key)
+            self._session_bytes.pop(session_id, None)
+        prefix = f"{session_id}-"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Memory usage and number of frames held in memory"""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._process_bytes,
+                "sessions": sum(1 for size in self._session_bytes.values() if size > 0),
+            }
@@ -0,0 +1,239 @@
+"""
+LLM Client
+
+One keep-alive HTTP session for the LLM provider, shared by every Streamlit
+session. Calls are bounded by connect/read timeouts and an overall deadline,
+429 and 5xx responses are retried with jittered exponential backoff, and a
+circuit breaker fails calls fast while the provider keeps failing. Latency of
+every call is recorded so tail latency can be watched from the app.
+"""
+
+import json as jsonlib
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The LLM provider could not produce a response"""
+
+
+class CircuitOpenError(LLMError):
+    """Calls are being refused because the provider kept failing"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """True if a call may go out now"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self._clock()
+            self._trial_running = False
+
+
+class LLMClient:
+    """Pooled JSON-over-HTTP client with timeouts, retries and a circuit breaker"""
+
+    def __init__(self, connect_timeout=5.0, read_timeout=60.0, deadline_seconds=90.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 failure_threshold=5, reset_seconds=30.0, pool_size=10, latency_window=500):
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.session = requests.Session()
+        # Retries are handled here, where the backoff and the breaker can see them
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a Retry-After in seconds"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def _request(self, url, params=None, json=None, headers=None, stream=False):
+        """(start, response) of the first response that is not retried
+
+        Failures are reported to the breaker here, whatever raised them;
+        success is left to the caller, which may still have a body to read.
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError("The LLM service is failing; calls are paused for a short while.")
+
+        start = time.perf_counter()
+        try:
+            response = self._send(start + self.deadline_seconds, url, params, json, headers, stream)
+        except BaseException:
+            # Also ends a half-open trial, so the breaker can never stay stuck in it
+            self._finish(start, ok=False)
+            raise
+        if response.status_code >= 400:
+            # Client errors are not retried and say nothing about provider health
+            self._finish(start, ok=True)
+            message = response.text[:500]
+            response.close()
+            raise LLMError(f"LLM request rejected (HTTP {response.status_code}): {message}")
+        return start, response
+
+    def _send(self, deadline, url, params, json, headers, stream):
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            try:
+                response = self.session.post(
+                    url, params=params, json=json, headers=headers, timeout=self.timeout, stream=stream
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = f"{type(e).__name__}: {e}"
+            except requests.RequestException as e:
+                # Bad URL, redirect loop and the like: retrying will not help
+                raise LLMError(f"LLM request failed: {type(e).__name__}: {e}") from e
+
+            delay = self._backoff(attempt, response)
+            if response is not None:
+                response.close()
+            if attempt >= self.max_retries or time.perf_counter() + delay >= deadline:
+                raise LLMError(f"LLM request failed after {attempt + 1} attempt(s): {error}")
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def post(self, url, params=None, json=None, headers=None):
+        """POST with retries; returns the successful requests.Response or raises LLMError"""
+        start, response = self._request(url, params=params, json=json, headers=headers)
+        self._finish(start, ok=True)
+        return response
+
+    def post_json(self, url, params=None, json=None, headers=None):
+        """POST and decode the JSON body"""
+        response = self.post(url, params=params, json=json, headers=headers)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LLMError(f"LLM response was not JSON: {e}") from e
+
+    def stream_events(self, url, params=None, json=None, headers=None):
+        """POST to a server-sent-events endpoint and yield each decoded data event
+
+        Connecting and the response headers get the same retries as post();
+        once events flow, a broken stream raises LLMError. The call counts
+        toward the breaker once the stream ends: a broken or malformed stream
+        is a failure, and closing the generator early (which closes the
+        connection) is a success.
+        """
+        start, response = self._request(url, params=params, json=json, headers=headers, stream=True)
+        # text/event-stream has no charset, which requests would read as Latin-1
+        response.encoding = "utf-8"
+        failed = True
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    event = jsonlib.loads(line[len("data:"):].strip())
+                except ValueError as e:
+                    raise LLMError(f"LLM stream sent a malformed event: {e}") from e
+                yield event
+            failed = False
+        except GeneratorExit:
+            failed = False
+            raise
+        except requests.RequestException as e:
+            raise LLMError(f"LLM stream broke off: {e}") from e
+        finally:
+            response.close()
+            self._finish(start, ok=not failed)
+
+    def _finish(self, start, ok):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            self._latencies.append(elapsed_ms)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "calls": self.calls,
+                "failures": self.failures,
+                "retries": self.retries,
+                "rejected": self.rejected,
+            }
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            stats[name] = latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+        stats["circuit"] = self.breaker.state()
+        return stats
@@ -1,12 +1,331 @@
+import argparse
+import statistics
+import time
+
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from approximate import sample_statements
+from query_cache import bump_data_version
+from rollups import rollup_statements
+
+
+DATABASE_URL = "sqlite:///aviation.db"
+CSV_PATH = "Airline_Dataset.csv"
+
+COLUMN_TYPES = {
+    "Passenger ID": "TEXT",
+    "First Name": "TEXT",
+    "Last Name": "TEXT",
+    "Gender": "TEXT",
+    "Age": "INTEGER",
+    "Nationality": "TEXT",
+    "Airport Name": "TEXT",
+    "Airport Country Code": "TEXT",
+    "Country Name": "TEXT",
+    "Airport Continent": "TEXT",
+    "Continents": "TEXT",
+    "Departure Date": "DATE",
+    "Arrival Airport": "TEXT",
+    "Pilot Name": "TEXT",
+    "Flight Status": "TEXT",
+}
+
+# Parse types for the CSV; everything except Age is text
+CSV_DTYPES = {name: "Int64" if name == "Age" else str for name in COLUMN_TYPES}
+CSV_DATE_FORMAT = "%d-%m-%Y"
+DEFAULT_CHUNK_SIZE = 100000
+
+# Columns analysts filter or group by most often
+INDEXED_COLUMNS = [
+    "Nationality",
+    "Gender",
+    "Airport Name",
+    "Airport Country Code",
+    "Country Name",
+    "Airport Continent",
+    "Continents",
+    "Departure Date",
+    "Arrival Airport",
+    "Flight Status",
+]
+
+STANDARD_QUERIES = {
+    "count by nationality": 'SELECT "Nationality", COUNT(*) FROM aviation_data GROUP BY "Nationality"',
+    "count by flight status": 'SELECT "Flight Status", COUNT(*) FROM aviation_data GROUP BY "Flight Status"',
+    "top airports": (
+        'SELECT "Airport Name", COUNT(*) AS n FROM aviation_data '
+        'GROUP BY "Airport Name" ORDER BY n DESC LIMIT 10'
+    ),
+    "delayed passengers": 'SELECT COUNT(*) FROM aviation_data WHERE "Flight Status" = \'Delayed\'',
+    "date range": (
+        'SELECT COUNT(*) FROM aviation_data '
+        'WHERE "Departure Date" BETWEEN \'2022-06-01\' AND \'2022-06-30\''
+    ),
+    "average age by continent": (
+        'SELECT "Continents", AVG("Age") FROM aviation_data GROUP BY "Continents"'
+    ),
+}
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def create_sqlite_engine():
+    """Engine with WAL journaling and bulk-load pragmas on every connection"""
+    engine = create_engine(DATABASE_URL)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-262144")
+        cursor.close()
+
+    return engine
+
+
+def table_exists(engine, table="aviation_data"):
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}
+        ).fetchone()
+    return row is not None
+
+
+def benchmark_queries(engine, repeats=3):
+    """Median latency in milliseconds for each standard query"""
+    latencies = {}
+    with engine.connect() as conn:
+        for name, sql in STANDARD_QUERIES.items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                conn.execute(text(sql)).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            latencies[name] = statistics.median(timings)
+    return latencies
+
+
+def print_latency_report(before, after):
+    print()
+    print("⏱️  Query latency (median ms)")
+    print(f"   {'Query':<28} {'Before':>10} {'After':>10} {'Speedup':>9}")
+    for name, after_ms in after.items():
+        before_ms = before.get(name)
+        if before_ms is None:
+            print(f"   {name:<28} {'-':>10} {after_ms:>10.1f} {'-':>9}")
+        else:
+            speedup = before_ms / after_ms if after_ms else float("inf")
+            print(f"   {name:<28} {before_ms:>10.1f} {after_ms:>10.1f} {speedup:>8.1f}x")
+
+
+def prepare_chunk(chunk):
+    """Convert the CSV date to ISO yyyy-mm-dd and order columns like the table"""
+    dates = pd.to_datetime(chunk['Departure Date'], format=CSV_DATE_FORMAT, errors='coerce')
+    chunk['Departure Date'] = dates.dt.strftime('%Y-%m-%d')
+    return chunk[list(COLUMN_TYPES)]
+
+
+def read_csv_chunks(path=CSV_PATH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the CSV in fixed-size, typed batches (the whole file if chunk_size is 0)"""
+    if not chunk_size:
+        yield prepare_chunk(pd.read_csv(path, dtype=CSV_DTYPES))
+        return
+    for chunk in pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunk_size):
+        yield prepare_chunk(chunk)
+
+
+def chunk_rows(chunk):
+    """Plain tuples with None for missing values, ready for executemany"""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def create_table_sql():
+    columns = [f"{quote(name)} {sql_type}" for name, sql_type in COLUMN_TYPES.items()]
+    return "CREATE TABLE aviation_data (\n    " + ",\n    ".join(columns) + "\n)"
+
+
+def insert_sql(table="aviation_data"):
+    columns = ", ".join(quote(name) for name in COLUMN_TYPES)
+    placeholders = ", ".join("?" for _ in COLUMN_TYPES)
+    return f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def index_table(cursor):
+    """Unique index on Passenger ID when possible, then the secondary indexes"""
+    total, distinct = cursor.execute(
+        'SELECT COUNT(*), COUNT(DISTINCT "Passenger ID") FROM aviation_data'
+    ).fetchone()
+    if total == distinct:
+        cursor.execute('CREATE UNIQUE INDEX idx_aviation_data_passenger_id ON aviation_data ("Passenger ID")')
+    else:
+        print("⚠️  Passenger ID is not unique; indexing it without a uniqueness constraint")
+        cursor.execute('CREATE INDEX idx_aviation_data_passenger_id ON aviation_data ("Passenger ID")')
+    for column in INDEXED_COLUMNS:
+        index_name = "idx_aviation_data_" + column.lower().replace(" ", "_")
+        cursor.execute(f"CREATE INDEX {index_name} ON aviation_data ({quote(column)})")
+
+
+def build_rollups(cursor):
+    """Rebuild the rollup tables the app's query router reads from"""
+    for table, statement in rollup_statements(COLUMN_TYPES, "sqlite"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(statement)
+    print("   🧮 Rollup tables rebuilt")
+
+
+def build_sample(cursor):
+    """Redraw the sample table the app's approximate mode reads from"""
+    for statement in sample_statements("sqlite"):
+        cursor.execute(statement)
+    print("   🎲 Sample table redrawn")
+
+
+def build_table(engine, chunks):
+    """Recreate aviation_data from chunks in one transaction, then index and analyze it
+
+    Only one chunk is held in memory at a time; rows go in with executemany.
+    Returns the number of rows loaded.
+    """
+    rows_loaded = 0
+    start = time.perf_counter()
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("DROP TABLE IF EXISTS aviation_data")
+        cursor.execute(create_table_sql())
+        statement = insert_sql()
+        for chunk in chunks:
+            cursor.executemany(statement, chunk_rows(chunk))
+            rows_loaded += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"   📥 {rows_loaded:,} rows ({rows_loaded / elapsed:,.0f} rows/s)")
+        index_table(cursor)
+        build_rollups(cursor)
+        build_sample(cursor)
+        cursor.execute("ANALYZE")
+        raw_connection.commit()
+    except Exception:
+        raw_connection.rollback()
+        raise
+    finally:
+        raw_connection.close()
+    return rows_loaded
+
+
+def upsert_sql():
+    """INSERT ... ON CONFLICT that only rewrites rows whose values changed"""
+    others = [quote(name) for name in COLUMN_TYPES if name != "Passenger ID"]
+    updates = ", ".join(f"{column} = excluded.{column}" for column in others)
+    changed = " OR ".join(f"aviation_data.{column} IS NOT excluded.{column}" for column in others)
+    return f'{insert_sql()} ON CONFLICT ("Passenger ID") DO UPDATE SET {updates} WHERE {changed}'
+
+
+def incremental_load(engine, chunks):
+    """Upsert rows departing on or after the current watermark in one transaction
+
+    The watermark is the latest departure date already in aviation_data.
+    Readers keep seeing the previous snapshot (WAL) until the commit.
+    Returns (rows_considered, rows_changed, watermark).
+    """
+    rows_considered = 0
+    start = time.perf_counter()
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        watermark = cursor.execute('SELECT MAX("Departure Date") FROM aviation_data').fetchone()[0]
+        changes_before = raw_connection.total_changes
+        statement = upsert_sql()
+        for chunk in chunks:
+            if watermark is not None:
+                dates = chunk['Departure Date']
+                chunk = chunk[(dates >= watermark) | dates.isna()]
+            if chunk.empty:
+                continue
+            cursor.executemany(statement, chunk_rows(chunk))
+            rows_considered += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"   🔁 {rows_considered:,} candidate rows ({rows_considered / elapsed:,.0f} rows/s)")
+        rows_changed = raw_connection.total_changes - changes_before
+        if rows_changed:
+            build_rollups(cursor)
+            build_sample(cursor)
+        cursor.execute("PRAGMA optimize")
+        raw_connection.commit()
+    except Exception:
+        raw_connection.rollback()
+        raise
+    finally:
+        raw_connection.close()
+    return rows_considered, rows_changed, watermark
+
+
+def has_unique_passenger_id(engine):
+    with engine.connect() as conn:
+        indexes = conn.execute(text("PRAGMA index_list(aviation_data)")).fetchall()
+    return any(row[1] == "idx_aviation_data_passenger_id" and row[2] for row in indexes)
+
+
+def load_data(chunk_size=DEFAULT_CHUNK_SIZE, incremental=False):
+    engine = create_sqlite_engine()
+
+    before = {}
+    if table_exists(engine):
+        try:
+            before = benchmark_queries(engine)
+        except Exception as e:
+            print(f"⚠️  Could not benchmark the existing table: {e}")
+
+    if incremental and not (before or table_exists(engine)):
+        print("ℹ️  aviation_data does not exist yet; running a full load instead")
+        incremental = False
+    if incremental and not has_unique_passenger_id(engine):
+        print("❌ Incremental loads need a unique Passenger ID; run a full load instead")
+        return
 
-engine = create_engine("sqlite:///aviation.db")
+    start = time.perf_counter()
+    if incremental:
+        rows_loaded, rows_changed, watermark = incremental_load(engine, read_csv_chunks(CSV_PATH, chunk_size))
+        print(f"🔖 Watermark: departures on or after {watermark or 'the beginning'}")
+        print(f"Incremental load complete: {rows_changed:,} rows inserted or updated.")
+    else:
+        rows_loaded = build_table(engine, read_csv_chunks(CSV_PATH, chunk_size))
+        print(f"Data loaded successfully into aviation_data table ({rows_loaded:,} rows).")
+    elapsed = time.perf_counter() - start
+    bump_data_version()
 
-df = pd.read_csv("Airline_Dataset.csv")  
+    print(f"🚀 Throughput: {rows_loaded / elapsed:,.0f} rows/s over {elapsed:.1f}s")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"🧠 Peak memory: {peak:,.0f} MB")
 
-df['Departure Date'] = pd.to_datetime(df['Departure Date'], format='%d-%m-%Y', errors='coerce')
+    print_latency_report(before, benchmark_queries(engine))
 
-df.to_sql("aviation_data", engine, if_exists="replace", index=False)
 
-print("Data loaded successfully into aviation_data table.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load Airline_Dataset.csv into aviation.db")
+    parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+        help="rows parsed and inserted per batch (0 reads the whole file at once)",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="upsert only rows on or after the latest loaded departure date instead of rebuilding",
+    )
+    args = parser.parse_args()
+    load_data(chunk_size=args.chunk_size, incremental=args.incremental)
@@ -1,29 +1,52 @@
-
+import argparse
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
-import os
 from dotenv import load_dotenv
-from snowflake.connector import connect
-from sqlalchemy import create_engine
-from sqlalchemy import text
-from snowflake.sqlalchemy import URL
+from query_cache import new_data_version
+from rollups import rollup_statements
 
 load_dotenv()
 
-def load_data_to_snowflake():
-    
-    
-    print("=" * 60)
-    print("❄️  SNOWFLAKE DATA LOADER")
-    print("=" * 60)
-    print()
-    
-    print("🔄 Starting data load to Snowflake...")
-    print()
-    
-    
-    print("🔗 Connecting to Snowflake...")
-    connection_url = URL(
+
+CSV_PATH = 'Airline_Dataset.csv'
+WORK_DIR = 'snowflake_load'
+DEFAULT_CHUNK_SIZE = 250000
+DEFAULT_UPLOAD_WORKERS = 4
+
+column_mapping = {
+    'Passenger ID': 'passenger_id',
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Gender': 'gender',
+    'Age': 'age',
+    'Nationality': 'nationality',
+    'Airport Name': 'airport_name',
+    'Airport Country Code': 'airport_country_code',
+    'Country Name': 'country_name',
+    'Airport Continent': 'airport_continent',
+    'Continents': 'continents',
+    'Departure Date': 'departure_date',
+    'Arrival Airport': 'arrival_airport',
+    'Pilot Name': 'pilot_name',
+    'Flight Status': 'flight_status'
+}
+
+SNOWFLAKE_COLUMN_TYPES = {
+    column: 'INTEGER' if column == 'age' else 'DATE' if column == 'departure_date' else 'VARCHAR'
+    for column in column_mapping.values()
+}
+
+
+def snowflake_connect():
+    """Open a Snowflake connector connection from the .env settings"""
+    from snowflake.connector import connect
+
+    return connect(
         account=os.getenv('SNOWFLAKE_ACCOUNT'),
         user=os.getenv('SNOWFLAKE_USER'),
         password=os.getenv('SNOWFLAKE_PASSWORD'),
@@ -32,110 +55,404 @@ def load_data_to_snowflake():
         warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
         role=os.getenv('SNOWFLAKE_ROLE', 'ACCOUNTADMIN')
     )
-    
-    engine = create_engine(connection_url)
-    
-    
-    print("📂 Reading CSV file...")
+
+
+class LoadManifest:
+    """Progress of one bulk load, persisted so an interrupted run can resume
+
+    Each Parquet file moves through written -> uploaded -> loaded; a file is
+    only marked loaded after the COPY that ingested it has committed.
+    """
+
+    def __init__(self, path, source, run_id=None, files=None, split_done=False):
+        self.path = path
+        self.source = source
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.files = files or {}
+        self.split_done = split_done
+
+    @classmethod
+    def open(cls, path, source):
+        """Resume the manifest at path if it belongs to source and is unfinished"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path, source)
+        manifest = cls(path, data.get('source'), data.get('run_id'), data.get('files'), data.get('split_done', False))
+        if manifest.source != source or manifest.complete():
+            return cls(path, source)
+        return manifest
+
+    def complete(self):
+        return bool(self.files) and all(state == 'loaded' for state in self.files.values())
+
+    def resuming(self):
+        return bool(self.files) and not self.complete()
+
+    def files_in(self, *states):
+        return [name for name, state in sorted(self.files.items()) if state in states]
+
+    def mark(self, name, state):
+        self.files[name] = state
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'source': self.source,
+                'run_id': self.run_id,
+                'split_done': self.split_done,
+                'files': self.files,
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def source_fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return f"{os.path.abspath(csv_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def prepare_chunk(df):
+    """Rename to Snowflake column names and give the chunk real types"""
+    df = df.rename(columns=column_mapping)
+    df['departure_date'] = pd.to_datetime(df['departure_date'], format='%d-%m-%Y', errors='coerce').dt.date
+    df['age'] = pd.to_numeric(df['age'], errors='coerce').astype('Int64')
+    return df[list(column_mapping.values())]
+
+
+def write_parquet_files(csv_path, work_dir, manifest, chunk_size, watermark=None):
+    """Split the CSV into zstd Parquet files, skipping ones already written
+
+    With a watermark only rows departing on or after it (or with no date)
+    are kept, and chunks left empty are not written at all.
+    """
+    if manifest.split_done:
+        return
+    written = set(manifest.files)
+    for index, chunk in enumerate(pd.read_csv(csv_path, dtype=str, chunksize=chunk_size)):
+        name = f"aviation_data_{index:05d}.parquet"
+        if name in written:
+            continue
+        chunk = prepare_chunk(chunk)
+        if watermark is not None:
+            # As datetime64: a chunk with no parseable date is all NaT and not date objects
+            dates = pd.to_datetime(chunk['departure_date'])
+            chunk = chunk[dates.isna() | (dates >= pd.Timestamp(watermark))]
+            if chunk.empty:
+                continue
+        path = os.path.join(work_dir, name)
+        chunk.to_parquet(path, compression='zstd', index=False)
+        manifest.mark(name, 'written')
+        print(f"   📦 {name}: {len(chunk):,} rows")
+    manifest.split_done = True
+    manifest.save()
+
+
+def stage_location(stage, manifest):
+    return f"@{stage}/{manifest.run_id}"
+
+
+def upload_files(conn, work_dir, stage, manifest, workers):
+    """PUT every written file to the stage, several files at a time"""
+    pending = manifest.files_in('written')
+    if not pending:
+        return
+    location = stage_location(stage, manifest)
+
+    def put(name):
+        path = os.path.abspath(os.path.join(work_dir, name)).replace('\\', '/')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"PUT 'file://{path}' {location} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+        finally:
+            cursor.close()
+        return name
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(put, name) for name in pending]
+        for future in as_completed(futures):
+            name = future.result()
+            manifest.mark(name, 'uploaded')
+            print(f"   ⬆️  {name}")
+
+
+def copy_files(conn, table, stage, manifest):
+    """COPY uploaded files into table one at a time, recording each commit"""
+    location = stage_location(stage, manifest)
+    cursor = conn.cursor()
+    try:
+        for name in manifest.files_in('uploaded'):
+            cursor.execute(
+                f"COPY INTO {table} FROM {location} FILES = ('{name}') "
+                "FILE_FORMAT = (TYPE = PARQUET) MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE "
+                "ON_ERROR = ABORT_STATEMENT PURGE = TRUE"
+            )
+            manifest.mark(name, 'loaded')
+            print(f"   ✅ {name} copied into {table}")
+    finally:
+        cursor.close()
+
+
+def create_table_sql(table):
+    columns = ", ".join(f"{name} {sql_type}" for name, sql_type in SNOWFLAKE_COLUMN_TYPES.items())
+    return f"CREATE OR REPLACE TABLE {table} ({columns})"
+
+
+def bulk_load(conn, csv_path=CSV_PATH, work_dir=WORK_DIR, table='aviation_data',
+              stage='aviation_load_stage', chunk_size=DEFAULT_CHUNK_SIZE,
+              workers=DEFAULT_UPLOAD_WORKERS, restart=False, watermark=None):
+    """Parquet -> PUT -> COPY INTO table, resuming an interrupted run
+
+    conn only needs a DB-API cursor() that understands PUT and COPY, so a
+    local stand-in for the connector and stage can be passed in.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, 'manifest.json')
+    source = f"{source_fingerprint(csv_path)}:{table}:{watermark}"
+    manifest = LoadManifest(manifest_path, source) if restart else LoadManifest.open(manifest_path, source)
+
+    cursor = conn.cursor()
     try:
-        df = pd.read_csv('Airline_Dataset.csv')
-    except FileNotFoundError:
+        cursor.execute(f"CREATE STAGE IF NOT EXISTS {stage}")
+        if manifest.resuming():
+            print(f"🔁 Resuming load {manifest.run_id}: "
+                  f"{len(manifest.files_in('loaded'))} of {len(manifest.files)} files already loaded")
+        else:
+            for name in os.listdir(work_dir):
+                if name.endswith('.parquet'):
+                    os.remove(os.path.join(work_dir, name))
+            cursor.execute(create_table_sql(table))
+            manifest.save()
+    finally:
+        cursor.close()
+
+    print("📦 Writing compressed Parquet files...")
+    write_parquet_files(csv_path, work_dir, manifest, chunk_size, watermark)
+    print("⬆️  Uploading files to stage...")
+    upload_files(conn, work_dir, stage, manifest, workers)
+    print("📥 Copying files into the table...")
+    copy_files(conn, table, stage, manifest)
+    return manifest
+
+
+def table_exists(cursor, table):
+    cursor.execute(f"SHOW TABLES LIKE '{table}'")
+    return bool(cursor.fetchall())
+
+
+def current_watermark(cursor, table='aviation_data'):
+    """Latest departure date already loaded into table"""
+    return cursor.execute(f"SELECT MAX(departure_date) FROM {table}").fetchone()[0]
+
+
+def swap_in(cursor, staging, table):
+    """Atomically replace table with the fully loaded staging table"""
+    if table_exists(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} SWAP WITH {staging}")
+        cursor.execute(f"DROP TABLE {staging}")
+    else:
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+
+
+def record_data_version(cursor):
+    """Write a new data version to load_metadata; apps on every host drop their cached results
+
+    The table holds one row. Call it inside the transaction that changes
+    the data where there is one, so the version moves with the change.
+    """
+    version = new_data_version()
+    cursor.execute("DELETE FROM load_metadata")
+    cursor.execute(f"INSERT INTO load_metadata (data_version, loaded_at) SELECT '{version}', CURRENT_TIMESTAMP")
+    return version
+
+
+def create_load_metadata(cursor):
+    """The one-row table holding the data version apps read (see query_cache.WarehouseDataVersion)"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS load_metadata (data_version VARCHAR, loaded_at TIMESTAMP)")
+
+
+def merge_sql(source, table):
+    """MERGE source into table on passenger_id, touching only changed rows
+
+    The newest departure per passenger wins when source repeats an ID, so
+    the MERGE stays deterministic.
+    """
+    columns = list(column_mapping.values())
+    others = [column for column in columns if column != 'passenger_id']
+    changed = " OR ".join(f"t.{column} IS DISTINCT FROM s.{column}" for column in others)
+    updates = ", ".join(f"t.{column} = s.{column}" for column in others)
+    return (
+        f"MERGE INTO {table} t USING ("
+        f"SELECT * FROM {source} QUALIFY ROW_NUMBER() OVER "
+        f"(PARTITION BY passenger_id ORDER BY departure_date DESC NULLS LAST) = 1) s "
+        f"ON t.passenger_id = s.passenger_id "
+        f"WHEN MATCHED AND ({changed}) THEN UPDATE SET {updates} "
+        f"WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) "
+        f"VALUES ({', '.join('s.' + column for column in columns)})"
+    )
+
+
+def refresh_rollups(conn, table='aviation_data'):
+    """Rebuild the rollup tables from table; each is replaced atomically
+
+    A new data version follows, so results answered from the old rollups
+    in the meantime are not served again.
+    """
+    cursor = conn.cursor()
+    try:
+        for name, statement in rollup_statements(column_mapping.values(), 'snowflake', table, or_replace=True):
+            cursor.execute(statement)
+            print(f"   🧮 {name} rebuilt")
+        create_load_metadata(cursor)
+        record_data_version(cursor)
+    finally:
+        cursor.close()
+
+
+def full_load(conn, table='aviation_data', **options):
+    """Bulk load into a staging table, then swap it in so readers never see a partial table"""
+    staging = f"{table}_staging"
+    bulk_load(conn, table=staging, **options)
+    cursor = conn.cursor()
+    try:
+        create_load_metadata(cursor)
+        # SWAP is DDL and commits on its own; the version follows it straight away
+        swap_in(cursor, staging, table)
+        record_data_version(cursor)
+    finally:
+        cursor.close()
+
+
+def incremental_load(conn, table='aviation_data', **options):
+    """Bulk load rows on or after the watermark into a delta table and MERGE them
+
+    Returns (watermark, rows_inserted, rows_updated).
+    """
+    delta = f"{table}_delta"
+    cursor = conn.cursor()
+    try:
+        watermark = current_watermark(cursor, table)
+    finally:
+        cursor.close()
+    print(f"🔖 Watermark: departures on or after {watermark or 'the beginning'}")
+    bulk_load(conn, table=delta, watermark=watermark, **options)
+    cursor = conn.cursor()
+    try:
+        create_load_metadata(cursor)
+        cursor.execute("BEGIN")
+        try:
+            inserted, updated = cursor.execute(merge_sql(delta, table)).fetchone()[:2]
+            record_data_version(cursor)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute(f"DROP TABLE IF EXISTS {delta}")
+    finally:
+        cursor.close()
+    return watermark, inserted, updated
+
+
+def load_data_to_snowflake(chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_UPLOAD_WORKERS, restart=False,
+                           incremental=False):
+
+
+    print("=" * 60)
+    print("❄️  SNOWFLAKE DATA LOADER")
+    print("=" * 60)
+    print()
+
+    print("🔄 Starting data load to Snowflake...")
+    print()
+
+    if not os.path.exists(CSV_PATH):
         print("❌ Error: Airline_Dataset.csv not found!")
         print("   Make sure the CSV file is in the same directory as this script.")
         return
-    
-    
-    column_mapping = {
-        'Passenger ID': 'passenger_id',
-        'First Name': 'first_name',
-        'Last Name': 'last_name',
-        'Gender': 'gender',
-        'Age': 'age',
-        'Nationality': 'nationality',
-        'Airport Name': 'airport_name',
-        'Airport Country Code': 'airport_country_code',
-        'Country Name': 'country_name',
-        'Airport Continent': 'airport_continent',
-        'Continents': 'continents',
-        'Departure Date': 'departure_date',
-        'Arrival Airport': 'arrival_airport',
-        'Pilot Name': 'pilot_name',
-        'Flight Status': 'flight_status'
-    }
-    
-    df = df.rename(columns=column_mapping)
-    
-    
-    print("📅 Converting date column...")
-    df['departure_date'] = pd.to_datetime(df['departure_date'], errors='coerce')
-    
-    print(f"✅ Loaded {len(df):,} rows from CSV")
-    print(f"📋 Columns: {len(df.columns)}")
-    print()
-    
-    
-    print("📊 Sample data (first 3 rows):")
-    print(df.head(3).to_string())
-    print()
-    
-    
-    print("⬆️  Uploading to Snowflake...")
-    print("   (This may take a few minutes for large datasets)")
-    
+
+    print("🔗 Connecting to Snowflake...")
+    conn = snowflake_connect()
+
     try:
-        df.to_sql(
-            'aviation_data',
-            engine,
-            if_exists='replace',  
-            index=False,
-            chunksize=5000,
-            method='multi'
-        )
-        
-        print()
-        print("=" * 60)
-        print("✅ SUCCESS! Data loaded to Snowflake")
-        print("=" * 60)
-        print()
-        print(f"📊 Total rows loaded: {len(df):,}")
-        print(f"📍 Database: {os.getenv('SNOWFLAKE_DATABASE')}")
-        print(f"📍 Schema: {os.getenv('SNOWFLAKE_SCHEMA')}")
-        print(f"📍 Table: aviation_data")
-        print()
-        
-       
-        print("🔍 Verifying data in Snowflake...")
-        with engine.connect() as conn:
-            result = conn.execute(text('SELECT COUNT(*) as count FROM aviation_data'))
-            print(result.fetchone())
-            row_count = result.fetchone()[0]
+        options = {'chunk_size': chunk_size, 'workers': workers, 'restart': restart}
+        if incremental:
+            cursor = conn.cursor()
+            try:
+                incremental = table_exists(cursor, 'aviation_data')
+            finally:
+                cursor.close()
+            if not incremental:
+                print("ℹ️  aviation_data does not exist yet; running a full load instead")
+
+        start = time.perf_counter()
+        if incremental:
+            _, inserted, updated = incremental_load(conn, **options)
+            print(f"🔁 Merged: {inserted:,} rows inserted, {updated:,} rows updated")
+        else:
+            full_load(conn, **options)
+        print("🧮 Rebuilding rollup tables...")
+        refresh_rollups(conn)
+        elapsed = time.perf_counter() - start
+
+        cursor = conn.cursor()
+        try:
+            print()
+            print("=" * 60)
+            print("✅ SUCCESS! Data loaded to Snowflake")
+            print("=" * 60)
+            print()
+
+            print("🔍 Verifying data in Snowflake...")
+            row_count = cursor.execute('SELECT COUNT(*) AS count FROM aviation_data').fetchone()[0]
             print(f"✅ Verification: {row_count:,} rows confirmed in Snowflake table")
-            
-            
-            result = conn.execute("SELECT nationality, COUNT(*) as count FROM aviation_data GROUP BY nationality ORDER BY count DESC LIMIT 5")
+            print(f"🚀 Throughput: {row_count / elapsed:,.0f} rows/s over {elapsed:.1f}s")
+            print(f"📍 Database: {os.getenv('SNOWFLAKE_DATABASE')}")
+            print(f"📍 Schema: {os.getenv('SNOWFLAKE_SCHEMA')}")
+            print(f"📍 Table: aviation_data")
+
+            cursor.execute(
+                "SELECT nationality, COUNT(*) as count FROM aviation_data "
+                "GROUP BY nationality ORDER BY count DESC LIMIT 5"
+            )
             print()
             print("🌍 Top 5 Nationalities:")
-            for row in result:
+            for row in cursor.fetchall():
                 print(f"   {row[0]}: {row[1]:,} passengers")
-        
+        finally:
+            cursor.close()
+
         print()
         print("=" * 60)
         print("🎉 All done! Your data is now in Snowflake!")
         print("=" * 60)
-        
+
     except Exception as e:
         print()
         print("❌ Error during upload:")
         print(f"   {e}")
         print()
         print("💡 Troubleshooting tips:")
-        print("   1. Check that the aviation_data table exists in Snowflake")
+        print("   1. Re-run this script to resume from the last committed file")
         print("   2. Verify your .env credentials are correct")
         print("   3. Ensure your Snowflake warehouse is running")
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load Airline_Dataset.csv into Snowflake")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per Parquet file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_UPLOAD_WORKERS, help="parallel PUT uploads")
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished load and start over")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="MERGE only rows on or after the latest loaded departure date instead of rebuilding",
+    )
+    args = parser.parse_args()
     try:
-        load_data_to_snowflake()
+        load_data_to_snowflake(chunk_size=args.chunk_size, workers=args.workers, restart=args.restart,
+                               incremental=args.incremental)
     except Exception as e:
         print()
         print("❌ Error:", e)
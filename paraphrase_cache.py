@@ -0,0 +1,191 @@
+"""
+Paraphrase Cache
+
+Reuses the SQL of an earlier question that asks the same thing in other
+words ("passengers per nationality" / "how many travelers from each
+nationality"). Questions are canonicalized, turned into TF-IDF weighted
+character n-gram vectors and looked up by cosine similarity through an
+inverted index built from the translation cache, all in-process. A match
+also has to mention the same specifics (numbers, columns, values and any
+other uncommon word), so "passengers from Japan" never reuses the SQL
+for "passengers from China".
+"""
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from query_cache import normalize_question
+
+
+# Phrasings folded onto one canonical word before vectorizing
+CANONICAL_PHRASES = [
+    (r"\b(?:how many|number of|count of|total number of|amount of)\b", "count"),
+    (r"\b(?:travell?ers?|people|persons?|flyers?|passengers?|customers?)\b", "passengers"),
+    (r"\b(?:from each|for each|in each|per|each|grouped by|broken down by|split by|across)\b", "by"),
+    (r"\b(?:show me|show|list|give me|display|what are|what is|what's|which are)\b", ""),
+]
+
+# Words dropped before vectorizing: they change the wording, not the question
+FILLER_WORDS = {
+    'the', 'a', 'an', 'are', 'is', 'were', 'was', 'there', 'me', 'please', 'do', 'does', 'did', 'we', 'have',
+    'has', 'i', 'what', 'which', 'look', 'like', 'can', 'you', 'tell', 'overall',
+}
+
+# Words that carry no specifics; every other word has to match between paraphrases
+GENERIC_WORDS = FILLER_WORDS | {
+    'count', 'passenger', 'by', 'of', 'all', 'in', 'total', 'and', 'for', 'from', 'with', 'to', 'how', 'many',
+    'number', 'breakdown', 'distribution', 'each', 'per',
+}
+
+WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)?")
+
+
+def _singular(word):
+    if word in GENERIC_WORDS or word.endswith(('ss', 'us', 'is')):
+        return word
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def canonicalize(question):
+    text = normalize_question(question)
+    text = re.sub(r"[?!.,;:\"]+", " ", text)
+    for pattern, replacement in CANONICAL_PHRASES:
+        text = re.sub(pattern, replacement, text)
+    words = [_singular(word) for word in text.split() if word not in FILLER_WORDS]
+    if 'by' in words:
+        # "passengers by nationality" already means counting them
+        words = [word for word in words if word != 'count']
+    return " ".join(words)
+
+
+def anchors(question):
+    """Words of question that have to match exactly for its SQL to be reused"""
+    words = WORD.findall(canonicalize(question))
+    # Counting passengers and listing them are different questions
+    return {word for word in words if word not in GENERIC_WORDS or word == 'count'}
+
+
+def ngrams(text, sizes=(3, 4, 5)):
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1))
+
+
+class ParaphraseMatch:
+    """SQL reused from an earlier question"""
+
+    def __init__(self, sql, question, score):
+        self.sql = sql
+        self.question = question
+        self.score = score
+
+
+class ParaphraseIndex:
+    """Cosine nearest neighbours over TF-IDF character n-gram vectors"""
+
+    def __init__(self, entries=()):
+        self.questions = []
+        self.sqls = []
+        self.anchor_sets = []
+        self._postings = defaultdict(list)
+        self._idf = {}
+        self._default_idf = 1.0
+        self.build(entries)
+
+    def build(self, entries):
+        self.questions = [question for question, _ in entries]
+        self.sqls = [sql for _, sql in entries]
+        self.anchor_sets = [anchors(question) for question in self.questions]
+        counts = [ngrams(canonicalize(question)) for question in self.questions]
+        document_frequency = Counter(gram for grams in counts for gram in grams)
+        total = len(counts)
+        # Smoothed idf; n-grams never seen get the largest weight
+        self._idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        self._default_idf = math.log(1 + total) + 1
+        self._postings = defaultdict(list)
+        for doc, grams in enumerate(counts):
+            for gram, weight in self._vector(grams).items():
+                self._postings[gram].append((doc, weight))
+
+    def _vector(self, grams):
+        weights = {gram: (1 + math.log(tf)) * self._idf.get(gram, self._default_idf) for gram, tf in grams.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {gram: weight / norm for gram, weight in weights.items()}
+
+    def nearest(self, question, k=5):
+        """[(score, index)] of the k most similar stored questions"""
+        scores = defaultdict(float)
+        for gram, weight in self._vector(ngrams(canonicalize(question))).items():
+            for doc, doc_weight in self._postings.get(gram, ()):
+                scores[doc] += weight * doc_weight
+        return sorted(((score, doc) for doc, score in scores.items()), reverse=True)[:k]
+
+    def __len__(self):
+        return len(self.questions)
+
+
+class ParaphraseCache:
+    """Paraphrase lookups over a TranslationCache, re-indexed whenever it changes"""
+
+    def __init__(self, translation_cache, threshold=0.85):
+        self.translation_cache = translation_cache
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index = ParaphraseIndex()
+        self._indexed = None
+        self.lookups = 0
+        self.hits = 0
+        self.rejected_anchors = 0
+        self.rebuilds = 0
+
+    def _current_index(self, context):
+        revision = (context, self.translation_cache.revision(context))
+        with self._lock:
+            if revision != self._indexed:
+                self._index = ParaphraseIndex(self.translation_cache.entries(context))
+                self._indexed = revision
+                self.rebuilds += 1
+            return self._index
+
+    def lookup(self, question, context):
+        """ParaphraseMatch for the closest earlier question above the threshold, or None"""
+        index = self._current_index(context)
+        wanted = anchors(question)
+        normalized = normalize_question(question)
+        match = None
+        rejected = False
+        for score, doc in index.nearest(question):
+            if score < self.threshold:
+                break
+            if index.questions[doc] == normalized:
+                continue
+            if index.anchor_sets[doc] != wanted:
+                rejected = True
+                continue
+            match = ParaphraseMatch(index.sqls[doc], index.questions[doc], score)
+            break
+        with self._lock:
+            self.lookups += 1
+            if match:
+                self.hits += 1
+            elif rejected:
+                self.rejected_anchors += 1
+        if match:
+            self.translation_cache.record_paraphrase(question, match.question, match.score, context)
+        return match
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "rejected_anchors": self.rejected_anchors,
+                "indexed": len(self._index),
+                "rebuilds": self.rebuilds,
+            }
@@ -0,0 +1,446 @@
+"""
+Query Caches
+
+On-disk caches shared by every Streamlit session and process on the host,
+so a question that was already answered doesn't pay for the same work twice.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+
+# Schema metadata entry that holds a cached result's profile
+PROFILE_METADATA_KEY = b"result_profile"
+
+SQL_TOKEN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted>"(?:[^"]|"")*")
+    |(?P<number>\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<space>\s+)
+    |(?P<symbol><>|!=|<=|>=|\|\||::|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def cache_dir():
+    """Root directory for on-disk caches (read lazily so .env applies)"""
+    return os.getenv("CACHE_DIR", ".cache")
+
+
+def data_version_file():
+    return os.getenv("DATA_VERSION_FILE", os.path.join(cache_dir(), "data_version"))
+
+
+def normalize_question(question):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return re.sub(r"[\s?.!;]+$", "", text)
+
+
+def canonicalize_sql(sql):
+    """Normalize whitespace, keyword/identifier case and literal formatting
+
+    String literals and quoted identifiers keep their exact contents; numeric
+    literals are rewritten to one canonical form (``5.50`` and ``5.5`` match)
+    without changing integer vs. decimal type.
+    """
+    tokens = []
+    for match in SQL_TOKEN.finditer(sql.strip().rstrip(";")):
+        kind, value = match.lastgroup, match.group()
+        if kind in ("comment", "space"):
+            continue
+        if kind == "word":
+            value = value.lower()
+        elif kind == "number":
+            if value.isdigit():
+                value = str(int(value))
+            else:
+                try:
+                    value = format(Decimal(value).normalize(), "f")
+                except InvalidOperation:
+                    pass
+                if "." not in value:
+                    value += ".0"
+        tokens.append(value)
+    return " ".join(tokens)
+
+
+def get_data_version():
+    """Current data version written by the loaders ("0" if never loaded)"""
+    try:
+        with open(data_version_file()) as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def new_data_version():
+    """A unique version string (time + random suffix)"""
+    return f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def bump_data_version():
+    """Mark aviation_data as reloaded so cached results are invalidated"""
+    path = data_version_file()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    version = new_data_version()
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+
+class WarehouseDataVersion:
+    """Data version the Snowflake loader keeps in the load_metadata table
+
+    Calling it returns the current version. The table is read at most once
+    every poll_seconds, so app hosts other than the one that ran the loader
+    see a reload within that interval. If the table can't be read, the last
+    version seen is kept ("0" before the first read).
+    """
+
+    def __init__(self, engine, poll_seconds=30.0):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._version = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def __call__(self):
+        from sqlalchemy import text
+
+        with self._lock:
+            now = time.monotonic()
+            if self._version is not None and now - self._read_at < self.poll_seconds:
+                return self._version
+            try:
+                with self.engine.connect() as conn:
+                    row = conn.execute(text("SELECT data_version FROM load_metadata")).fetchone()
+                version = str(row[0]) if row and row[0] else "0"
+            except Exception:
+                version = self._version or "0"
+            self._version = version
+            self._read_at = now
+            self.reads += 1
+            return version
+
+
+def fingerprint(*parts):
+    """Stable SHA-256 fingerprint of one or more strings"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class TranslationCache:
+    """Persistent NL-to-SQL cache with size and TTL eviction
+
+    Entries are keyed on the normalized question plus a context fingerprint
+    (schema + model URL), so changing the schema makes old translations
+    unreachable. Rows of other contexts are left alone (apps on different
+    backends may share the cache) and age out by TTL and LRU like any other.
+    """
+
+    def __init__(self, path=None, max_entries=5000, ttl_seconds=7 * 24 * 3600):
+        self.path = path or os.path.join(cache_dir(), "translations.db")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, context TEXT, question TEXT, sql TEXT, "
+                "created_at REAL, last_used REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS paraphrase_matches ("
+                "question TEXT, matched_question TEXT, score REAL, context TEXT, used_at REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _bump(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, question, context):
+        """Return the cached SQL for question under context, or None"""
+        key = fingerprint(normalize_question(question), context)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sql, created_at FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._bump(conn, "misses")
+                return None
+            conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+            self._bump(conn, "hits")
+            return row[0]
+
+    def put(self, question, context, sql):
+        """Store a translation and evict stale, expired and overflow entries"""
+        normalized = normalize_question(question)
+        key = fingerprint(normalized, context)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                (key, context, normalized, sql, now, now),
+            )
+            conn.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM translations WHERE key NOT IN "
+                "(SELECT key FROM translations ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, question, context):
+        """Drop the translation of question under context (its SQL failed)"""
+        key = fingerprint(normalize_question(question), context)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+
+    def entries(self, context):
+        """(question, sql) for every live translation under context"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT question, sql FROM translations WHERE context = ? AND created_at >= ? ORDER BY created_at",
+                (context, time.time() - self.ttl_seconds),
+            ).fetchall()
+
+    def revision(self, context):
+        """Changes whenever translations under context are added or removed"""
+        with self._connect() as conn:
+            return tuple(conn.execute(
+                "SELECT COUNT(*), MAX(created_at), MIN(created_at) FROM translations WHERE context = ?", (context,)
+            ).fetchone())
+
+    def record_paraphrase(self, question, matched_question, score, context):
+        """Log that question reused the SQL of matched_question"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO paraphrase_matches VALUES (?, ?, ?, ?, ?)",
+                (normalize_question(question), matched_question, score, context, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM paraphrase_matches WHERE rowid NOT IN "
+                "(SELECT rowid FROM paraphrase_matches ORDER BY used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._bump(conn, "paraphrase_hits")
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            size = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": size,
+            "paraphrase_hits": counters.get("paraphrase_hits", 0),
+        }
+
+
+class ResultCache:
+    """Two-tier (memory + Parquet on disk) LRU cache for query results
+
+    Keys are the canonicalized SQL plus a namespace (the target database) and
+    the current data version, so a reload by either loader makes every older
+    entry unreachable; stale Parquet files are removed on the next access.
+    data_version() returns that version (default: get_data_version).
+    """
+
+    def __init__(self, namespace="", directory=None, memory_budget_bytes=256 * 1024 ** 2,
+                 disk_budget_bytes=2 * 1024 ** 3, data_version=None):
+        self.namespace = namespace
+        self._data_version = data_version or get_data_version
+        self.directory = os.path.join(
+            directory or os.path.join(cache_dir(), "results"), fingerprint(namespace)[:16]
+        )
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _key(self, sql):
+        return fingerprint(self.namespace, canonicalize_sql(sql))
+
+    def _version_dir(self, version):
+        return os.path.join(self.directory, fingerprint(version)[:16])
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._memory.clear()
+            self._memory_bytes = 0
+            current = os.path.basename(self._version_dir(version))
+            for name in os.listdir(self.directory):
+                if name != current:
+                    self._remove_tree(os.path.join(self.directory, name))
+            self._version = version
+        return self._version_dir(version)
+
+    def _remove_tree(self, path):
+        if not os.path.isdir(path):
+            return
+        for name in os.listdir(path):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def _remember(self, key, table):
+        if table.nbytes > self.memory_budget_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        self._memory[key] = table
+        self._memory_bytes += table.nbytes
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _enforce_disk_budget(self, version_dir):
+        files = []
+        for name in os.listdir(version_dir):
+            path = os.path.join(version_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_budget_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get(self, sql):
+        """Return a cached DataFrame for sql, or None"""
+        import pyarrow.parquet as pq
+
+        key = self._key(sql)
+        version = self._data_version()
+        with self._lock:
+            version_dir = self._check_version(version)
+            table = self._memory.get(key)
+            if table is not None:
+                self._memory.move_to_end(key)
+            else:
+                path = os.path.join(version_dir, f"{key}.parquet")
+                try:
+                    table = pq.read_table(path)
+                    os.utime(path)
+                    self._remember(key, table)
+                except (OSError, ValueError):
+                    table = None
+            if table is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return table.to_pandas()
+
+    def get_profile(self, sql):
+        """The result profile stored with sql's cached result, or None"""
+        import pyarrow.parquet as pq
+
+        key = self._key(sql)
+        version = self._data_version()
+        with self._lock:
+            version_dir = self._check_version(version)
+            table = self._memory.get(key)
+            try:
+                schema = table.schema if table is not None else pq.read_schema(
+                    os.path.join(version_dir, f"{key}.parquet")
+                )
+            except (OSError, ValueError):
+                return None
+        stored = (schema.metadata or {}).get(PROFILE_METADATA_KEY)
+        return json.loads(stored) if stored else None
+
+    def put(self, sql, df, profile=None):
+        """Store df as Arrow in memory and as compressed Parquet on disk
+
+        profile (see result_profile) is kept in the table's schema metadata,
+        so it is read back with the result instead of being recomputed.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            return
+        if profile is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[PROFILE_METADATA_KEY] = json.dumps(profile, default=str).encode()
+            table = table.replace_schema_metadata(metadata)
+        key = self._key(sql)
+        version = self._data_version()
+        with self._lock:
+            version_dir = self._check_version(version)
+            os.makedirs(version_dir, exist_ok=True)
+            self._remember(key, table)
+            path = os.path.join(version_dir, f"{key}.parquet")
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+            self._enforce_disk_budget(version_dir)
+
+    def stats(self):
+        """Hit/miss counters and memory/disk usage"""
+        with self._lock:
+            version_dir = self._version_dir(self._version or self._data_version())
+            disk_bytes = 0
+            if os.path.isdir(version_dir):
+                disk_bytes = sum(
+                    os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir)
+                )
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": disk_bytes,
+            }
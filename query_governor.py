@@ -0,0 +1,480 @@
+"""
+Query Governor
+
+Keeps generated SQL from running away on the database. Statements run
+inside QueryGovernor.limit() share a deadline: on SQLite a progress
+handler aborts them, on DuckDB the connection is interrupted and on
+Snowflake the session's STATEMENT_TIMEOUT_IN_SECONDS has the warehouse
+stop them. The same hooks let the owner cancel a running statement
+(Snowflake queries are aborted with SYSTEM$CANCEL_ALL_QUERIES).
+Connections are armed and disarmed by pool checkout/checkin events, so
+raw DB-API cursors are covered as well as pandas/SQLAlchemy reads.
+
+preflight() reads the plan (EXPLAIN) before a query runs and reports
+Cartesian joins and estimated work over budget, so they can be refused
+before they start.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+
+from sqlalchemy import event, text
+
+
+# VM instructions between SQLite progress-handler checks
+SQLITE_PROGRESS_STEPS = 10000
+# A join of two inputs this large with no join condition is reported as Cartesian
+CARTESIAN_MIN_ROWS = 1000
+
+_local = threading.local()
+
+
+class QueryTimeout(Exception):
+    """A statement ran past the query timeout and was stopped"""
+
+
+class QueryCancelled(Exception):
+    """A statement was stopped because its owner cancelled it"""
+
+
+class QueryBudget:
+    """Deadline and cancel switch shared by the statements of one governed query"""
+
+    def __init__(self, timeout_seconds, interrupt):
+        self.timeout_seconds = timeout_seconds
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self.cancelled = False
+        self.timed_out = False
+        self._interrupt = interrupt
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def should_stop(self):
+        """SQLite progress handler: a true result aborts the running statement"""
+        if self.cancelled:
+            return 1
+        if self.expired():
+            self.timed_out = True
+            return 1
+        return 0
+
+    def attach(self, dbapi_connection):
+        with self._lock:
+            self._connections.append(dbapi_connection)
+        if self.cancelled:
+            self._interrupt(dbapi_connection)
+
+    def detach(self, dbapi_connection):
+        with self._lock:
+            if dbapi_connection in self._connections:
+                self._connections.remove(dbapi_connection)
+
+    def _interrupt_all(self):
+        with self._lock:
+            connections = list(self._connections)
+        for dbapi_connection in connections:
+            try:
+                self._interrupt(dbapi_connection)
+            except Exception:
+                pass
+
+    def cancel(self):
+        """Stop the statements running under this budget (callable from any thread)"""
+        self.cancelled = True
+        self._interrupt_all()
+
+    def expire(self):
+        self.timed_out = True
+        self._interrupt_all()
+
+
+class Preflight:
+    """What the plan of a query revealed before it ran"""
+
+    def __init__(self, cartesian=False, estimated_rows=None, scan_bytes=None, problems=None):
+        self.cartesian = cartesian
+        self.estimated_rows = estimated_rows
+        self.scan_bytes = scan_bytes
+        self.problems = problems or []
+
+
+def _plan_estimate(node):
+    """Estimated rows a DuckDB plan node outputs (a cross product multiplies its inputs)"""
+    children = [_plan_estimate(child) for child in node.get('children', [])]
+    estimate = node.get('extra_info', {}).get('Estimated Cardinality')
+    if estimate is not None:
+        try:
+            return int(estimate)
+        except (TypeError, ValueError):
+            pass
+    if node.get('name') == 'CROSS_PRODUCT' and children:
+        return math.prod(children)
+    return max(children, default=0)
+
+
+def _source_name(source):
+    return (source.alias_or_name or '').lower()
+
+
+def _qualifiers(condition):
+    """(table qualifiers, unqualified column count) of the columns in condition"""
+    from sqlglot import exp
+
+    columns = list(condition.find_all(exp.Column))
+    return {column.table.lower() for column in columns if column.table}, sum(1 for column in columns if not column.table)
+
+
+def _unconnected_joins(sql, dialect):
+    """[(earlier sources, source)] for every join in sql with no predicate at all
+
+    Sources are the sqlglot Table or Subquery expressions being joined.
+    Every WHERE or ON conjunct that refers to two sources of the same
+    SELECT links them, and USING or NATURAL links a source to the ones
+    before it. A join has no predicate when nothing links its source,
+    directly or through other sources, to an earlier one: ON 1=1, ON TRUE
+    or an ON that only filters one side all count as none. Conjuncts on
+    unqualified columns are given the benefit of the doubt.
+    """
+    from sqlglot import exp, parse_one
+
+    found = []
+    for select in parse_one(sql, read=dialect).find_all(exp.Select):
+        from_clause = select.args.get('from_') or select.args.get('from')
+        joins = select.args.get('joins') or []
+        if from_clause is None or not joins:
+            continue
+        sources = [from_clause.this] + [join.this for join in joins]
+        names = [_source_name(source) for source in sources]
+        groups = list(range(len(sources)))
+
+        def group(index):
+            while groups[index] != index:
+                index = groups[index]
+            return index
+
+        def link(indexes):
+            indexes = [group(index) for index in indexes]
+            for index in indexes[1:]:
+                groups[index] = indexes[0]
+
+        for position, join in enumerate(joins, start=1):
+            if join.args.get('using') or (join.args.get('method') or '').upper() == 'NATURAL':
+                link(range(position + 1))
+        for clause in [select.args.get('where')] + [join.args.get('on') for join in joins]:
+            if clause is None:
+                continue
+            condition = clause.this if isinstance(clause, exp.Where) else clause
+            for conjunct in condition.flatten() if isinstance(condition, exp.And) else [condition]:
+                tables, unqualified = _qualifiers(conjunct)
+                if unqualified and len(tables) + unqualified >= 2:
+                    # An unqualified column may belong to any source
+                    link(range(len(sources)))
+                else:
+                    link([index for index, name in enumerate(names) if name in tables])
+        for position in range(1, len(sources)):
+            if all(group(position) != group(index) for index in range(position)):
+                found.append((sources[:position], sources[position]))
+    return found
+
+
+def _walk(node):
+    yield node
+    for child in node.get('children', []):
+        yield from _walk(child)
+
+
+class QueryGovernor:
+    """Timeouts, cancellation and plan checks for queries on one engine
+
+    max_rows caps the estimated rows the largest step of a plan processes
+    (SQLite and DuckDB plans); max_scan_bytes caps the bytes a Snowflake
+    plan is assigned to scan. SQLite table sizes are read again whenever
+    data_version() changes.
+    """
+
+    def __init__(self, engine, dialect, timeout_seconds=120.0, max_rows=100_000_000,
+                 max_scan_bytes=10 * 1024 ** 3, data_version=None):
+        self.engine = engine
+        self.dialect = dialect
+        self.timeout_seconds = timeout_seconds
+        self.max_rows = max_rows
+        self.max_scan_bytes = max_scan_bytes
+        self._data_version = data_version or (lambda: None)
+        self._lock = threading.Lock()
+        self._statistics_version = None
+        self._table_rows = {}
+        self._index_rows = {}
+        self.governed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.checked = 0
+        self.flagged = 0
+        self.cartesian = 0
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _interrupt(self, dbapi_connection):
+        if self.dialect == 'snowflake':
+            session_id = getattr(dbapi_connection, 'session_id', None)
+            if session_id:
+                with self.engine.connect() as conn:
+                    conn.execute(text("SELECT SYSTEM$CANCEL_ALL_QUERIES(:session_id)"), {"session_id": session_id})
+        elif self.dialect != 'sqlite':
+            # SQLite polls the budget from its progress handler instead
+            dbapi_connection.interrupt()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        budget = getattr(_local, 'budget', None)
+        if self.dialect == 'snowflake':
+            timeout = int(math.ceil(budget.timeout_seconds)) if budget and budget.timeout_seconds else None
+            if connection_record.info.get('statement_timeout') != timeout:
+                cursor = dbapi_connection.cursor()
+                try:
+                    if timeout:
+                        cursor.execute(f"ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {timeout}")
+                    else:
+                        cursor.execute("ALTER SESSION UNSET STATEMENT_TIMEOUT_IN_SECONDS")
+                finally:
+                    cursor.close()
+                connection_record.info['statement_timeout'] = timeout
+        if budget is None:
+            return
+        connection_record.info['query_budget'] = budget
+        if self.dialect == 'sqlite':
+            dbapi_connection.set_progress_handler(budget.should_stop, SQLITE_PROGRESS_STEPS)
+        budget.attach(dbapi_connection)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        budget = connection_record.info.pop('query_budget', None)
+        if budget is None or dbapi_connection is None:
+            return
+        budget.detach(dbapi_connection)
+        if self.dialect == 'sqlite':
+            dbapi_connection.set_progress_handler(None, 0)
+
+    def limit(self, timeout_seconds=None):
+        """Context manager: statements inside stop at the timeout or on budget.cancel()
+
+        Raises QueryTimeout or QueryCancelled in place of the driver's error.
+        Nested calls share the outer budget.
+        """
+        return _Limit(self, self.timeout_seconds if timeout_seconds is None else timeout_seconds)
+
+    def _record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def preflight(self, sql):
+        """Preflight for sql; a plan that cannot be read reports no problems"""
+        try:
+            if self.dialect == 'sqlite':
+                plan = self._sqlite_preflight(sql)
+            elif self.dialect == 'duckdb':
+                plan = self._duckdb_preflight(sql)
+            elif self.dialect == 'snowflake':
+                plan = self._snowflake_preflight(sql)
+            else:
+                return Preflight()
+        except (QueryTimeout, QueryCancelled):
+            raise
+        except Exception:
+            return Preflight()
+        with self._lock:
+            self.checked += 1
+            if plan.problems:
+                self.flagged += 1
+            if plan.cartesian:
+                self.cartesian += 1
+        return plan
+
+    def _problems(self, plan, joined=()):
+        if plan.cartesian:
+            tables = " and ".join(joined) or "two inputs"
+            size = f" (~{plan.estimated_rows:,} row pairs)" if plan.estimated_rows else ""
+            plan.problems.append(f"The query joins {tables} without a join condition, a Cartesian join{size}.")
+        if plan.estimated_rows is not None and plan.estimated_rows > self.max_rows:
+            plan.problems.append(
+                f"The plan processes an estimated {plan.estimated_rows:,} rows, "
+                f"over the {self.max_rows:,}-row budget."
+            )
+        if plan.scan_bytes is not None and plan.scan_bytes > self.max_scan_bytes:
+            plan.problems.append(
+                f"The plan scans {plan.scan_bytes / 1024 ** 3:,.1f} GB, "
+                f"over the {self.max_scan_bytes / 1024 ** 3:,.1f} GB budget."
+            )
+        return plan
+
+    def _sqlite_statistics(self, conn, tables):
+        """(rows per table, rows per index key) from sqlite_stat1, counting tables it lacks"""
+        version = self._data_version()
+        with self._lock:
+            if self._statistics_version != version:
+                self._table_rows, self._index_rows = {}, {}
+                try:
+                    stats = conn.execute(text("SELECT tbl, idx, stat FROM sqlite_stat1")).fetchall()
+                except Exception:
+                    stats = []
+                for table, index, stat in stats:
+                    numbers = [int(value) for value in str(stat).split()[:2] if value.isdigit()]
+                    if numbers:
+                        self._table_rows[table.lower()] = numbers[0]
+                    if index and len(numbers) > 1:
+                        self._index_rows[index.lower()] = numbers[1]
+                self._statistics_version = version
+            missing = [table for table in tables if table not in self._table_rows]
+        for table in missing:
+            try:
+                rows = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+            except Exception:
+                continue
+            with self._lock:
+                self._table_rows[table] = int(rows or 0)
+        return self._table_rows, self._index_rows
+
+    def _sqlite_table_aliases(self, sql):
+        """{name or alias: table} for the base tables sql reads"""
+        from sqlglot import exp, parse_one
+
+        aliases = {}
+        for table in parse_one(sql, read='sqlite').find_all(exp.Table):
+            aliases[table.name.lower()] = table.name.lower()
+            if table.alias:
+                aliases[table.alias.lower()] = table.name.lower()
+        return aliases
+
+    def _sqlite_preflight(self, sql):
+        from sqlglot import exp
+
+        aliases = self._sqlite_table_aliases(sql)
+        with self.engine.connect() as conn:
+            steps = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+            table_rows, index_rows = self._sqlite_statistics(conn, set(aliases.values()))
+        # Loops of one SELECT share a parent; each nested loop multiplies the rows visited
+        levels = {}
+        for _, parent, _, detail in steps:
+            match = re.match(r"(SCAN|SEARCH) (\S+)(?: USING (?:COVERING )?INDEX (\S+))?", detail)
+            if not match:
+                continue
+            kind, name, index = match.groups()
+            table = aliases.get(name.lower())
+            rows = table_rows.get(table, 1) if table else 1
+            if kind == 'SEARCH':
+                rows = index_rows.get((index or '').lower(), 1)
+            levels.setdefault(parent, []).append((kind, table, rows))
+        plan = Preflight(estimated_rows=0)
+        for loops in levels.values():
+            plan.estimated_rows = max(plan.estimated_rows, math.prod(rows for _, _, rows in loops))
+        # Only joins with no predicate at all are Cartesian; range joins are costed, not flagged
+        joined = []
+
+        def size(source):
+            # A subquery is bounded by the largest table it reads
+            tables = [source] if isinstance(source, exp.Table) else list(source.find_all(exp.Table))
+            return max((table_rows.get(table.name.lower(), 0) for table in tables), default=0)
+
+        def label(source):
+            return source.name if isinstance(source, exp.Table) else 'a subquery'
+
+        for earlier, source in _unconnected_joins(sql, 'sqlite'):
+            if size(source) >= CARTESIAN_MIN_ROWS and max(map(size, earlier)) >= CARTESIAN_MIN_ROWS:
+                plan.cartesian = True
+                joined = [label(other) for other in earlier + [source]]
+        return self._problems(plan, joined)
+
+    def _duckdb_preflight(self, sql):
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).fetchall()
+        roots = json.loads(rows[0][1])
+        plan = Preflight(estimated_rows=0)
+        joined = []
+        for root in roots:
+            for node in _walk(root):
+                plan.estimated_rows = max(plan.estimated_rows, _plan_estimate(node))
+                # Joins with any condition (range joins included) plan as other operators
+                if node.get('name') == 'CROSS_PRODUCT':
+                    inputs = [_plan_estimate(child) for child in node.get('children', [])]
+                    if len(inputs) >= 2 and min(inputs) >= CARTESIAN_MIN_ROWS:
+                        plan.cartesian = True
+                        joined = [
+                            scan.get('extra_info', {}).get('Table', '').split('.')[-1] or 'a subquery'
+                            for scan in node.get('children', [])
+                        ]
+        return self._problems(plan, joined)
+
+    def _snowflake_preflight(self, sql):
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f"EXPLAIN USING JSON {sql}")).fetchone()
+        explained = json.loads(row[0])
+        stats = explained.get('GlobalStats', {})
+        plan = Preflight(scan_bytes=stats.get('bytesAssigned'))
+        operations = [op for group in explained.get('Operations', []) for op in group]
+        # Snowflake also plans non-equality joins as CartesianJoin plus a filter
+        plan.cartesian = any(op.get('operation') == 'CartesianJoin' for op in operations) and bool(
+            _unconnected_joins(sql, 'snowflake')
+        )
+        joined = sorted({
+            op['objects'][0].split('.')[-1] for op in operations
+            if op.get('operation') == 'TableScan' and op.get('objects')
+        }) if plan.cartesian else []
+        return self._problems(plan, joined)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "governed": self.governed,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "checked": self.checked,
+                "flagged": self.flagged,
+                "cartesian": self.cartesian,
+            }
+
+
+class _Limit:
+    """The context manager behind QueryGovernor.limit()"""
+
+    def __init__(self, governor, timeout_seconds):
+        self.governor = governor
+        self.timeout_seconds = timeout_seconds
+        self.budget = None
+        self._outer = None
+        self._timer = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, 'budget', None)
+        if self._outer is not None:
+            return self._outer
+        self.budget = QueryBudget(self.timeout_seconds, self.governor._interrupt)
+        _local.budget = self.budget
+        self.governor._record('governed')
+        if self.governor.dialect == 'duckdb' and self.timeout_seconds:
+            # DuckDB has no statement timeout: interrupt the connection at the deadline
+            self._timer = threading.Timer(self.timeout_seconds, self.budget.expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self.budget
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._outer is not None:
+            return False
+        _local.budget = None
+        if self._timer is not None:
+            self._timer.cancel()
+        budget = self.budget
+        if exc_type is None or issubclass(exc_type, (QueryTimeout, QueryCancelled)):
+            return False
+        if budget.cancelled:
+            self.governor._record('cancelled')
+            raise QueryCancelled("The query was cancelled.") from exc
+        if budget.timed_out or budget.expired():
+            self.governor._record('timeouts')
+            raise QueryTimeout(
+                f"The query was stopped after {budget.timeout_seconds:g} seconds (QUERY_TIMEOUT_SECONDS)."
+            ) from exc
+        return False
@@ -0,0 +1,301 @@
+"""
+Query Jobs
+
+Runs question -> SQL -> result pipelines in a bounded pool of background
+threads, so a slow warehouse query never blocks a Streamlit script run.
+submit() returns a job id straight away; the app polls get() for the job's
+status, progress and result. At most `workers` jobs run at once across the
+process and at most `per_user` per user; the rest wait in per-user queues
+that are served round-robin (fair) or oldest-first (fifo). Past a queue
+limit submit() refuses new work instead of letting the backlog grow.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_current = threading.local()
+
+
+class JobQueueFull(Exception):
+    """The queue (for everyone or for this user) is at its limit"""
+
+
+class JobCancelled(Exception):
+    """The running job was cancelled by its owner"""
+
+
+def current_job():
+    """The job the calling thread is running, or None outside a job worker"""
+    return getattr(_current, 'job', None)
+
+
+def checkpoint():
+    """Raise JobCancelled if the calling thread's job has been cancelled"""
+    job = current_job()
+    if job is not None and job.cancel_requested:
+        raise JobCancelled(f"Job {job.id} was cancelled")
+
+
+class Job:
+    """One submitted pipeline and what became of it"""
+
+    def __init__(self, job_id, seq, user, fn, args, kwargs, label=""):
+        self.id = job_id
+        self.seq = seq
+        self.user = user
+        self.label = label
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.progress = ""
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self._cancel_hooks = []
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def log(self, kind, message):
+        """Keep a message the job would have shown (kind: caption, info, warning, error)"""
+        self.messages.append((kind, message))
+
+    def set_progress(self, text):
+        self.progress = text
+
+    def on_cancel(self, hook):
+        """Call hook() when the job is cancelled, e.g. to interrupt its running query"""
+        self._cancel_hooks.append(hook)
+        if self.cancel_requested:
+            hook()
+
+    def _run_cancel_hooks(self):
+        for hook in list(self._cancel_hooks):
+            try:
+                hook()
+            except Exception:
+                pass
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def elapsed(self):
+        """Seconds since the job was submitted, or its total time once finished"""
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+
+class JobExecutor:
+    """Bounded worker pool with per-user and global concurrency caps
+
+    policy is 'fair' (users take turns, so one analyst's burst cannot starve
+    everyone else) or 'fifo' (oldest job first, skipping users at their
+    cap). Finished jobs are kept for retention_seconds for their owner to
+    collect.
+    """
+
+    def __init__(self, workers=4, per_user=2, max_queued=64, max_queued_per_user=8,
+                 policy='fair', retention_seconds=900, latency_window=500):
+        if policy not in ('fair', 'fifo'):
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.workers = workers
+        self.per_user = per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.policy = policy
+        self.retention_seconds = retention_seconds
+        self._condition = threading.Condition()
+        self._threads = []
+        self._jobs = OrderedDict()
+        self._queues = OrderedDict()
+        self._running = {}
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=latency_window)
+        self._run_times = deque(maxlen=latency_window)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"query-job-{len(self._threads) + 1}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, user, fn, *args, label="", **kwargs):
+        """Queue fn(*args, **kwargs) on behalf of user and return the job id"""
+        with self._condition:
+            self._prune()
+            queue = self._queues.get(user)
+            if self._queued() >= self.max_queued or (queue and len(queue) >= self.max_queued_per_user):
+                self.rejected += 1
+                raise JobQueueFull(
+                    f"{self._queued():,} queries are already waiting; please try again shortly."
+                    if self._queued() >= self.max_queued else
+                    f"You already have {len(queue):,} queries waiting; please wait for them to finish."
+                )
+            job = Job(uuid.uuid4().hex, next(self._seq), user, fn, args, kwargs, label=label)
+            self._jobs[job.id] = job
+            self._queues.setdefault(user, deque()).append(job)
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queued())
+            self._start_workers()
+            self._condition.notify()
+            return job.id
+
+    def _next_job(self):
+        """Take the next job a worker may start, or None (condition held)"""
+        if sum(self._running.values()) >= self.workers:
+            return None
+        eligible = [user for user, queue in self._queues.items() if queue and self._running.get(user, 0) < self.per_user]
+        if not eligible:
+            return None
+        if self.policy == 'fifo':
+            user = min(eligible, key=lambda name: self._queues[name][0].seq)
+        else:
+            # _queues is kept in turn order: the user served last moves to the back
+            user = eligible[0]
+        queue = self._queues.pop(user)
+        job = queue.popleft()
+        if queue:
+            self._queues[user] = queue
+        return job
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                self._running[job.user] = self._running.get(job.user, 0) + 1
+                self._waits.append(job.started_at - job.submitted_at)
+            _current.job = job
+            status = FAILED
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+                status = CANCELLED if job.cancel_requested else DONE
+            except BaseException as e:
+                # SystemExit or KeyboardInterrupt from a job fails that job, not the worker
+                job.error = e
+                status = CANCELLED if job.cancel_requested else FAILED
+            finally:
+                _current.job = None
+                self._finish(job, status)
+
+    def _finish(self, job, status):
+        """Record how job ended and give its user's slot back"""
+        with self._condition:
+            job.status = status
+            job.finished_at = time.monotonic()
+            job.fn = job.args = job.kwargs = None
+            job._cancel_hooks = []
+            self._running[job.user] -= 1
+            if not self._running[job.user]:
+                del self._running[job.user]
+            self._run_times.append(job.finished_at - job.started_at)
+            if status == DONE:
+                self.completed += 1
+            elif status == FAILED:
+                self.failed += 1
+            else:
+                self.cancelled += 1
+            self._condition.notify_all()
+
+    def get(self, job_id):
+        """The Job for job_id, or None once it has been collected or expired"""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """How many queued jobs were submitted before job_id (0 once it runs)"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return 0
+            return sum(1 for queue in self._queues.values() for other in queue if other.seq < job.seq)
+
+    def collect(self, job_id):
+        """Remove and return a finished job, or None if it is still pending"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or not job.finished:
+                return None
+            return self._jobs.pop(job_id)
+
+    def cancel(self, job_id):
+        """Drop a queued job, or flag a running one and interrupt its query
+
+        Returns False when the job is unknown or already finished.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_requested = True
+            running = job.status == RUNNING
+            if job.status == QUEUED:
+                queue = self._queues.get(job.user)
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.user]
+                job.status = CANCELLED
+                job.finished_at = time.monotonic()
+                job.fn = job.args = job.kwargs = None
+                self.cancelled += 1
+        if running:
+            # Outside the lock: an interrupt may have to reach the database
+            job._run_cancel_hooks()
+        return True
+
+    def stats(self):
+        with self._condition:
+            waits = sorted(self._waits)
+            run_times = sorted(self._run_times)
+            stats = {
+                "workers": self.workers,
+                "running": sum(self._running.values()),
+                "queued": self._queued(),
+                "users_waiting": sum(1 for queue in self._queues.values() if queue),
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
+        for name, values in (("wait", waits), ("run", run_times)):
+            for label, fraction in (("p50", 0.50), ("p95", 0.95)):
+                stats[f"{name}_{label}_ms"] = (
+                    values[min(len(values) - 1, int(fraction * len(values)))] * 1000 if values else 0.0
+                )
+        return stats
@@ -0,0 +1,189 @@
+"""
+Result Profile
+
+One pass over a query result that chart selection and every chart builder
+read from instead of re-scanning the frame: each column's kind, null
+count, cardinality, min/max and most common values, plus the correlation
+of the leading numeric columns. Numeric columns are summarised with
+NumPy; distinct counts of large numeric and date columns come from a
+HyperLogLog sketch. A profile is a plain dict that survives JSON, so it
+is cached with the result it describes.
+"""
+
+import math
+
+
+# Larger columns get an approximate distinct count
+EXACT_DISTINCT_ROWS = 200_000
+HLL_PRECISION = 14
+# Most common values kept per categorical column
+TOP_K = 20
+# Leading numeric columns the correlation matrix covers
+CORRELATION_COLUMNS = 5
+
+
+def approx_distinct(values, precision=HLL_PRECISION):
+    """HyperLogLog estimate of the number of distinct values in a NumPy array"""
+    import numpy as np
+    import pandas as pd
+
+    if len(values) == 0:
+        return 0
+    m = 1 << precision
+    hashes = pd.util.hash_array(values)
+    registers = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # Low bits set so the rank stays within the remaining 64 - precision bits
+    rest = (hashes << np.uint64(precision)) | np.uint64(m - 1)
+    rank = 64 - np.floor(np.log2(rest.astype(np.float64))).astype(np.int64)
+    maxima = np.zeros(m, dtype=np.int64)
+    np.maximum.at(maxima, registers, rank)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-maxima.astype(np.float64)))
+    empty = int(np.count_nonzero(maxima == 0))
+    if estimate <= 2.5 * m and empty:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * math.log(m / empty)
+    return int(round(estimate))
+
+
+def _plain(value):
+    """value as a JSON-friendly Python scalar"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _distinct(values):
+    import pandas as pd
+
+    if len(values) > EXACT_DISTINCT_ROWS:
+        return approx_distinct(values), True
+    return len(pd.unique(values)), False
+
+
+def _numeric_column(series):
+    import numpy as np
+
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = values[~np.isnan(values)]
+    distinct, approximate = _distinct(valid)
+    profile = {
+        "kind": "numeric",
+        "nulls": int(len(values) - len(valid)),
+        "distinct": distinct,
+        "approximate": approximate,
+        "min": None, "max": None, "mean": None, "std": None,
+    }
+    if len(valid):
+        profile.update(
+            min=_plain(valid.min()),
+            max=_plain(valid.max()),
+            mean=_plain(valid.mean()),
+            std=_plain(valid.std(ddof=1)) if len(valid) > 1 else None,
+        )
+    return profile
+
+
+def _datetime_column(series):
+    valid = series.dropna()
+    distinct, approximate = _distinct(valid.array.asi8)
+    return {
+        "kind": "datetime",
+        "nulls": int(len(series) - len(valid)),
+        "distinct": distinct,
+        "approximate": approximate,
+        "min": _plain(valid.min()) if len(valid) else None,
+        "max": _plain(valid.max()) if len(valid) else None,
+    }
+
+
+def _categorical_column(series):
+    # One hash pass gives the exact cardinality and the most common values
+    counts = series.value_counts(dropna=True)
+    nulls = int(len(series) - counts.sum())
+    ordered = counts.index.sort_values() if len(counts) else counts.index
+    try:
+        low, high = (_plain(ordered[0]), _plain(ordered[-1])) if len(ordered) else (None, None)
+    except TypeError:
+        low, high = None, None
+    return {
+        "kind": "categorical",
+        "nulls": nulls,
+        "distinct": int(len(counts)),
+        "approximate": False,
+        "min": low,
+        "max": high,
+        "top": [[_plain(value), int(count)] for value, count in counts.head(TOP_K).items()],
+    }
+
+
+def _correlation(df, numeric):
+    import numpy as np
+
+    columns = numeric[:CORRELATION_COLUMNS]
+    if len(columns) < 2:
+        return None
+    matrix = np.column_stack([df[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in columns])
+    if np.isnan(matrix).any():
+        # Pairwise-complete correlations, as pandas computes them
+        corr = df[columns].astype(float).corr().to_numpy()
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.corrcoef(matrix, rowvar=False)
+    return {"columns": columns, "matrix": [[_plain(value) for value in row] for row in corr]}
+
+
+def profile_frame(df):
+    """Profile every column of df in a single pass"""
+    import pandas as pd
+
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            columns[name] = _numeric_column(series)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            columns[name] = _datetime_column(series)
+        else:
+            columns[name] = _categorical_column(series)
+    numeric = [name for name, column in columns.items() if column["kind"] == "numeric"]
+    return {
+        "rows": len(df),
+        "columns": columns,
+        "correlation": _correlation(df, numeric),
+    }
+
+
+def matches(profile, df):
+    """Whether profile describes a frame shaped like df"""
+    return bool(profile) and profile.get("rows") == len(df) and list(profile.get("columns", {})) == list(df.columns)
+
+
+def numeric_columns(profile):
+    return [name for name, column in profile["columns"].items() if column["kind"] == "numeric"]
+
+
+def categorical_columns(profile):
+    """Every non-numeric column, dates included"""
+    return [name for name, column in profile["columns"].items() if column["kind"] != "numeric"]
+
+
+def top_values(profile, name, n):
+    """[(value, count)] of the n most common values of a categorical column"""
+    return [tuple(pair) for pair in profile["columns"][name].get("top", [])[:n]]
+
+
+def correlation(profile, columns):
+    """Correlation DataFrame of columns if the profile covers them, else None"""
+    import pandas as pd
+
+    stored = profile.get("correlation")
+    if not stored or any(col not in stored["columns"] for col in columns):
+        return None
+    positions = [stored["columns"].index(col) for col in columns]
+    matrix = [[stored["matrix"][i][j] for j in positions] for i in positions]
+    return pd.DataFrame(matrix, index=columns, columns=columns, dtype=float)
@@ -0,0 +1,261 @@
+"""
+Rollups
+
+Summary tables of aviation_data, grouped by the dimensions analysts break
+results down by, built by the loaders at load time. RollupRouter rewrites a
+generated query to read from the smallest rollup that can answer it, and
+leaves any query it cannot prove equivalent untouched.
+
+Every rollup keeps its dimensions as raw base columns (Age rather than an
+age band, Departure Date rather than a month), so any expression over them
+evaluates the same on the rollup as on the base table, plus the measures
+needed to re-aggregate: row_count and count/sum/min/max of Age.
+"""
+
+import threading
+
+from sqlglot import exp
+
+
+BASE_TABLE = 'aviation_data'
+MEASURE_COLUMN = 'Age'
+
+# Smallest first; the router picks the first rollup covering a query
+ROLLUPS = [
+    ('status_gender', ['Flight Status', 'Gender']),
+    ('continent_status', ['Airport Continent', 'Continents', 'Flight Status', 'Gender']),
+    ('age_status', ['Age', 'Gender', 'Flight Status']),
+    ('nationality_status', ['Nationality', 'Flight Status', 'Gender']),
+    ('country_status', ['Country Name', 'Airport Continent', 'Continents', 'Flight Status', 'Gender']),
+    ('departure_status', ['Departure Date', 'Flight Status', 'Gender']),
+    ('airport', ['Airport Name', 'Airport Country Code', 'Country Name', 'Airport Continent', 'Flight Status']),
+]
+
+
+def rollup_table(name):
+    return f"{BASE_TABLE}_rollup_{name}"
+
+
+def column_name(name, dialect):
+    """Base column name on a backend: Snowflake uses snake_case, the others the CSV headers"""
+    if dialect == 'snowflake':
+        return name.lower().replace(' ', '_')
+    return name
+
+
+def _identifier(name, dialect):
+    return exp.to_identifier(name).sql(dialect=dialect)
+
+
+def rollup_statements(columns, dialect, source=BASE_TABLE, or_replace=False):
+    """(table, CREATE TABLE ... AS SELECT) for every rollup source has the columns for"""
+    create = "CREATE OR REPLACE TABLE" if or_replace else "CREATE TABLE"
+    available = {column.lower() for column in columns}
+    age = column_name(MEASURE_COLUMN, dialect)
+    if age.lower() not in available:
+        return []
+    age_sql = _identifier(age, dialect)
+    measures = (
+        f"COUNT(*) AS row_count, COUNT({age_sql}) AS age_count, SUM({age_sql}) AS age_sum, "
+        f"MIN({age_sql}) AS age_min, MAX({age_sql}) AS age_max"
+    )
+    statements = []
+    for name, dims in ROLLUPS:
+        dims = [column_name(dim, dialect) for dim in dims]
+        if any(dim.lower() not in available for dim in dims):
+            continue
+        dim_sql = ", ".join(_identifier(dim, dialect) for dim in dims)
+        statements.append((
+            rollup_table(name),
+            f"{create} {rollup_table(name)} AS SELECT {dim_sql}, {measures} "
+            f"FROM {source} GROUP BY {dim_sql}",
+        ))
+    return statements
+
+
+def keep_projection_names(query, sql, positions, describe):
+    """Alias the rewritten projections at positions with the names the original sql returns
+
+    Returns False when the names can't be learnt (no describe, or names the
+    backend would disambiguate).
+    """
+    if describe is None:
+        return False
+    names = describe(f"SELECT * FROM ({sql}) AS name_probe WHERE 1 = 0")
+    if len(names) != len(query.expressions) or len(set(names)) != len(names):
+        return False
+    for index in positions:
+        projection = query.expressions[index]
+        projection.replace(exp.alias_(projection.copy(), names[index], quoted=True))
+    return True
+
+
+def _count(expression):
+    """A count re-aggregated from rollup rows, typed like COUNT (SUM widens integers on DuckDB)"""
+    total = exp.func('COALESCE', exp.func('SUM', expression), exp.Literal.number(0))
+    return exp.Cast(this=total, to=exp.DataType.build('BIGINT'))
+
+
+class RollupRouter:
+    """Rewrites aggregate queries over aviation_data to read from a rollup
+
+    tables_loader() returns the table names present in the database; it is
+    called again whenever data_version() changes. describe(sql) returns the
+    column names of a query; it is used to keep the names the database gives
+    unaliased aggregates, which differ once the aggregate is rewritten.
+    """
+
+    def __init__(self, dialect, tables_loader, data_version, describe=None):
+        self.dialect = dialect
+        self._tables_loader = tables_loader
+        self._describe = describe
+        self._data_version = data_version
+        self._tables = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.passed = 0
+
+    def _available(self):
+        version = self._data_version()
+        with self._lock:
+            if self._tables is None or self._version != version:
+                try:
+                    tables = {table.lower() for table in self._tables_loader()}
+                except Exception:
+                    tables = set()
+                self._tables = tables
+                self._version = version
+            return self._tables
+
+    def route(self, sql):
+        """Return (sql, rollup_table); rollup_table is None when sql is left as is"""
+        from sql_guard import parse_statement
+
+        try:
+            query = parse_statement(sql, self.dialect)
+            rewritten = self._rewrite(query.copy(), sql)
+        except Exception:
+            rewritten = None
+        with self._lock:
+            if rewritten is None:
+                self.passed += 1
+            else:
+                self.routed += 1
+        if rewritten is None:
+            return sql, None
+        return rewritten
+
+    def _rewrite(self, query, sql):
+        from sql_guard import is_aggregating
+
+        if not isinstance(query, exp.Select) or query.args.get('with') or query.args.get('joins'):
+            return None
+        if not (is_aggregating(query) or query.args.get('distinct')):
+            # Plain row queries depend on row multiplicity, which rollups collapse
+            return None
+        if len(list(query.find_all(exp.Select))) > 1 or query.find(exp.Window):
+            return None
+        from_clause = query.args.get('from_') or query.args.get('from')
+        table = from_clause.this if from_clause else None
+        if not isinstance(table, exp.Table) or table.name.lower() != BASE_TABLE or table.args.get('db'):
+            return None
+        table_alias = table.alias_or_name.lower()
+
+        age = column_name(MEASURE_COLUMN, self.dialect).lower()
+        aliases = {projection.alias.lower() for projection in query.expressions if projection.alias}
+        needed = set()
+
+        unaliased = [projection.sql(dialect=self.dialect).lower() for projection in query.expressions
+                     if not projection.alias]
+        if len(set(unaliased)) != len(unaliased):
+            # Backends disambiguate repeated names in ways a probe can't reveal
+            return None
+        renamed = set()
+        for aggregate in list(query.find_all(exp.AggFunc)):
+            replacement = self._measure(aggregate, age)
+            if replacement is None:
+                return None
+            if replacement is not aggregate:
+                projection = aggregate
+                while projection.parent is not query:
+                    projection = projection.parent
+                if projection.arg_key == 'expressions' and not projection.alias:
+                    renamed.add(projection.index)
+                aggregate.replace(replacement)
+
+        for column in query.find_all(exp.Column):
+            if column.table and column.table.lower() != table_alias:
+                return None
+            name = column.name.lower()
+            if name in ('row_count', 'age_count', 'age_sum', 'age_min', 'age_max') and column.meta.get('rollup'):
+                continue
+            if not column.table and name in aliases:
+                continue
+            needed.add(name)
+        if any(isinstance(star, exp.Star) and not isinstance(star.parent, exp.Count) for star in query.find_all(exp.Star)):
+            return None
+
+        if not table.alias and any(column.table for column in query.find_all(exp.Column)):
+            # Keep qualified references valid once the table name changes
+            table.set('alias', exp.TableAlias(this=exp.to_identifier(BASE_TABLE)))
+
+        available = self._available()
+        for name, dims in ROLLUPS:
+            target = rollup_table(name)
+            if target.lower() not in available:
+                continue
+            if needed <= {column_name(dim, self.dialect).lower() for dim in dims}:
+                break
+        else:
+            return None
+        if renamed and not keep_projection_names(query, sql, renamed, self._describe):
+            return None
+        table.set('this', exp.to_identifier(target))
+        return query.sql(dialect=self.dialect), target
+
+    def _measure(self, aggregate, age):
+        """Equivalent of aggregate over rollup rows, or None if there is none"""
+        argument = aggregate.this
+        if isinstance(aggregate, exp.Count):
+            if isinstance(argument, exp.Star):
+                return _count(self._measure_column('row_count'))
+            if isinstance(argument, exp.Distinct):
+                # Distinct values of dimensions survive the rollup unchanged
+                return aggregate
+            if self._is_age(argument, age):
+                return _count(self._measure_column('age_count'))
+            counted = exp.Case().when(exp.Not(this=exp.Is(this=argument.copy(), expression=exp.Null())),
+                                      self._measure_column('row_count'))
+            return _count(counted)
+        if isinstance(aggregate, (exp.Min, exp.Max)):
+            if self._is_age(argument, age):
+                measure = 'age_min' if isinstance(aggregate, exp.Min) else 'age_max'
+                return aggregate.__class__(this=self._measure_column(measure))
+            return aggregate
+        if isinstance(aggregate, exp.Sum) and self._is_age(argument, age):
+            return exp.func('SUM', self._measure_column('age_sum'))
+        if isinstance(aggregate, exp.Avg) and self._is_age(argument, age) and self.dialect != 'snowflake':
+            # Same double division AVG does; Snowflake's AVG scale rules differ, so it is left alone
+            total = exp.Cast(this=exp.func('SUM', self._measure_column('age_sum')), to=exp.DataType.build('DOUBLE'))
+            return exp.Div(this=total, expression=exp.func('SUM', self._measure_column('age_count')))
+        return None
+
+    @staticmethod
+    def _is_age(argument, age):
+        return isinstance(argument, exp.Column) and argument.name.lower() == age
+
+    @staticmethod
+    def _measure_column(name):
+        column = exp.column(name)
+        column.meta['rollup'] = True
+        return column
+
+    def stats(self):
+        with self._lock:
+            total = self.routed + self.passed
+            return {
+                "routed": self.routed,
+                "passed_through": self.passed,
+                "routed_rate": self.routed / total if total else 0.0,
+            }
@@ -0,0 +1,233 @@
+"""
+Schema Context
+
+Builds the table description sent to the LLM by introspecting the live
+database, so the prompt always names the columns exactly as the configured
+backend stores them. The profile (types, row count, value ranges and the
+most common values of low-cardinality columns) is built once per data
+version and kept on disk, and each prompt only describes the columns that
+look relevant to the question.
+"""
+
+import json
+import os
+import re
+import threading
+
+from query_cache import cache_dir, fingerprint, get_data_version
+
+
+TABLE = 'aviation_data'
+
+# Words analysts use for a column without naming it
+COLUMN_SYNONYMS = {
+    'passenger id': {'passenger', 'passengers', 'id', 'ids', 'unique'},
+    'first name': {'name', 'names', 'called'},
+    'last name': {'name', 'names', 'surname', 'family'},
+    'gender': {'male', 'female', 'men', 'women', 'sex'},
+    'age': {'old', 'older', 'young', 'younger', 'age', 'ages', 'aged', 'senior', 'seniors', 'children', 'adults'},
+    'nationality': {'nationalities', 'citizens', 'nationals', 'national'},
+    'airport name': {'airport', 'airports'},
+    'airport country code': {'code', 'codes', 'iso'},
+    'country name': {'country', 'countries'},
+    'airport continent': {'continent', 'continents', 'region', 'regions'},
+    'continents': {'continent', 'region', 'regions'},
+    'departure date': {'date', 'dates', 'day', 'days', 'month', 'months', 'monthly', 'year', 'week',
+                       'weekly', 'when', 'trend', 'trends', 'time', 'daily', 'departed', 'departures'},
+    'arrival airport': {'arrival', 'arrivals', 'arriving', 'destination', 'destinations'},
+    'pilot name': {'pilot', 'pilots', 'captain', 'captains'},
+    'flight status': {'status', 'delayed', 'delay', 'delays', 'cancelled', 'canceled', 'cancellation',
+                      'cancellations', 'on-time', 'ontime', 'punctual'},
+}
+
+WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)?")
+
+
+def _words(text):
+    words = set(WORD.findall(text.lower()))
+    # Crude singular forms so "airports" meets "airport"
+    return words | {word[:-1] for word in words if word.endswith('s') and len(word) > 3}
+
+
+def _identifier(name, dialect):
+    from sqlglot import exp
+
+    return exp.to_identifier(name).sql(dialect=dialect)
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def table_columns(engine, dialect, table=TABLE):
+    """[(name, type)] for table as the backend reports them"""
+    from sqlalchemy import inspect, text
+    from database import normalize_column_name
+
+    if dialect == 'sqlite':
+        return [(column['name'], str(column['type'])) for column in inspect(engine).get_columns(table)]
+    # duckdb-engine's reflection needs pg_catalog tables DuckDB lacks; information_schema works everywhere
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE UPPER(table_name) = UPPER(:table) AND table_schema = CURRENT_SCHEMA() "
+            "ORDER BY ordinal_position"
+        ), {"table": table}).fetchall()
+    return [(normalize_column_name(name), data_type) for name, data_type in rows]
+
+
+def introspect(engine, dialect, table=TABLE, low_cardinality=30, top_values=8):
+    """Profile table: columns with type, distinct count, range and common values"""
+    from sqlalchemy import text
+
+    columns = [{'name': name, 'type': data_type} for name, data_type in table_columns(engine, dialect, table)]
+    distinct = 'APPROX_COUNT_DISTINCT' if dialect in ('snowflake', 'duckdb') else 'COUNT'
+    selects = ["COUNT(*)"]
+    for column in columns:
+        quoted = _identifier(column['name'], dialect)
+        if distinct == 'COUNT':
+            selects.append(f"COUNT(DISTINCT {quoted})")
+        else:
+            selects.append(f"{distinct}({quoted})")
+        selects.append(f"MIN({quoted})")
+        selects.append(f"MAX({quoted})")
+    with engine.connect() as conn:
+        summary = conn.execute(text(f"SELECT {', '.join(selects)} FROM {table}")).fetchone()
+        profile = {"table": table, "rows": int(summary[0] or 0), "columns": []}
+        for index, column in enumerate(columns):
+            n_distinct, low, high = summary[1 + 3 * index:4 + 3 * index]
+            entry = {
+                "name": column['name'],
+                "type": str(column['type']),
+                "distinct": int(n_distinct or 0),
+                "min": None if low is None else str(low),
+                "max": None if high is None else str(high),
+                "values": [],
+            }
+            if 0 < entry["distinct"] <= low_cardinality:
+                quoted = _identifier(column['name'], dialect)
+                rows = conn.execute(text(
+                    f"SELECT {quoted}, COUNT(*) AS n FROM {table} WHERE {quoted} IS NOT NULL "
+                    f"GROUP BY {quoted} ORDER BY n DESC LIMIT {top_values}"
+                )).fetchall()
+                entry["values"] = [row[0] if isinstance(row[0], (int, float)) else str(row[0]) for row in rows]
+            profile["columns"].append(entry)
+    return profile
+
+
+def _is_text(entry):
+    return any(word in entry["type"].upper() for word in ("CHAR", "TEXT", "STRING"))
+
+
+def relevant_columns(profile, question):
+    """Columns the question mentions by name, synonym or one of their common values"""
+    words = _words(question)
+    relevant = []
+    for entry in profile["columns"]:
+        key = entry["name"].lower().replace('_', ' ')
+        name_words = _words(key)
+        if name_words and name_words <= words:
+            relevant.append(entry)
+        elif words & COLUMN_SYNONYMS.get(key, set()):
+            relevant.append(entry)
+        elif any(isinstance(value, str) and len(value) > 2 and _words(value) <= words for value in entry["values"]):
+            relevant.append(entry)
+    return relevant
+
+
+def describe_column(entry, dialect):
+    line = f"- {_identifier(entry['name'], dialect)} {entry['type']}"
+    if entry["values"]:
+        line += "; values: " + ", ".join(_literal(value) for value in entry["values"])
+        if entry["distinct"] > len(entry["values"]):
+            line += ", ..."
+    elif entry["min"] is not None and not _is_text(entry):
+        line += f"; range {entry['min']} to {entry['max']}"
+    elif entry["distinct"]:
+        line += f"; about {entry['distinct']:,} distinct values"
+    return line
+
+
+def render_schema(profile, dialect, question=None):
+    """Prompt text for profile, detailing only the columns relevant to question"""
+    relevant = relevant_columns(profile, question) if question else profile["columns"]
+    if not relevant:
+        relevant = profile["columns"]
+    names = {entry["name"] for entry in relevant}
+    lines = [
+        f"Table {profile['table']} ({profile['rows']:,} rows). "
+        "Use the column names exactly as written below.",
+        "Relevant columns:",
+    ]
+    lines.extend(describe_column(entry, dialect) for entry in relevant)
+    others = [_identifier(entry["name"], dialect) for entry in profile["columns"] if entry["name"] not in names]
+    if others:
+        lines.append("Other columns: " + ", ".join(others))
+    return "\n".join(lines)
+
+
+def schema_signature(profile):
+    """Fingerprint of the column names and types (not the data)"""
+    return fingerprint(*(f"{entry['name']}:{entry['type']}" for entry in profile["columns"]))
+
+
+class SchemaCatalog:
+    """Schema profile of the live engine, rebuilt once per data version
+
+    Profiles are written to <cache_dir>/schema so other processes and
+    restarts reuse them instead of introspecting again. data_version()
+    returns the version (default: get_data_version).
+    """
+
+    def __init__(self, engine, dialect, namespace="", directory=None, data_version=None):
+        self.engine = engine
+        self.dialect = dialect
+        self._data_version = data_version or get_data_version
+        self.namespace = namespace
+        self.directory = directory or os.path.join(cache_dir(), "schema")
+        self._lock = threading.Lock()
+        self._profile = None
+        self._version = None
+        self.introspections = 0
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"{fingerprint(self.namespace)[:12]}-{fingerprint(version)[:12]}.json")
+
+    def profile(self):
+        version = self._data_version()
+        with self._lock:
+            if self._profile is not None and self._version == version:
+                return self._profile
+            path = self._path(version)
+            try:
+                with open(path) as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                profile = introspect(self.engine, self.dialect)
+                self.introspections += 1
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(profile, f)
+                os.replace(tmp_path, path)
+                # Drop this namespace's profiles for older data versions
+                prefix = f"{fingerprint(self.namespace)[:12]}-"
+                for name in os.listdir(self.directory):
+                    if name.startswith(prefix) and name.endswith(".json") and os.path.join(self.directory, name) != path:
+                        try:
+                            os.remove(os.path.join(self.directory, name))
+                        except FileNotFoundError:
+                            # Another process refreshing the profile removed it first
+                            pass
+            self._profile = profile
+            self._version = version
+            return profile
+
+    def context(self, question=None):
+        """Schema text for a prompt about question"""
+        return render_schema(self.profile(), self.dialect, question)
+
+    def signature(self):
+        return schema_signature(self.profile())
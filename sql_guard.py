@@ -0,0 +1,109 @@
+"""
+SQL Guard
+
+Parses LLM-generated SQL before it reaches the warehouse: only a single
+SELECT is allowed, non-aggregating queries get a LIMIT injected (or an
+oversized LIMIT capped), and a COUNT(*) probe can report the true size of
+a result that was cut short.
+"""
+
+import sqlglot
+from sqlglot import exp
+
+
+SQL_DIALECTS = {
+    'sqlite': 'sqlite',
+    'snowflake': 'snowflake',
+    'duckdb': 'duckdb',
+}
+
+
+class GuardResult:
+    """Outcome of guarding a statement"""
+
+    def __init__(self, sql, original_sql, limited=False, limit=None, error=None):
+        self.sql = sql
+        self.original_sql = original_sql
+        self.limited = limited
+        self.limit = limit
+        self.error = error
+
+
+def sql_dialect(db_type):
+    """sqlglot dialect name for a DATABASE_TYPE"""
+    return SQL_DIALECTS.get(db_type, db_type)
+
+
+def parse_statement(sql, dialect):
+    """Parse sql into a single query expression, or raise ValueError"""
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=dialect) if s is not None]
+    except sqlglot.errors.ParseError as e:
+        raise ValueError(f"Could not parse SQL: {e}") from e
+    if len(statements) != 1:
+        raise ValueError("Exactly one SQL statement is allowed.")
+    statement = statements[0]
+    if not isinstance(statement, exp.Query):
+        raise ValueError("Generated query is not a SELECT statement.")
+    return statement
+
+
+def is_aggregating(query):
+    """True when the outer query groups or reduces rows with aggregates"""
+    if not isinstance(query, exp.Select):
+        return False
+    if query.args.get('group'):
+        return True
+    for projection in query.expressions:
+        for agg in projection.find_all(exp.AggFunc):
+            if agg.find_ancestor(exp.Window) is None and agg.find_ancestor(exp.Select) is query:
+                return True
+    return False
+
+
+def limit_value(query):
+    """Integer LIMIT of the outer query, or None"""
+    limit = query.args.get('limit')
+    if limit is None:
+        return None
+    value = limit.args.get('expression')
+    if isinstance(value, exp.Literal) and not value.is_string:
+        try:
+            return int(value.this)
+        except ValueError:
+            return None
+    return None
+
+
+def guard_query(sql, dialect, max_rows):
+    """Validate sql and inject/cap a LIMIT of max_rows on non-aggregating queries
+
+    Returns a GuardResult. When max_rows is None the statement is only
+    validated. The SQL text is left untouched unless the limit changes.
+    """
+    sql = sql.strip().rstrip(';').strip()
+    try:
+        query = parse_statement(sql, dialect)
+    except ValueError as e:
+        return GuardResult(sql, sql, error=str(e))
+
+    if max_rows is None or is_aggregating(query):
+        return GuardResult(sql, sql)
+
+    current = limit_value(query)
+    if current is not None and current <= max_rows:
+        return GuardResult(sql, sql)
+    if current is None and query.args.get('limit') is not None:
+        # Non-literal limit expression; leave it alone
+        return GuardResult(sql, sql)
+
+    guarded = query.copy().limit(max_rows)
+    return GuardResult(guarded.sql(dialect=dialect), sql, limited=True, limit=max_rows)
+
+
+def count_probe_sql(sql, dialect):
+    """SELECT COUNT(*) over sql, dropping a top-level ORDER BY that can't change the count"""
+    query = parse_statement(sql.strip().rstrip(';'), dialect).copy()
+    if query.args.get('limit') is None and query.args.get('offset') is None:
+        query.set('order', None)
+    return f"SELECT COUNT(*) FROM ({query.sql(dialect=dialect)}) AS size_probe"
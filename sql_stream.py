@@ -0,0 +1,100 @@
+"""
+SQL Stream
+
+Extracts the SQL statement from a model response while it is still
+streaming in: the opening code fence and its language tag are dropped as
+soon as they arrive, a partial closing fence is held back, and the
+statement counts as complete at the closing fence or at the first
+top-level semicolon, so it can be executed before the response has ended.
+"""
+
+
+FENCE = "```"
+
+
+def statement_end(sql):
+    """Index of the first semicolon outside quotes and comments, or -1"""
+    i = 0
+    quote = None
+    while i < len(sql):
+        char = sql[i]
+        if quote:
+            if char == quote:
+                # A doubled quote is an escaped quote, not the end of the string
+                if sql[i + 1:i + 2] == quote:
+                    i += 1
+                else:
+                    quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            if newline == -1:
+                return -1
+            i = newline
+        elif sql.startswith("/*", i):
+            close = sql.find("*/", i + 2)
+            if close == -1:
+                return -1
+            i = close + 1
+        elif char == ";":
+            return i
+        i += 1
+    return -1
+
+
+class SQLStreamExtractor:
+    """Feed response text as it arrives; .sql is the statement extracted so far"""
+
+    def __init__(self):
+        self._text = ""
+        self.sql = ""
+        self.fenced = None
+        self.complete = False
+
+    def feed(self, text):
+        if self.complete or not text:
+            return self.sql
+        self._text += text
+        self._update()
+        return self.sql
+
+    def _update(self):
+        text = self._text.lstrip()
+        if self.fenced is None:
+            if len(text) < len(FENCE) and FENCE.startswith(text):
+                return
+            self.fenced = text.startswith(FENCE)
+
+        if self.fenced:
+            # The language tag runs to the first newline (or space, for one-line fences)
+            tag_end = [i for i in (text.find("\n", len(FENCE)), text.find(" ", len(FENCE))) if i != -1]
+            if not tag_end:
+                return
+            body = text[min(tag_end) + 1:]
+            closing = body.find(FENCE)
+            if closing != -1:
+                body = body[:closing]
+                self.complete = True
+            else:
+                body = body.rstrip("`")
+        else:
+            body = text
+
+        end = statement_end(body)
+        if end != -1:
+            body = body[:end]
+            self.complete = True
+        self.sql = body.strip()
+
+    def finish(self):
+        """The statement once the response has ended"""
+        self.complete = True
+        return self.sql
+
+
+def extract_sql(text):
+    """SQL statement from a complete model response"""
+    extractor = SQLStreamExtractor()
+    extractor.feed(text)
+    return extractor.finish()
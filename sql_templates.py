@@ -0,0 +1,282 @@
+"""
+SQL Templates
+
+Answers the most common question shapes without calling the LLM: "count
+passengers by Y", "top N Y", "how many passengers with status Z" and
+"trend by month". Column names and filter values are matched (fuzzily)
+against the introspected schema profile. A question only gets a template
+when every word of it is accounted for; anything else goes to the LLM.
+"""
+
+import difflib
+import re
+import threading
+
+from sqlglot import exp
+
+
+SUBJECT = r"(?:passengers?|people|persons?|travell?ers?|flyers?|flights?|records?|rows?|bookings?|trips?)"
+FILTER = r"(?: (?P<filter>(?:with|where|for|among|from|of|in|who|that|whose|on) .+))?"
+
+PATTERNS = [
+    ('top_n', re.compile(
+        r"^(?:show |list |give me |what are |which are |find )?(?:me )?(?:the )?"
+        r"(?:top|most common|most popular|busiest|biggest|largest) (?:(?P<n>\d+) )?(?P<dim>[a-z][a-z ]*?)"
+        rf"(?: (?:by|with the most|ranked by) (?:the )?(?:number of |total |count of )?(?:{SUBJECT}|count|volume|traffic))?"
+        rf"{FILTER}$"
+    )),
+    ('monthly', re.compile(
+        r"^(?:show |plot |give me |what is |what's )?(?:me )?(?:the )?"
+        rf"(?:monthly (?:trend|count|volume|{SUBJECT})(?: trend)?(?: of)?|{SUBJECT} (?:over time|per month|by month|each month)"
+        rf"|(?:{SUBJECT} )?(?:trend|count|volume) (?:by|per|over|each) month)"
+        rf"(?: (?:of |for )?(?:the )?{SUBJECT})?{FILTER}$"
+    )),
+    ('count_by', re.compile(
+        r"^(?:show |list |give me |what is |what's |what are )?(?:me )?(?:the )?"
+        r"(?:how many |count (?:of )?|number of |total (?:number of )?|breakdown of )?(?:the )?"
+        rf"(?:{SUBJECT} )?(?:count |counts |total |breakdown |distribution |trend )?"
+        r"(?:by|per|for each|in each|each|grouped by|across|broken down by|split by) (?P<dim>[a-z][a-z ]*?)"
+        rf"{FILTER}$"
+    )),
+    ('count', re.compile(
+        r"^(?:how many|count(?: of)?|number of|total number of|total)(?: the)?(?: total)?"
+        rf"(?: {SUBJECT})?(?: are there| were there| in total| overall)?(?P<filter> .+)?$"
+    )),
+]
+
+# Phrases for each groupable column, keyed on the column name in lower case with spaces
+DIMENSIONS = {
+    'nationality': ['nationality', 'nationalities', 'citizenship', 'passenger nationality'],
+    'country name': ['country', 'countries', 'airport country', 'country name'],
+    'airport country code': ['country code', 'country codes', 'airport country code'],
+    'continents': ['continent', 'continents'],
+    'airport continent': ['airport continent', 'airport continents', 'continent code'],
+    'airport name': ['airport', 'airports', 'departure airport', 'departure airports', 'airport name'],
+    'arrival airport': ['arrival airport', 'arrival airports', 'destination', 'destinations'],
+    'flight status': ['flight status', 'status', 'statuses', 'flight statuses'],
+    'gender': ['gender', 'genders', 'sex'],
+    'age': ['age', 'ages'],
+    'pilot name': ['pilot', 'pilots', 'pilot name'],
+    'departure date': ['departure date', 'date', 'day', 'departure day'],
+}
+MONTH_PHRASES = ['month', 'months', 'departure month']
+
+# Words that can be dropped from a filter phrase without changing its meaning
+FILTER_NOISE = {
+    'with', 'where', 'for', 'among', 'from', 'of', 'in', 'who', 'that', 'whose', 'on', 'a', 'an', 'the',
+    'is', 'are', 'was', 'were', 'have', 'has', 'had', 'been', 'only', 'and', 'their', 'flight', 'flights',
+    'status', 'gender', 'passengers', 'passenger', 'people', 'travelers', 'travellers', 'there', 'total',
+}
+# Joins two values of one column (an IN list); across columns it needs the LLM
+DISJUNCTION = 'or'
+VALUE_SYNONYMS = {'women': 'female', 'woman': 'female', 'men': 'male', 'man': 'male', 'canceled': 'cancelled'}
+
+DEFAULT_TOP_N = 10
+FUZZY_CUTOFF = 0.85
+
+
+def normalize(question):
+    text = question.lower().strip()
+    text = re.sub(r"[?!.,;:\"]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _column_key(name):
+    return name.lower().replace('_', ' ')
+
+
+class TemplateMatch:
+    """SQL built from a template"""
+
+    def __init__(self, sql, template):
+        self.sql = sql
+        self.template = template
+
+
+class TemplateMatcher:
+    """Builds SQL for common question shapes from a schema profile (see schema_context)"""
+
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self._lock = threading.Lock()
+        self.served = 0
+        self.fell_back = 0
+        self.by_template = {}
+
+    def match(self, question, profile):
+        """TemplateMatch for question, or None when the LLM is needed"""
+        try:
+            result = self._match(normalize(question), profile)
+        except Exception:
+            result = None
+        with self._lock:
+            if result is None:
+                self.fell_back += 1
+            else:
+                self.served += 1
+                self.by_template[result.template] = self.by_template.get(result.template, 0) + 1
+        return result
+
+    def _match(self, text, profile):
+        columns = {_column_key(entry["name"]): entry for entry in profile["columns"]}
+        for template, pattern in PATTERNS:
+            found = pattern.match(text)
+            if not found:
+                continue
+            groups = found.groupdict()
+            filters = self._resolve_filters(groups.get('filter'), columns)
+            if filters is None:
+                continue
+            if template == 'count':
+                return TemplateMatch(self._count_sql(filters), template)
+            if template == 'monthly':
+                dim = self._month_dimension(columns)
+            else:
+                dim = self._resolve_dimension(groups['dim'], columns)
+            if dim is None:
+                continue
+            limit = None
+            if template == 'top_n':
+                limit = int(groups['n']) if groups.get('n') else DEFAULT_TOP_N
+            return TemplateMatch(self._grouped_sql(dim, filters, limit), template)
+        return None
+
+    def _identifier(self, entry):
+        return exp.to_identifier(entry["name"]).sql(dialect=self.dialect)
+
+    def _month_dimension(self, columns):
+        entry = columns.get('departure date')
+        if entry is None:
+            return None
+        month = exp.TimeToStr(this=exp.to_identifier(entry["name"]), format=exp.Literal.string('%Y-%m'))
+        return month.sql(dialect=self.dialect), 'month', True
+
+    def _resolve_dimension(self, phrase, columns):
+        """(expression, alias, ordered_by_value) for a grouping phrase, or None"""
+        phrase = re.sub(r"\s+(?:passengers?|people|travell?ers?|flights?)$", "", phrase.strip())
+        if phrase in MONTH_PHRASES:
+            return self._month_dimension(columns)
+        aliases = {alias: key for key, phrases in DIMENSIONS.items() for alias in phrases}
+        key = aliases.get(phrase)
+        if key is None:
+            close = difflib.get_close_matches(phrase, list(aliases), n=1, cutoff=FUZZY_CUTOFF)
+            key = aliases[close[0]] if close else None
+        entry = columns.get(key)
+        if entry is None:
+            return None
+        ordered = key in ('age', 'departure date')
+        return self._identifier(entry), None, ordered
+
+    def _resolve_filters(self, text, columns):
+        """{column: [values]} covering every meaningful word of text, or None
+
+        Values of one column are alternatives (an IN list) and different
+        columns must all hold. "or" is only accepted between values of the
+        same column, since the template SQL cannot express anything else.
+        """
+        if not text:
+            return {}
+        words = [VALUE_SYNONYMS.get(word, word) for word in text.split()]
+        candidates = []
+        for entry in columns.values():
+            for value in entry["values"]:
+                if isinstance(value, str):
+                    candidates.append((value.lower(), entry, value))
+        filters = {}
+        # Column of the last value seen, and whether an "or" follows it
+        last_column = None
+        either = False
+        i = 0
+        while i < len(words):
+            # Longest span starting at word i that names a known value
+            for j in range(len(words), i, -1):
+                span = " ".join(words[i:j])
+                found = self._find_value(span, candidates)
+                if found is not None:
+                    entry, value = found
+                    if either and entry["name"] != last_column:
+                        return None
+                    last_column, either = entry["name"], False
+                    filters.setdefault(entry["name"], [])
+                    if value not in filters[entry["name"]]:
+                        filters[entry["name"]].append(value)
+                    i = j
+                    break
+            else:
+                if words[i] == DISJUNCTION:
+                    if last_column is None or either:
+                        return None
+                    either = True
+                # Noise words are only dropped when they are not part of a value ("on time")
+                elif words[i] not in FILTER_NOISE:
+                    return None
+                i += 1
+        if either:
+            return None
+        return filters
+
+    @staticmethod
+    def _find_value(span, candidates):
+        exact = [(entry, value) for lowered, entry, value in candidates if lowered == span]
+        if len(exact) == 1:
+            return exact[0]
+        if exact:
+            return None
+        if len(span) < 4:
+            return None
+        width = len(span.split())
+        scored = sorted(
+            ((difflib.SequenceMatcher(None, span, lowered).ratio(), entry, value)
+             for lowered, entry, value in candidates if len(lowered.split()) == width),
+            key=lambda item: item[0], reverse=True,
+        )
+        if not scored or scored[0][0] < FUZZY_CUTOFF:
+            return None
+        if len(scored) > 1 and scored[1][0] >= FUZZY_CUTOFF and scored[1][2] != scored[0][2]:
+            # Two plausible values: not confident
+            return None
+        return scored[0][1], scored[0][2]
+
+    def _where(self, filters):
+        if not filters:
+            return ""
+        clauses = []
+        for name, values in filters.items():
+            column = exp.to_identifier(name).sql(dialect=self.dialect)
+            literals = ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+            if len(values) == 1:
+                clauses.append(f"{column} = {literals}")
+            else:
+                clauses.append(f"{column} IN ({literals})")
+        return " WHERE " + " AND ".join(clauses)
+
+    def _count_sql(self, filters):
+        return f"SELECT COUNT(*) AS passenger_count FROM aviation_data{self._where(filters)}"
+
+    def _grouped_sql(self, dim, filters, limit):
+        expression, alias, ordered = dim
+        select = f"{expression} AS {alias}" if alias else expression
+        group = alias or expression
+        if limit is not None:
+            order = "passenger_count DESC"
+        elif ordered:
+            order = group
+        else:
+            order = "passenger_count DESC"
+        sql = (
+            f"SELECT {select}, COUNT(*) AS passenger_count FROM aviation_data{self._where(filters)} "
+            f"GROUP BY {group} ORDER BY {order}"
+        )
+        if limit is not None:
+            sql += f" LIMIT {limit}"
+        return sql
+
+    def stats(self):
+        with self._lock:
+            total = self.served + self.fell_back
+            return {
+                "served": self.served,
+                "fell_back": self.fell_back,
+                "served_rate": self.served / total if total else 0.0,
+                "by_template": dict(self.by_template),
+            }
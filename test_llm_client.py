@@ -0,0 +1,191 @@
+"""
+Test LLM Client
+
+This script runs LLMClient against a local mock server that plays back
+scripted responses, and checks retries and every circuit-breaker
+transition: closed -> open -> half-open -> open again, and half-open ->
+closed. Run it from the project folder after changing llm_client.py; it
+needs no API key or network access.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_client import CircuitOpenError, LLMClient, LLMError
+
+
+RESET_SECONDS = 0.3
+
+
+class MockServer(ThreadingHTTPServer):
+    """Answers each POST with the next scripted (status, body) and counts requests"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.script = deque()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        self.server.requests += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if self.path == "/loop":
+            # Redirects to itself until requests gives up (TooManyRedirects)
+            self.send_response(302)
+            self.send_header("Location", "/loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status, body = self.server.script.popleft()
+        if status == "broken":
+            # Promise more than is sent, then hang up mid-stream
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(body.encode())
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_server():
+    server = MockServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture(name="server")
+def mock_server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def new_client(**options):
+    defaults = dict(max_retries=0, backoff_base=0.01, backoff_max=0.05, failure_threshold=2,
+                    reset_seconds=RESET_SECONDS, connect_timeout=2, read_timeout=2)
+    defaults.update(options)
+    return LLMClient(**defaults)
+
+
+def expect_error(error_type, fn, *args, **kwargs):
+    try:
+        fn(*args, **kwargs)
+    except error_type:
+        return
+    raise AssertionError(f"Expected {error_type.__name__}")
+
+
+def test_retry(server):
+    """A 503 is retried and the call still succeeds"""
+    client = new_client(max_retries=2)
+    server.script.extend([(503, "{}"), (200, json.dumps({"ok": True}))])
+    assert client.post_json(server.url) == {"ok": True}
+    stats = client.stats()
+    assert stats["retries"] == 1, stats
+    assert stats["failures"] == 0 and stats["circuit"] == "closed", stats
+    print("✅ 503 retried, then succeeded")
+
+
+def test_breaker(server):
+    """Consecutive failures open the circuit; half-open trials reopen or close it"""
+    client = new_client()
+    server.script.extend([(500, "{}"), (500, "{}")])
+    expect_error(LLMError, client.post_json, server.url)
+    assert client.breaker.state() == "closed"
+    expect_error(LLMError, client.post_json, server.url)
+    assert client.breaker.state() == "open", client.breaker.state()
+    seen = server.requests
+    expect_error(CircuitOpenError, client.post_json, server.url)
+    assert server.requests == seen, "An open circuit must not reach the server"
+    print("✅ Opened after 2 failures and refused calls without sending them")
+
+    time.sleep(RESET_SECONDS)
+    assert client.breaker.state() == "half-open"
+    # A trial that fails outside the retried errors still ends the trial
+    expect_error(LLMError, client.post_json, server.url + "/loop")
+    assert client.breaker.state() == "open", client.breaker.state()
+    print("✅ Half-open trial ending in TooManyRedirects reopened the circuit")
+
+    time.sleep(RESET_SECONDS)
+    assert client.breaker.allow()
+    assert not client.breaker.allow(), "Only one trial may run while half-open"
+    client.breaker.record_failure()
+    time.sleep(RESET_SECONDS)
+    server.script.append((200, "{}"))
+    assert client.post_json(server.url) == {}
+    assert client.breaker.state() == "closed", client.breaker.state()
+    print("✅ One trial at a time while half-open; a successful trial closed the circuit")
+
+
+def test_stream_outcomes(server):
+    """A stream counts once it is read: broken is a failure, closed early is a success"""
+    client = new_client(failure_threshold=1)
+    events = 'data: {"n": 1}\n\ndata: {"n": 2}\n\n'
+    server.script.append((200, events))
+    stream = client.stream_events(server.url)
+    assert next(stream) == {"n": 1}
+    assert client.stats()["calls"] == 0, "Counted before the body was read"
+    stream.close()
+    assert client.stats()["calls"] == 1 and client.breaker.state() == "closed"
+    print("✅ Stream closed early counted as a success")
+
+    server.script.append(("broken", 'data: {"n": 1}\n\n'))
+    try:
+        list(client.stream_events(server.url))
+    except LLMError:
+        pass
+    else:
+        raise AssertionError("A broken stream must raise LLMError")
+    stats = client.stats()
+    assert stats["failures"] == 1 and stats["circuit"] == "open", stats
+    print("✅ Stream broken mid-way counted as a failure and opened the circuit")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🔌 LLM CLIENT AGAINST A MOCK SERVER")
+    print("=" * 60)
+    server = start_server()
+    try:
+        test_retry(server)
+        test_breaker(server)
+        test_stream_outcomes(server)
+        print("=" * 60)
+        print("🎉 LLM CLIENT BEHAVES")
+        print("=" * 60)
+    except AssertionError as e:
+        print()
+        print(f"❌ LLM client regression: {e}")
+        sys.exit(1)
+    finally:
+        server.shutdown()
@@ -0,0 +1,138 @@
+"""
+Test Query Governor Preflight
+
+This script checks which joins the preflight reports as Cartesian: only
+joins with no predicate linking the two sides (no ON, ON 1=1, ON TRUE,
+or an ON that filters one side), never range or equality joins. It runs
+the SQLite preflight on a small local table and the Snowflake preflight
+on canned EXPLAIN output, so no warehouse is needed.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+from query_governor import CARTESIAN_MIN_ROWS, QueryGovernor, _unconnected_joins
+
+
+SELF_JOIN = 'SELECT COUNT(*) FROM aviation_data a JOIN aviation_data b '
+
+# (SQL, reported as Cartesian)
+JOINS = [
+    (SELF_JOIN + 'ON 1 = 1', True),
+    (SELF_JOIN + 'ON TRUE', True),
+    (SELF_JOIN + 'ON a."Age" > 30', True),
+    ('SELECT COUNT(*) FROM aviation_data a, aviation_data b WHERE a."Age" < 20 AND b."Age" < 30', True),
+    ('SELECT COUNT(*) FROM aviation_data a CROSS JOIN aviation_data b', True),
+    (SELF_JOIN + 'ON a."Age" < b."Age"', False),
+    (SELF_JOIN + 'ON a."Passenger ID" = b."Passenger ID" AND b."Age" > 30', False),
+    (SELF_JOIN + 'USING ("Passenger ID")', False),
+    ('SELECT COUNT(*) FROM aviation_data a, aviation_data b, aviation_data c '
+     'WHERE b."Age" = c."Age" AND c."Gender" = a."Gender"', False),
+]
+
+
+class StandInSnowflake:
+    """Engine whose connections answer EXPLAIN USING JSON with a canned plan"""
+
+    def __init__(self, operations):
+        self.explained = json.dumps({
+            'GlobalStats': {'bytesAssigned': 1024},
+            'Operations': [operations],
+        })
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        return self
+
+    def fetchone(self):
+        return (self.explained,)
+
+
+def build_engine(folder):
+    """SQLite engine on a file in folder with an aviation_data table over the Cartesian threshold"""
+    path = os.path.join(folder, "aviation.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE aviation_data ("Passenger ID" TEXT, "Gender" TEXT, "Age" INTEGER)')
+        conn.executemany(
+            "INSERT INTO aviation_data VALUES (?, ?, ?)",
+            [(f"P{index}", "Female" if index % 2 else "Male", index % 90) for index in range(CARTESIAN_MIN_ROWS * 2)],
+        )
+    return create_engine(f"sqlite:///{path}")
+
+
+@pytest.fixture(scope="module", name="engine")
+def built_engine():
+    folder = tempfile.mkdtemp(prefix="governor_test_")
+    engine = build_engine(folder)
+    yield engine
+    engine.dispose()
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def test_unconnected_joins():
+    """Joins are unconnected only when no conjunct refers to both sides"""
+
+    for sql, cartesian in JOINS:
+        assert bool(_unconnected_joins(sql, 'sqlite')) == cartesian, f"Cartesian should be {cartesian}: {sql}"
+    print(f"✅ {len(JOINS)} joins classified, ON 1 = 1 and one-sided ON included")
+
+
+def test_sqlite_preflight(engine):
+    """The SQLite preflight reports exactly the joins with no predicate"""
+
+    governor = QueryGovernor(engine, 'sqlite')
+    for sql, cartesian in JOINS:
+        plan = governor.preflight(sql)
+        assert plan.cartesian == cartesian, f"Cartesian should be {cartesian}: {sql} ({plan.problems})"
+    print("✅ SQLite preflight flags ON 1 = 1 and one-sided ON, not range or equality joins")
+
+
+def test_snowflake_preflight(engine):
+    """A CartesianJoin step is reported unless the SQL has a predicate linking both sides"""
+
+    governor = QueryGovernor(engine, 'snowflake')
+    governor.engine = StandInSnowflake([
+        {'operation': 'CartesianJoin'},
+        {'operation': 'TableScan', 'objects': ['AVIATION.PUBLIC.AVIATION_DATA']},
+    ])
+    for sql, cartesian in JOINS:
+        plan = governor.preflight(sql)
+        assert plan.cartesian == cartesian, f"Cartesian should be {cartesian}: {sql} ({plan.problems})"
+    print("✅ Snowflake preflight flags the accidental self-join, not range joins planned as CartesianJoin")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚦 QUERY GOVERNOR PREFLIGHT")
+    print("=" * 60)
+    folder = tempfile.mkdtemp(prefix="governor_test_")
+    engine = build_engine(folder)
+    try:
+        test_unconnected_joins()
+        test_sqlite_preflight(engine)
+        test_snowflake_preflight(engine)
+        print("=" * 60)
+        print("🎉 ONLY JOINS WITHOUT A PREDICATE ARE CARTESIAN")
+        print("=" * 60)
+    except AssertionError as e:
+        print()
+        print(f"❌ Preflight regression: {e}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+        shutil.rmtree(folder, ignore_errors=True)
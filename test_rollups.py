@@ -0,0 +1,125 @@
+"""
+Test Rollup Routing
+
+This script builds a small DuckDB copy of aviation_data with its rollup
+tables, runs aggregate queries both as written and as RollupRouter
+rewrites them, and checks that the two return identical frames: the same
+values and the same column dtypes. Run it from the project folder after
+changing rollups.py; it needs no loaded data.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+from database import iter_query_batches, query_columns, table_names
+from rollups import RollupRouter, rollup_statements
+
+
+QUERIES = [
+    'SELECT "Gender", COUNT(*) AS n FROM aviation_data GROUP BY "Gender"',
+    'SELECT "Gender", COUNT(*) FROM aviation_data GROUP BY "Gender"',
+    'SELECT COUNT(*) AS n FROM aviation_data WHERE "Flight Status" = \'Delayed\'',
+    'SELECT "Flight Status", COUNT("Age") AS aged, COUNT("Nationality") AS known FROM aviation_data '
+    'GROUP BY "Flight Status"',
+    'SELECT "Gender", SUM("Age") AS total, MIN("Age") AS youngest, MAX("Age") AS oldest, AVG("Age") AS mean '
+    'FROM aviation_data GROUP BY "Gender"',
+    'SELECT "Nationality", COUNT(*) AS n FROM aviation_data GROUP BY "Nationality" HAVING COUNT(*) > 5',
+    'SELECT COUNT(DISTINCT "Nationality") AS nationalities FROM aviation_data',
+    'SELECT "Airport Continent", "Flight Status", COUNT(*) AS n FROM aviation_data '
+    'GROUP BY "Airport Continent", "Flight Status"',
+]
+
+
+def sample_frame(rows=400):
+    """aviation_data columns the rollups group by, with some missing ages and nationalities"""
+    statuses = ['On Time', 'Delayed', 'Cancelled']
+    continents = ['Asia', 'Europe', 'North America']
+    nationalities = ['Japan', 'France', 'Brazil', 'Canada', None]
+    return pd.DataFrame({
+        'Gender': ['Female' if index % 2 else 'Male' for index in range(rows)],
+        'Age': pd.array([None if index % 17 == 0 else 18 + index % 60 for index in range(rows)], dtype='Int64'),
+        'Nationality': [nationalities[index % 5] for index in range(rows)],
+        'Airport Name': [f"Airport {index % 7}" for index in range(rows)],
+        'Airport Country Code': [f"C{index % 7}" for index in range(rows)],
+        'Country Name': [f"Country {index % 7}" for index in range(rows)],
+        'Airport Continent': [continents[index % 3] for index in range(rows)],
+        'Continents': [continents[(index + 1) % 3] for index in range(rows)],
+        'Departure Date': pd.to_datetime('2022-01-01') + pd.to_timedelta([index % 90 for index in range(rows)], 'D'),
+        'Flight Status': [statuses[index % 3] for index in range(rows)],
+    })
+
+
+def build_engine(folder):
+    """SQLAlchemy engine on a DuckDB file in folder holding aviation_data and its rollups"""
+    import duckdb
+    from sqlalchemy import create_engine
+
+    path = os.path.join(folder, "aviation.duckdb")
+    conn = duckdb.connect(path)
+    try:
+        conn.register("sample", sample_frame())
+        conn.execute("CREATE TABLE aviation_data AS SELECT * FROM sample")
+        conn.execute('ALTER TABLE aviation_data ALTER "Departure Date" TYPE DATE')
+        columns = [row[0] for row in conn.execute("DESCRIBE aviation_data").fetchall()]
+        for _, statement in rollup_statements(columns, 'duckdb'):
+            conn.execute(statement)
+    finally:
+        conn.close()
+    return create_engine(f"duckdb:///{path}")
+
+
+@pytest.fixture(scope="module", name="engine")
+def built_engine():
+    folder = tempfile.mkdtemp(prefix="rollup_test_")
+    engine = build_engine(folder)
+    yield engine
+    engine.dispose()
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def fetch(engine, sql):
+    frame = pd.concat(list(iter_query_batches(engine, sql)), ignore_index=True)
+    return frame.sort_values(list(frame.columns), ignore_index=True)
+
+
+def test_routed_results_match(engine):
+    """Every probe query is routed and returns the base table's values and dtypes"""
+
+    router = RollupRouter(
+        'duckdb', lambda: table_names(engine), lambda: None, lambda sql: query_columns(engine, sql)
+    )
+    for sql in QUERIES:
+        routed, rollup = router.route(sql)
+        assert rollup, f"Not routed: {sql}"
+        base = fetch(engine, sql)
+        rolled = fetch(engine, routed)
+        assert dict(rolled.dtypes) == dict(base.dtypes), (
+            f"{rollup} changed dtypes {dict(base.dtypes)} -> {dict(rolled.dtypes)} for {sql}"
+        )
+        pd.testing.assert_frame_equal(rolled, base, obj=sql)
+    print(f"✅ {len(QUERIES)} routed queries match the base table in values and dtypes")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧮 ROLLUP ROUTING (DUCKDB)")
+    print("=" * 60)
+    folder = tempfile.mkdtemp(prefix="rollup_test_")
+    engine = build_engine(folder)
+    try:
+        test_routed_results_match(engine)
+        print("=" * 60)
+        print("🎉 ROLLUPS ANSWER LIKE THE BASE TABLE")
+        print("=" * 60)
+    except AssertionError as e:
+        print()
+        print(f"❌ Rollup regression: {e}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+        shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,132 @@
+"""
+Test App Startup
+
+This script profiles what app.py imports and times a cold start of the
+login page in a fresh interpreter. It fails when startup goes over budget
+or pulls in plotting/pandas before they are needed. Run it from the
+project folder after changing imports in app.py or its modules.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Modules app.py itself imports; everything else should load on first use
+APP_MODULES = [
+    "streamlit", "dotenv", "approximate", "chart_renderer", "database", "history_store", "llm_client",
+    "paraphrase_cache", "query_cache", "query_governor", "query_jobs", "result_profile", "rollups",
+    "schema_context", "sql_guard", "sql_stream", "sql_templates", "visualizations",
+]
+
+# Nothing on the login page needs these
+DEFERRED_MODULES = ["matplotlib", "seaborn", "pandas", "snowflake"]
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+COLD_START_BUDGET_MS = float(os.getenv("STARTUP_COLD_START_BUDGET_MS", "3000"))
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+print(json.dumps({
+    "elapsed_ms": (time.perf_counter() - start) * 1000,
+    "errors": [str(e.value) for e in at.exception],
+    "modules": sorted(name for name in sys.modules if "." not in name),
+}))
+"""
+
+
+def run_python(*args):
+    """stdout and stderr of a fresh interpreter that can import the project modules"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_DIR, os.getenv("PYTHONPATH")])))
+    completed = subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True, env=env)
+    return completed.stdout, completed.stderr
+
+
+def deferred_modules():
+    """Modules that must not load at startup with the configured backend"""
+    if os.getenv('DATABASE_TYPE', 'sqlite').lower() == 'snowflake':
+        # The engine is created at startup, so the dialect has to load
+        return [name for name in DEFERRED_MODULES if name != "snowflake"]
+    return DEFERRED_MODULES
+
+
+def profile_imports():
+    """(total ms, [(cumulative ms, module)] for top-level imports) of app.py's modules"""
+    _, stderr = run_python("-X", "importtime", "-c", "import " + ", ".join(APP_MODULES))
+    entries = []
+    loaded = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip().split(".")[0])
+        # Only modules imported directly by the snippet are unindented
+        if not name.startswith("  ") and name.strip() in APP_MODULES:
+            entries.append((int(cumulative) / 1000, name.strip()))
+    entries.sort(reverse=True)
+    return sum(ms for ms, _ in entries), entries, loaded
+
+
+def cold_start():
+    """Elapsed ms, errors and loaded modules for a first render of app.py"""
+    stdout, _ = run_python("-c", COLD_START_SCRIPT, os.path.join(PROJECT_DIR, "app.py"))
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def test_import_time():
+    """app.py's imports stay under budget and skip the heavy modules"""
+
+    print("=" * 60)
+    print("⏱️  IMPORT PROFILE")
+    print("=" * 60)
+    total_ms, entries, loaded = profile_imports()
+    print(f"{'Module':<30} {'Cumulative':>12}")
+    print("-" * 43)
+    for ms, name in entries[:10]:
+        print(f"{name:<30} {ms:>9,.0f} ms")
+    print()
+    print(f"Total: {total_ms:,.0f} ms (budget {IMPORT_BUDGET_MS:,.0f} ms)")
+    print()
+
+    eager = [name for name in deferred_modules() if name in loaded]
+    assert not eager, f"Imported at startup: {', '.join(eager)}"
+    assert total_ms <= IMPORT_BUDGET_MS, f"Imports took {total_ms:,.0f} ms"
+
+
+def test_cold_start():
+    """The login page renders under budget in a fresh interpreter"""
+
+    print("=" * 60)
+    print("🚀 COLD START")
+    print("=" * 60)
+    result = cold_start()
+    print(f"First render: {result['elapsed_ms']:,.0f} ms (budget {COLD_START_BUDGET_MS:,.0f} ms)")
+    print()
+
+    assert not result["errors"], f"App raised: {result['errors'][0]}"
+    eager = [name for name in deferred_modules() if name in result["modules"]]
+    assert not eager, f"Loaded by the login page: {', '.join(eager)}"
+    assert result["elapsed_ms"] <= COLD_START_BUDGET_MS, f"First render took {result['elapsed_ms']:,.0f} ms"
+
+
+if __name__ == "__main__":
+    try:
+        test_import_time()
+        test_cold_start()
+        print("=" * 60)
+        print("🎉 STARTUP WITHIN BUDGET")
+        print("=" * 60)
+    except AssertionError as e:
+        print()
+        print(f"❌ Startup regression: {e}")
+        sys.exit(1)
@@ -0,0 +1,689 @@
+"""
+Visualizations
+
+Chart builders for query results. create_smart_visualizations() inspects a
+result frame and dispatches to the most suitable create_*_viz() builder.
+Builders that aggregate can instead be handed small frames computed by the
+database (see fetch_aggregates), so raw rows never have to be grouped here.
+Chart selection and the builders read column kinds, cardinalities, summary
+statistics and top values from the result's profile (see result_profile),
+computed once per result.
+"""
+
+import io
+import threading
+
+from result_profile import (
+    categorical_columns, correlation, matches, numeric_columns, profile_frame, top_values,
+)
+
+# Most points a time-series line is drawn with; longer series are downsampled
+TIME_SERIES_POINT_BUDGET = 2000
+
+# matplotlib.pyplot is imported by the first chart, not when the app imports this module
+plt = None
+_plotting_lock = threading.Lock()
+
+
+def setup_plotting():
+    """Import pyplot and apply the chart style, once per process"""
+    global plt
+    with _plotting_lock:
+        if plt is None:
+            from matplotlib import pyplot
+            import seaborn as sns
+
+            sns.set_style("whitegrid")
+            pyplot.rcParams['figure.facecolor'] = 'white'
+            plt = pyplot
+    return plt
+
+
+def profile_for(results, profile=None):
+    """profile if it describes results, else a fresh one"""
+    return profile if matches(profile, results) else profile_frame(results)
+
+
+def choose_chart(results, profile=None):
+    """Pick the chart type for a result; returns (chart_type, args) or (None, ())"""
+    profile = profile_for(results, profile)
+    numeric_cols = numeric_columns(profile)
+    categorical_cols = categorical_columns(profile)
+    date_cols = [
+        col for col in results.columns
+        if 'date' in col.lower() or 'time' in col.lower() or profile['columns'][col]['kind'] == 'datetime'
+    ]
+    
+    num_rows = profile['rows']
+    
+    # Case 1: Single numeric column 
+    if len(numeric_cols) == 1 and len(categorical_cols) == 0:
+        return 'single_numeric', (numeric_cols[0],)
+    
+    # Case 2: Multiple numeric columns only (Correlation, distribution)
+    if len(numeric_cols) >= 2 and len(categorical_cols) == 0:
+        return 'multi_numeric', (numeric_cols,)
+    
+    # Case 3: One categorical + one numeric (Classic comparison)
+    if len(categorical_cols) >= 1 and len(numeric_cols) >= 1:
+        cat_col = categorical_cols[0]
+        num_col = numeric_cols[0]
+        n_unique = profile['columns'][cat_col]['distinct']
+        
+        # Sub-case: Time series data
+        if cat_col in date_cols or 'date' in cat_col.lower():
+            return 'time_series', (cat_col, num_col)
+        
+        # Sub-case: Few categories (2-20)
+        if 2 <= n_unique <= 20:
+            return 'categorical_comparison', (cat_col, num_col, n_unique)
+        
+        # Sub-case: Many categories (>20)
+        if n_unique > 20:
+            return 'top_n', (cat_col, num_col, 15)
+    
+    # Case 4: Multiple categorical columns (Cross-tabulation)
+    if len(categorical_cols) >= 2:
+        return 'cross_tab', (categorical_cols[:2],)
+    
+    # Case 5: Large dataset overview (Sample visualization)
+    if num_rows > 100:
+        return 'large_dataset', (numeric_cols, categorical_cols)
+    
+    # Default: Simple table representation
+    return None, ()
+
+
+def build_chart(results, chart_type, args, aggregates=None, profile=None):
+    """Draw chart_type with the builder's args and optional pushed-down aggregates
+
+    profile describes the full result; with aggregates, results may be
+    just its header.
+    """
+    setup_plotting()
+    if profile is None:
+        profile = profile_for(results)
+    return CHART_BUILDERS[chart_type](results, *args, profile=profile, **(aggregates or {}))
+
+
+def create_smart_visualizations(results, query):
+
+    profile = profile_for(results)
+    chart_type, args = choose_chart(results, profile)
+    if chart_type is None:
+        return None
+    return build_chart(results, chart_type, args, profile=profile)
+
+
+def quote_identifier(name, dialect):
+    """Quote a result column name for use in SQL, only when needed"""
+    from sqlglot import exp
+
+    return exp.to_identifier(name).sql(dialect=dialect)
+
+
+def aggregate_sql(source_sql, chart_type, args, dialect):
+    """Aggregate query a chart needs, run over source_sql as a subquery
+
+    Returns None for chart types that draw raw rows.
+    """
+    source = source_sql.strip().rstrip(';')
+    if chart_type == 'categorical_comparison':
+        cat, num = (quote_identifier(col, dialect) for col in args[:2])
+        return (
+            f"SELECT {cat} AS category, SUM({num}) AS sum_value, AVG({num}) AS mean_value, "
+            f"COUNT({num}) AS count_value FROM ({source}) AS src "
+            f"WHERE {cat} IS NOT NULL GROUP BY {cat} ORDER BY sum_value DESC"
+        )
+    if chart_type == 'top_n':
+        cat, num = (quote_identifier(col, dialect) for col in args[:2])
+        top_n = int(args[2])
+        # Window total gives the "Others" slice without a second scan
+        return (
+            f"SELECT category, total_value, SUM(total_value) OVER () AS grand_total FROM ("
+            f"SELECT {cat} AS category, SUM({num}) AS total_value FROM ({source}) AS src "
+            f"WHERE {cat} IS NOT NULL GROUP BY {cat}) AS grouped "
+            f"ORDER BY total_value DESC LIMIT {top_n}"
+        )
+    if chart_type == 'cross_tab':
+        cat1, cat2 = (quote_identifier(col, dialect) for col in args[0][:2])
+        return (
+            f"WITH src AS ({source}), "
+            f"top1 AS (SELECT {cat1} AS value FROM src WHERE {cat1} IS NOT NULL "
+            f"GROUP BY {cat1} ORDER BY COUNT(*) DESC LIMIT 10), "
+            f"top2 AS (SELECT {cat2} AS value FROM src WHERE {cat2} IS NOT NULL "
+            f"GROUP BY {cat2} ORDER BY COUNT(*) DESC LIMIT 10) "
+            f"SELECT {cat1} AS row_value, {cat2} AS column_value, COUNT(*) AS pair_count FROM src "
+            f"WHERE {cat1} IN (SELECT value FROM top1) AND {cat2} IN (SELECT value FROM top2) "
+            f"GROUP BY {cat1}, {cat2}"
+        )
+    return None
+
+
+def fetch_aggregates(engine, source_sql, chart_type, args, dialect, cache=None):
+    """Run the chart's aggregate query on the database
+
+    Returns builder keyword arguments, or None when the chart type has no
+    pushdown or the query fails (the builder then aggregates locally).
+    With a ResultCache, the aggregated frame is cached next to the results.
+    """
+    import pandas as pd
+
+    sql = aggregate_sql(source_sql, chart_type, args, dialect)
+    if sql is None:
+        return None
+    agg = cache.get(sql) if cache is not None else None
+    if agg is None:
+        try:
+            agg = pd.read_sql(sql, engine)
+        except Exception:
+            return None
+        if cache is not None:
+            cache.put(sql, agg)
+    agg.columns = [col.lower() for col in agg.columns]
+
+    if chart_type == 'categorical_comparison':
+        cat_col = args[0]
+        agg_data = agg.rename(columns={
+            'category': cat_col, 'sum_value': 'sum', 'mean_value': 'mean', 'count_value': 'count'
+        })
+        return {'agg_data': agg_data.reset_index(drop=True)}
+    if chart_type == 'top_n':
+        cat_col, num_col = args[0], args[1]
+        total_sum = agg['grand_total'].iloc[0] if len(agg) else 0
+        agg_data = agg[['category', 'total_value']].rename(columns={'category': cat_col, 'total_value': num_col})
+        return {'agg_data': agg_data, 'total_sum': total_sum}
+    if chart_type == 'cross_tab':
+        cat1, cat2 = args[0][:2]
+        crosstab = agg.pivot_table(
+            index='row_value', columns='column_value', values='pair_count', aggfunc='sum', fill_value=0
+        ).astype(int)
+        crosstab.index.name = cat1
+        crosstab.columns.name = cat2
+        return {'crosstab': crosstab}
+    return None
+
+
+def create_single_numeric_viz(results, col_name, profile=None):
+    """Visualize single numeric column with histogram and box plot"""
+    fig, axs = plt.subplots(1, 3, figsize=(16, 5))
+    
+    data = results[col_name].dropna()
+    column = profile_for(results, profile)['columns'][col_name]
+    
+    # Histogram
+    axs[0].hist(data, bins=30, color='#2E86AB', alpha=0.7, edgecolor='black')
+    axs[0].set_title(f'Distribution of {col_name}', fontsize=12, fontweight='bold')
+    axs[0].set_xlabel(col_name)
+    axs[0].set_ylabel('Frequency')
+    axs[0].grid(alpha=0.3)
+    
+    # Box plot
+    axs[1].boxplot(data, vert=True)
+    axs[1].set_title(f'Box Plot of {col_name}', fontsize=12, fontweight='bold')
+    axs[1].set_ylabel(col_name)
+    axs[1].grid(alpha=0.3)
+    
+    # Statistics
+    axs[2].axis('off')
+    stats_text = f"""
+    📊 Summary Statistics
+    
+    Count: {len(data):,}
+    Mean: {_stat(column['mean'])}
+    Median: {data.median():.2f}
+    Std Dev: {_stat(column['std'])}
+    Min: {_stat(column['min'])}
+    Max: {_stat(column['max'])}
+    """
+    axs[2].text(0.1, 0.5, stats_text, fontsize=11, verticalalignment='center',
+                bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.3))
+    
+    plt.tight_layout()
+    return fig
+
+
+def _stat(value):
+    return 'nan' if value is None else f"{value:.2f}"
+
+
+def create_multi_numeric_viz(results, numeric_cols, profile=None):
+    """Visualize multiple numeric columns with correlation and scatter plots"""
+    n_cols = min(len(numeric_cols), 4)  # Limit to 4 columns for clarity
+    selected_cols = numeric_cols[:n_cols]
+    
+    fig = plt.figure(figsize=(16, 10))
+    
+    # Correlation heatmap
+    ax1 = plt.subplot(2, 2, 1)
+    corr_matrix = correlation(profile_for(results, profile), selected_cols)
+    if corr_matrix is None:
+        corr_matrix = results[selected_cols].corr()
+    im = ax1.imshow(corr_matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
+    ax1.set_xticks(range(len(selected_cols)))
+    ax1.set_yticks(range(len(selected_cols)))
+    ax1.set_xticklabels(selected_cols, rotation=45, ha='right')
+    ax1.set_yticklabels(selected_cols)
+    ax1.set_title('Correlation Matrix', fontsize=12, fontweight='bold')
+    plt.colorbar(im, ax=ax1)
+    
+    # Add correlation values
+    for i in range(len(selected_cols)):
+        for j in range(len(selected_cols)):
+            ax1.text(j, i, f'{corr_matrix.iloc[i, j]:.2f}',
+                    ha='center', va='center', color='white' if abs(corr_matrix.iloc[i, j]) > 0.5 else 'black')
+    
+    # Scatter plot (first two numeric columns)
+    if len(selected_cols) >= 2:
+        ax2 = plt.subplot(2, 2, 2)
+        ax2.scatter(results[selected_cols[0]], results[selected_cols[1]], 
+                   alpha=0.6, c='#A23B72', edgecolors='black', linewidth=0.5)
+        ax2.set_xlabel(selected_cols[0])
+        ax2.set_ylabel(selected_cols[1])
+        ax2.set_title(f'{selected_cols[1]} vs {selected_cols[0]}', fontsize=12, fontweight='bold')
+        ax2.grid(alpha=0.3)
+    
+    # Distribution comparison
+    ax3 = plt.subplot(2, 2, 3)
+    for col in selected_cols[:3]:  # Limit to 3 for readability
+        ax3.hist(results[col].dropna(), bins=20, alpha=0.5, label=col)
+    ax3.set_title('Distribution Comparison', fontsize=12, fontweight='bold')
+    ax3.set_xlabel('Value')
+    ax3.set_ylabel('Frequency')
+    ax3.legend()
+    ax3.grid(alpha=0.3)
+    
+    # Box plots comparison
+    ax4 = plt.subplot(2, 2, 4)
+    ax4.boxplot([results[col].dropna() for col in selected_cols], labels=selected_cols)
+    ax4.set_title('Box Plot Comparison', fontsize=12, fontweight='bold')
+    ax4.set_ylabel('Value')
+    ax4.tick_params(axis='x', rotation=45)
+    ax4.grid(alpha=0.3)
+    
+    plt.tight_layout()
+    return fig
+
+
+def lttb_indices(values, n_out):
+    """Positions of the n_out points that keep the shape of values (largest-triangle-three-buckets)
+
+    The first and last points are always kept; every bucket in between
+    keeps the point forming the largest triangle with the point kept before
+    it and the mean of the next bucket. Points are spaced by position.
+    """
+    import numpy as np
+
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    if np.isnan(y).any():
+        # Gaps still draw as gaps; they just never win a bucket
+        y = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, stops = edges[:-1], edges[1:]
+    prefix = np.concatenate(([0.0], np.cumsum(y)))
+    mean_x = (starts + stops - 1) / 2
+    mean_y = (prefix[stops] - prefix[starts]) / (stops - starts)
+    # The bucket after the last one is the final point
+    next_x = np.append(mean_x[1:], n - 1)
+    next_y = np.append(mean_y[1:], y[-1])
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket, (start, stop) in enumerate(zip(starts, stops)):
+        xs = np.arange(start, stop)
+        area = np.abs(
+            (previous - next_x[bucket]) * (y[start:stop] - y[previous])
+            - (previous - xs) * (next_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def create_time_series_viz(results, date_col, value_col, profile=None):
+    """Create time series visualizations"""
+    import numpy as np
+
+    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
+    
+    # Sort by date
+    df_sorted = results.sort_values(date_col)
+    values = df_sorted[value_col].reset_index(drop=True)
+    
+    # Long series are drawn from a fixed number of points; the rolling mean and
+    # cumulative sum are computed on every row first
+    kept = lttb_indices(values.to_numpy(dtype=float, na_value=np.nan), TIME_SERIES_POINT_BUDGET)
+    downsampled = len(kept) < len(values)
+    dates = df_sorted[date_col].iloc[kept]
+    shown = values.iloc[kept]
+    import pandas as pd
+
+    if dates.dtype == object or pd.api.types.is_string_dtype(dates):
+        # Text dates (SQLite) would get one axis category, and one tick label, per point
+        parsed = pd.to_datetime(dates, errors='coerce')
+        if parsed.notna().sum() == dates.notna().sum():
+            dates = parsed
+    
+    # Line chart
+    marker = None if downsampled else 'o'
+    axs[0, 0].plot(dates, shown, marker=marker, linewidth=2, markersize=4, color='#2E86AB')
+    axs[0, 0].set_title(f'{value_col} Over Time', fontsize=12, fontweight='bold')
+    axs[0, 0].set_xlabel(date_col)
+    axs[0, 0].set_ylabel(value_col)
+    axs[0, 0].tick_params(axis='x', rotation=45)
+    axs[0, 0].grid(alpha=0.3)
+    
+    # Area chart
+    axs[0, 1].fill_between(kept, shown, alpha=0.6, color='#A23B72')
+    axs[0, 1].plot(kept, shown, linewidth=2, color='#6C1D45')
+    axs[0, 1].set_title(f'{value_col} Trend (Area)', fontsize=12, fontweight='bold')
+    axs[0, 1].set_xlabel('Observation')
+    axs[0, 1].set_ylabel(value_col)
+    axs[0, 1].grid(alpha=0.3)
+    
+    # Moving average (if enough data points)
+    if len(values) >= 5:
+        window = min(5, len(values) // 3)
+        moving_avg = values.rolling(window=window).mean()
+        axs[1, 0].plot(kept, shown, alpha=0.5, label='Actual', color='lightblue')
+        axs[1, 0].plot(kept, moving_avg.iloc[kept], linewidth=2, label=f'{window}-period MA', color='red')
+        axs[1, 0].set_title(f'{value_col} with Moving Average', fontsize=12, fontweight='bold')
+        axs[1, 0].set_xlabel('Observation')
+        axs[1, 0].set_ylabel(value_col)
+        axs[1, 0].legend()
+        axs[1, 0].grid(alpha=0.3)
+    
+    # Cumulative sum
+    cumsum = values.cumsum()
+    axs[1, 1].plot(kept, cumsum.iloc[kept], linewidth=2, color='#F18F01')
+    axs[1, 1].set_title(f'Cumulative {value_col}', fontsize=12, fontweight='bold')
+    axs[1, 1].set_xlabel('Observation')
+    axs[1, 1].set_ylabel(f'Cumulative {value_col}')
+    axs[1, 1].grid(alpha=0.3)
+    
+    plt.tight_layout()
+    return fig
+
+
+def create_categorical_comparison_viz(results, cat_col, num_col, n_unique, agg_data=None, profile=None):
+    """Create comprehensive visualizations for categorical vs numeric data"""
+    # Aggregate data (unless the database already did)
+    if agg_data is None:
+        agg_data = results.groupby(cat_col)[num_col].agg(['sum', 'mean', 'count']).reset_index()
+        agg_data = agg_data.sort_values('sum', ascending=False)
+    
+    # Decide number of charts based on categories
+    if n_unique <= 6:
+        fig, axs = plt.subplots(2, 3, figsize=(18, 10))
+        axs = axs.flatten()
+    else:
+        fig, axs = plt.subplots(2, 2, figsize=(16, 10))
+        axs = axs.flatten()
+    
+    chart_idx = 0
+    
+    # 1. Bar chart (Sum)
+    axs[chart_idx].bar(agg_data[cat_col], agg_data['sum'], color='#4C72B0', edgecolor='black')
+    axs[chart_idx].set_title(f'Total {num_col} by {cat_col}', fontsize=12, fontweight='bold')
+    axs[chart_idx].set_xlabel(cat_col)
+    axs[chart_idx].set_ylabel(f'Total {num_col}')
+    axs[chart_idx].tick_params(axis='x', rotation=45)
+    axs[chart_idx].grid(alpha=0.3, axis='y')
+    chart_idx += 1
+    
+    # 2. Horizontal bar chart (for better readability with many categories)
+    axs[chart_idx].barh(agg_data[cat_col], agg_data['sum'], color='#55A630', edgecolor='black')
+    axs[chart_idx].set_title(f'Total {num_col} by {cat_col} (Horizontal)', fontsize=12, fontweight='bold')
+    axs[chart_idx].set_xlabel(f'Total {num_col}')
+    axs[chart_idx].set_ylabel(cat_col)
+    axs[chart_idx].grid(alpha=0.3, axis='x')
+    chart_idx += 1
+    
+    # 3. Pie chart (only if reasonable number of categories)
+    if n_unique <= 8:
+        colors = plt.cm.Set3(range(len(agg_data)))
+        axs[chart_idx].pie(agg_data['sum'], labels=agg_data[cat_col], autopct='%1.1f%%', 
+                          startangle=90, colors=colors)
+        axs[chart_idx].set_title(f'{num_col} Distribution by {cat_col}', fontsize=12, fontweight='bold')
+        chart_idx += 1
+    
+    # 4. Average comparison
+    axs[chart_idx].bar(agg_data[cat_col], agg_data['mean'], color='#F77F00', edgecolor='black')
+    axs[chart_idx].set_title(f'Average {num_col} by {cat_col}', fontsize=12, fontweight='bold')
+    axs[chart_idx].set_xlabel(cat_col)
+    axs[chart_idx].set_ylabel(f'Average {num_col}')
+    axs[chart_idx].tick_params(axis='x', rotation=45)
+    axs[chart_idx].axhline(agg_data['mean'].mean(), color='red', linestyle='--', label='Overall Mean')
+    axs[chart_idx].legend()
+    axs[chart_idx].grid(alpha=0.3, axis='y')
+    chart_idx += 1
+    
+    # 5. Count bar chart
+    if chart_idx < len(axs):
+        axs[chart_idx].bar(agg_data[cat_col], agg_data['count'], color='#C9184A', edgecolor='black')
+        axs[chart_idx].set_title(f'Count by {cat_col}', fontsize=12, fontweight='bold')
+        axs[chart_idx].set_xlabel(cat_col)
+        axs[chart_idx].set_ylabel('Count')
+        axs[chart_idx].tick_params(axis='x', rotation=45)
+        axs[chart_idx].grid(alpha=0.3, axis='y')
+        chart_idx += 1
+    
+    # 6. Line chart (showing trend)
+    if chart_idx < len(axs):
+        axs[chart_idx].plot(agg_data[cat_col], agg_data['sum'], marker='o', linewidth=2, 
+                           markersize=8, color='#9D4EDD')
+        axs[chart_idx].set_title(f'{num_col} Trend by {cat_col}', fontsize=12, fontweight='bold')
+        axs[chart_idx].set_xlabel(cat_col)
+        axs[chart_idx].set_ylabel(f'Total {num_col}')
+        axs[chart_idx].tick_params(axis='x', rotation=45)
+        axs[chart_idx].grid(alpha=0.3)
+        chart_idx += 1
+    
+    # Hide unused subplots
+    for idx in range(chart_idx, len(axs)):
+        axs[idx].axis('off')
+    
+    plt.tight_layout()
+    return fig
+
+
+def create_top_n_viz(results, cat_col, num_col, top_n=15, agg_data=None, total_sum=None, profile=None):
+    """Create visualizations for categories with many unique values (show top N)"""
+    if agg_data is None:
+        all_groups = results.groupby(cat_col)[num_col].sum().reset_index()
+        total_sum = all_groups[num_col].sum()
+        agg_data = all_groups.sort_values(num_col, ascending=False).head(top_n)
+    
+    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
+    
+    # 1. Bar chart (Top N)
+    axs[0, 0].bar(range(len(agg_data)), agg_data[num_col], color='#4C72B0', edgecolor='black')
+    axs[0, 0].set_title(f'Top {top_n} {cat_col} by {num_col}', fontsize=12, fontweight='bold')
+    axs[0, 0].set_xlabel(cat_col)
+    axs[0, 0].set_ylabel(num_col)
+    axs[0, 0].set_xticks(range(len(agg_data)))
+    axs[0, 0].set_xticklabels(agg_data[cat_col], rotation=45, ha='right')
+    axs[0, 0].grid(alpha=0.3, axis='y')
+    
+    # 2. Horizontal bar chart
+    axs[0, 1].barh(agg_data[cat_col], agg_data[num_col], color='#55A630', edgecolor='black')
+    axs[0, 1].set_title(f'Top {top_n} {cat_col} (Horizontal)', fontsize=12, fontweight='bold')
+    axs[0, 1].set_xlabel(num_col)
+    axs[0, 1].set_ylabel(cat_col)
+    axs[0, 1].invert_yaxis()
+    axs[0, 1].grid(alpha=0.3, axis='x')
+    
+    # 3. Pareto chart (cumulative percentage)
+    cumsum = agg_data[num_col].cumsum()
+    cumsum_pct = cumsum / agg_data[num_col].sum() * 100
+    
+    ax3 = axs[1, 0]
+    ax3_twin = ax3.twinx()
+    
+    ax3.bar(range(len(agg_data)), agg_data[num_col], color='#F77F00', alpha=0.7, edgecolor='black')
+    ax3_twin.plot(range(len(agg_data)), cumsum_pct, color='red', marker='D', linewidth=2, markersize=6)
+    ax3_twin.axhline(80, color='green', linestyle='--', label='80%')
+    
+    ax3.set_xlabel(cat_col)
+    ax3.set_ylabel(num_col, color='#F77F00')
+    ax3_twin.set_ylabel('Cumulative %', color='red')
+    ax3.set_title(f'Pareto Chart: Top {top_n} {cat_col}', fontsize=12, fontweight='bold')
+    ax3.set_xticks(range(len(agg_data)))
+    ax3.set_xticklabels(agg_data[cat_col], rotation=45, ha='right')
+    ax3_twin.legend(loc='center right')
+    ax3.grid(alpha=0.3, axis='y')
+    
+    # 4. Comparison with "Others"
+    top_sum = agg_data[num_col].sum()
+    others_sum = total_sum - top_sum
+    
+    labels = [f'Top {top_n}', 'Others']
+    sizes = [top_sum, others_sum]
+    colors = ['#4C72B0', '#CCCCCC']
+    
+    axs[1, 1].pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors)
+    axs[1, 1].set_title(f'Top {top_n} vs Others', fontsize=12, fontweight='bold')
+    
+    plt.tight_layout()
+    return fig
+
+
+def _top_categories(results, profile, col, n):
+    """The n most common values of col, from the profile where they round-trip"""
+    import pandas as pd
+
+    if pd.api.types.is_string_dtype(results[col]) and not pd.api.types.is_bool_dtype(results[col]):
+        top = top_values(profile, col, n)
+        if all(isinstance(value, str) for value, _ in top):
+            return pd.Series([count for _, count in top], index=[value for value, _ in top], dtype='int64')
+    return results[col].value_counts().head(n)
+
+
+def create_cross_tab_viz(results, cat_cols, crosstab=None, profile=None):
+    """Create cross-tabulation visualization for two categorical columns"""
+    cat1, cat2 = cat_cols[0], cat_cols[1]
+    
+    if crosstab is None:
+        # Limit categories for visualization
+        profile = profile_for(results, profile)
+        top_cat1 = _top_categories(results, profile, cat1, 10).index
+        top_cat2 = _top_categories(results, profile, cat2, 10).index
+        
+        filtered_results = results[results[cat1].isin(top_cat1) & results[cat2].isin(top_cat2)]
+        
+        import pandas as pd
+
+        crosstab = pd.crosstab(filtered_results[cat1], filtered_results[cat2])
+    
+    fig, axs = plt.subplots(1, 2, figsize=(16, 6))
+    
+    # Heatmap
+    im = axs[0].imshow(crosstab.values, cmap='YlOrRd', aspect='auto')
+    axs[0].set_xticks(range(len(crosstab.columns)))
+    axs[0].set_yticks(range(len(crosstab.index)))
+    axs[0].set_xticklabels(crosstab.columns, rotation=45, ha='right')
+    axs[0].set_yticklabels(crosstab.index)
+    axs[0].set_title(f'Cross-tabulation: {cat1} vs {cat2}', fontsize=12, fontweight='bold')
+    plt.colorbar(im, ax=axs[0])
+    
+    # Stacked bar chart
+    crosstab.plot(kind='bar', stacked=True, ax=axs[1], colormap='Set3', edgecolor='black')
+    axs[1].set_title(f'{cat1} by {cat2} (Stacked)', fontsize=12, fontweight='bold')
+    axs[1].set_xlabel(cat1)
+    axs[1].set_ylabel('Count')
+    axs[1].tick_params(axis='x', rotation=45)
+    axs[1].legend(title=cat2, bbox_to_anchor=(1.05, 1), loc='upper left')
+    axs[1].grid(alpha=0.3, axis='y')
+    
+    plt.tight_layout()
+    return fig
+
+
+def create_large_dataset_viz(results, numeric_cols, categorical_cols, profile=None):
+    """Create overview visualizations for large datasets"""
+    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
+    profile = profile_for(results, profile)
+    
+    # Sample data for visualization
+    sample_size = min(1000, len(results))
+    sample_data = results.sample(sample_size)
+    
+    # 1. Data overview
+    axs[0, 0].axis('off')
+    overview_text = f"""
+    📊 Dataset Overview
+    
+    Total Rows: {len(results):,}
+    Total Columns: {len(results.columns)}
+    Numeric Columns: {len(numeric_cols)}
+    Categorical Columns: {len(categorical_cols)}
+    
+    Sample Size: {sample_size:,} rows
+    """
+    axs[0, 0].text(0.1, 0.5, overview_text, fontsize=12, verticalalignment='center',
+                  bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.5))
+    
+    # 2. Numeric columns distribution (if available)
+    if numeric_cols:
+        col = numeric_cols[0]
+        axs[0, 1].hist(sample_data[col].dropna(), bins=30, color='#4C72B0', alpha=0.7, edgecolor='black')
+        axs[0, 1].set_title(f'Distribution of {col} (Sample)', fontsize=12, fontweight='bold')
+        axs[0, 1].set_xlabel(col)
+        axs[0, 1].set_ylabel('Frequency')
+        axs[0, 1].grid(alpha=0.3)
+    
+    # 3. Categorical distribution (if available)
+    if categorical_cols:
+        col = categorical_cols[0]
+        # Counted over every row by the profile, not just the sample
+        top_categories = _top_categories(results, profile, col, 15)
+        axs[1, 0].barh(range(len(top_categories)), top_categories.values, color='#55A630', edgecolor='black')
+        axs[1, 0].set_yticks(range(len(top_categories)))
+        axs[1, 0].set_yticklabels(top_categories.index)
+        axs[1, 0].set_title(f'Top Categories in {col}', fontsize=12, fontweight='bold')
+        axs[1, 0].set_xlabel('Count')
+        axs[1, 0].invert_yaxis()
+        axs[1, 0].grid(alpha=0.3, axis='x')
+    
+    # 4. Multi-column correlation (if multiple numeric columns)
+    if len(numeric_cols) >= 2:
+        cols_to_plot = numeric_cols[:min(5, len(numeric_cols))]
+        corr_matrix = correlation(profile, cols_to_plot)
+        if corr_matrix is None:
+            corr_matrix = sample_data[cols_to_plot].corr()
+        im = axs[1, 1].imshow(corr_matrix, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
+        axs[1, 1].set_xticks(range(len(cols_to_plot)))
+        axs[1, 1].set_yticks(range(len(cols_to_plot)))
+        axs[1, 1].set_xticklabels(cols_to_plot, rotation=45, ha='right')
+        axs[1, 1].set_yticklabels(cols_to_plot)
+        axs[1, 1].set_title('Correlation Matrix', fontsize=12, fontweight='bold')
+        plt.colorbar(im, ax=axs[1, 1])
+    
+    plt.tight_layout()
+    return fig
+
+
+CHART_BUILDERS = {
+    'single_numeric': create_single_numeric_viz,
+    'multi_numeric': create_multi_numeric_viz,
+    'time_series': create_time_series_viz,
+    'categorical_comparison': create_categorical_comparison_viz,
+    'top_n': create_top_n_viz,
+    'cross_tab': create_cross_tab_viz,
+    'large_dataset': create_large_dataset_viz,
+}
+
+
+def figure_to_png(fig, dpi=100):
+    """Render a matplotlib figure to PNG bytes and release it"""
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()